@@ -0,0 +1,564 @@
+"""
+Benchmark of regional-cfn-stack handler against in-process CloudFormation stand-in.
+
+Stack operations follow scripted, deterministic timelines of stack events, on
+simulated clock running --speedup times faster than real time, so operations
+lasting minutes are waited for in seconds. Handler is driven end to end, with
+its own lambda re-invocations and custom resource response. API latency and
+CloudFormation throttling are configurable. Reported metrics: simulated time
+to CloudFormation response, billed lambda milliseconds, number of lambda
+self-invocations and CloudFormation / S3 api calls per operation.
+
+Requirements (not packaged with lambda): boto3
+
+    python benchmarks/regional_stack_benchmark.py
+    python benchmarks/regional_stack_benchmark.py --scenarios create update-unchanged --output bench.jsonl
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+STACK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'regional-cfn-stack')
+ACCOUNT_ID = '123456789012'
+TEMPLATE_URL = 'https://benchmark-templates.s3.amazonaws.com/stack.json'
+STACK_NAME = 'benchmark-stack'
+REGIONS = ['us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'eu-west-1', 'eu-west-2', 'eu-central-1',
+           'ap-south-1', 'ap-southeast-1', 'ap-southeast-2', 'ap-northeast-1', 'ca-central-1', 'sa-east-1',
+           'eu-north-1', 'eu-west-3']
+# describe_stack_events page size of CloudFormation
+EVENTS_PAGE_SIZE = 100
+# delay between asynchronous lambda invoke and start of invoked execution
+INVOKE_DELAY_SECONDS = 0.5
+# attempts of throttled call, like default (legacy) botocore retry mode
+MAX_ATTEMPTS = 5
+MAX_INVOCATIONS = 100
+
+# name -> scenario. Resources and Duration describe timeline of stack operation, Exists creates
+# stack before request, Unchanged deploys it with template and parameters of request
+SCENARIOS = {
+    'create': {'RequestType': 'Create', 'Resources': 20, 'Duration': 180},
+    'create-long': {'RequestType': 'Create', 'Resources': 300, 'Duration': 1500},
+    'create-throttled': {'RequestType': 'Create', 'Resources': 20, 'Duration': 180, 'ThrottleRps': 1},
+    'update': {'RequestType': 'Update', 'Resources': 20, 'Duration': 120, 'Exists': True},
+    'update-unchanged': {'RequestType': 'Update', 'Resources': 20, 'Duration': 120, 'Exists': True,
+                         'Unchanged': True},
+    # handler creates stacks with OnFailure=DELETE by default, failed stack is deleted after rollback
+    'create-nested-failure': {'RequestType': 'Create', 'Resources': 250, 'Duration': 300, 'Fail': True},
+    'update-nested-failure': {'RequestType': 'Update', 'Resources': 250, 'Duration': 300, 'Exists': True,
+                              'Fail': True},
+    'delete': {'RequestType': 'Delete', 'Resources': 20, 'Duration': 90, 'Exists': True},
+    'create-fan-out': {'RequestType': 'Create', 'Resources': 20, 'Duration': 180, 'Regions': 10,
+                       'MaxConcurrentRegions': 5},
+}
+
+
+class SimulatedClock:
+    """Clock running speedup times faster than real time, stands in for time module of handler modules"""
+
+    def __init__(self, speedup):
+        self.speedup = speedup
+        self.started = time.time()
+
+    def time(self):
+        return (time.time() - self.started) * self.speedup
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.speedup)
+
+
+class BenchmarkContext:
+    """Lambda context stand-in, on simulated clock"""
+
+    def __init__(self, clock, timeout_seconds):
+        self.clock = clock
+        self.aws_request_id = f"benchmark-{os.getpid()}"
+        self.memory_limit_in_mb = 128
+        self.deadline = clock.time() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - self.clock.time()) * 1000)
+
+
+class ApiCounter:
+    """Counts api calls per service and operation, and throttled attempts"""
+
+    def __init__(self):
+        self.counts = {}
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def count(self, operation):
+        with self.lock:
+            self.counts[operation] = self.counts.get(operation, 0) + 1
+
+    def count_throttled(self):
+        with self.lock:
+            self.throttled += 1
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+            self.throttled = 0
+
+
+class TokenBucket:
+    """Requests allowed per simulated second, with burst of one second worth of requests"""
+
+    def __init__(self, clock, rate):
+        self.clock = clock
+        self.rate = rate
+        self.tokens = rate
+        self.updated = clock.time()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = self.clock.time()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def timeline(rnd, stack_name, operation, resources, duration, fail=False, on_failure='ROLLBACK'):
+    """
+    Scripted events of stack operation, as (offset seconds, logical id, resource type, status, reason).
+    Resources are processed in overlapping waves. Failed operations fail nested stack in the middle
+    of operation, cancel resources in progress and roll back completed ones. Failed create of stack
+    with OnFailure=DELETE is followed by deletion of stack
+    """
+    prefix = {'create': 'CREATE', 'update': 'UPDATE', 'delete': 'DELETE'}[operation]
+    verb = {'create': 'created', 'update': 'updated', 'delete': 'deleted'}[operation]
+    events = [(0, stack_name, 'AWS::CloudFormation::Stack', f"{prefix}_IN_PROGRESS", 'User Initiated')]
+    work = []
+    for index in range(resources):
+        start = duration * 0.9 * index / max(1, resources)
+        end = start + duration * 0.1 * rnd.random()
+        work.append((start, end, f"Resource{index}", 'AWS::SNS::Topic'))
+    fail_at = None
+    if fail:
+        start, end, logical_id, resource_type = work[resources // 2]
+        work[resources // 2] = (start, end, 'NestedStack', 'AWS::CloudFormation::Stack')
+        fail_at = end
+    completed = []
+    for start, end, logical_id, resource_type in work:
+        if fail_at is not None and start > fail_at:
+            break
+        events.append((start, logical_id, resource_type, f"{prefix}_IN_PROGRESS", ''))
+        if logical_id == 'NestedStack' and fail_at is not None:
+            events.append((end, logical_id, resource_type, f"{prefix}_FAILED",
+                           f"Embedded stack was not successfully {verb}"))
+        elif fail_at is not None and end > fail_at:
+            events.append((fail_at + 1, logical_id, resource_type, f"{prefix}_FAILED",
+                           f"Resource {operation} cancelled"))
+        else:
+            events.append((end, logical_id, resource_type, f"{prefix}_COMPLETE", ''))
+            completed.append((logical_id, resource_type))
+    if fail_at is None:
+        events.append((duration, stack_name, 'AWS::CloudFormation::Stack', f"{prefix}_COMPLETE", ''))
+        return sorted(events, key=lambda x: x[0])
+    # rollback of create deletes created resources, rollback of update updates them back
+    rollback = 'ROLLBACK' if operation == 'create' else f"{prefix}_ROLLBACK"
+    rollback_status = 'DELETE' if operation == 'create' else prefix
+    events.append((fail_at + 2, stack_name, 'AWS::CloudFormation::Stack', f"{rollback}_IN_PROGRESS",
+                   f"The following resource(s) failed to {operation}: [NestedStack]"))
+    rollback_duration = duration / 2
+    for index, (logical_id, resource_type) in enumerate(completed):
+        offset = fail_at + 3 + rollback_duration * index / max(1, len(completed))
+        events.append((offset, logical_id, resource_type, f"{rollback_status}_IN_PROGRESS", ''))
+        events.append((offset + 1, logical_id, resource_type, f"{rollback_status}_COMPLETE", ''))
+    rolled_back = fail_at + 4 + rollback_duration
+    events.append((rolled_back, stack_name, 'AWS::CloudFormation::Stack', f"{rollback}_COMPLETE", ''))
+    if operation == 'create' and on_failure == 'DELETE':
+        events.append((rolled_back, stack_name, 'AWS::CloudFormation::Stack', 'DELETE_IN_PROGRESS', 'User Initiated'))
+        events.append((rolled_back + 2, stack_name, 'AWS::CloudFormation::Stack', 'DELETE_COMPLETE', ''))
+    return sorted(events, key=lambda x: x[0])
+
+
+class SimulatedStack:
+    """Stack of CloudFormation stand-in, its events become visible as simulated clock reaches them"""
+
+    def __init__(self, region, name, index):
+        self.name = name
+        self.stack_id = f"arn:aws:cloudformation:{region}:{ACCOUNT_ID}:stack/{name}/{index:08d}"
+        self.events = []
+        self.template_url = None
+        self.parameters = None
+        self.capabilities = None
+        self.tags = []
+
+    def add_events(self, started, scripted, nested_stacks):
+        for offset, logical_id, resource_type, status, reason in scripted:
+            is_stack = logical_id == self.name
+            physical_id = self.stack_id if is_stack else nested_stacks.get(logical_id, f"{logical_id}-physical")
+            self.events.append({
+                'EventId': f"{self.stack_id}-{len(self.events)}",
+                'StackId': self.stack_id,
+                'StackName': self.name,
+                'LogicalResourceId': logical_id,
+                'PhysicalResourceId': physical_id,
+                'ResourceType': resource_type,
+                'ResourceStatus': status,
+                'ResourceStatusReason': reason,
+                'Time': started + offset,
+            })
+        self.events.sort(key=lambda x: x['Time'])
+
+    def visible_events(self, now):
+        return [x for x in self.events if x['Time'] <= now]
+
+    def status(self, now):
+        statuses = [x['ResourceStatus'] for x in self.visible_events(now) if x['PhysicalResourceId'] == self.stack_id]
+        return statuses[-1] if len(statuses) > 0 else None
+
+
+class CloudFormationStandIn:
+    """CloudFormation of all regions, shared by clients of every region"""
+
+    def __init__(self, clock, counter, args, scenario):
+        self.clock = clock
+        self.counter = counter
+        self.args = args
+        self.scenario = scenario
+        self.rnd = random.Random(42)
+        self.stacks = {}
+        self.lock = threading.Lock()
+        rate = scenario.get('ThrottleRps', args.throttle_rps)
+        self.buckets = {}
+        self.rate = rate
+
+    def call(self, region, operation, fn):
+        # latency of every attempt, throttled attempts are retried with exponential backoff like botocore does
+        for attempt in range(MAX_ATTEMPTS):
+            self.clock.sleep(self.args.latency_ms / 1000)
+            if self.allowed(region):
+                self.counter.count(f"cloudformation.{operation}")
+                with self.lock:
+                    return fn()
+            self.counter.count_throttled()
+            self.clock.sleep(random.random() * (2 ** attempt))
+        from botocore.exceptions import ClientError
+        raise ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, operation)
+
+    def allowed(self, region):
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            if region not in self.buckets:
+                self.buckets[region] = TokenBucket(self.clock, self.rate)
+        return self.buckets[region].take()
+
+    def new_stack(self, region, name):
+        stack = SimulatedStack(region, name, len(self.stacks))
+        self.stacks[(region, name)] = stack
+        return stack
+
+    def find(self, region, name):
+        now = self.clock.time()
+        for (stack_region, stack_name), stack in self.stacks.items():
+            if stack_region == region and (stack_name == name or stack.stack_id == name):
+                if stack.stack_id == name or stack.status(now) != 'DELETE_COMPLETE':
+                    return stack
+        from botocore.exceptions import ClientError
+        raise ClientError({'Error': {'Code': 'ValidationError', 'Message': f"Stack with id {name} does not exist"}},
+                          'DescribeStacks')
+
+    # Schedule events of stack operation, failing it if scenario says so. Stacks existing before
+    # request are created without failures
+    def start_operation(self, region, stack, operation, started=None, fail=False, on_failure='ROLLBACK'):
+        started = self.clock.time() if started is None else started
+        nested_stacks = {}
+        if fail:
+            nested = self.new_stack(region, f"{stack.name}-NestedStack")
+            nested_stacks['NestedStack'] = nested.stack_id
+            if operation == 'update':
+                nested.add_events(started, timeline(self.rnd, nested.name, 'create', 0, 1), {})
+            nested.add_events(started + 1, self.nested_failure_timeline(nested.name, operation), {})
+        stack.add_events(started, timeline(self.rnd, stack.name, operation, self.scenario['Resources'],
+                                           self.scenario['Duration'], fail, on_failure), nested_stacks)
+
+    def nested_failure_timeline(self, name, operation):
+        prefix = operation.upper()
+        rollback = 'ROLLBACK' if operation == 'create' else f"{prefix}_ROLLBACK"
+        return [
+            (0, name, 'AWS::CloudFormation::Stack', f"{prefix}_IN_PROGRESS", ''),
+            (5, 'Bucket', 'AWS::S3::Bucket', f"{prefix}_IN_PROGRESS", ''),
+            (20, 'Bucket', 'AWS::S3::Bucket', f"{prefix}_FAILED", 'benchmark-bucket already exists'),
+            (21, 'Queue', 'AWS::SQS::Queue', f"{prefix}_FAILED", f"Resource {operation} cancelled"),
+            (22, name, 'AWS::CloudFormation::Stack', f"{rollback}_IN_PROGRESS",
+             f"The following resource(s) failed to {operation}: [Bucket]"),
+            (30, name, 'AWS::CloudFormation::Stack', f"{rollback}_COMPLETE", ''),
+        ]
+
+
+class CloudFormationClient:
+    """boto3 cloudformation client stand-in of single region"""
+
+    def __init__(self, cloudformation, region):
+        self.cloudformation = cloudformation
+        self.region = region
+
+    def create_stack(self, StackName, TemplateURL, Parameters, Capabilities, OnFailure, Tags=None):
+        def create():
+            stack = self.cloudformation.new_stack(self.region, StackName)
+            stack.template_url, stack.parameters, stack.capabilities = TemplateURL, Parameters, Capabilities
+            stack.tags = Tags or []
+            self.cloudformation.start_operation(self.region, stack, 'create',
+                                                fail=self.cloudformation.scenario.get('Fail', False),
+                                                on_failure=OnFailure)
+            return {'StackId': stack.stack_id}
+        return self.cloudformation.call(self.region, 'CreateStack', create)
+
+    def update_stack(self, StackName, TemplateURL, Parameters, Capabilities, Tags=None):
+        def update():
+            stack = self.cloudformation.find(self.region, StackName)
+            tags = stack.tags if Tags is None else Tags
+            if (stack.template_url, stack.parameters, stack.capabilities, stack.tags) == \
+                    (TemplateURL, Parameters, Capabilities, tags):
+                from botocore.exceptions import ClientError
+                raise ClientError({'Error': {'Code': 'ValidationError', 'Message': 'No updates are to be performed.'}},
+                                  'UpdateStack')
+            stack.template_url, stack.parameters, stack.capabilities, stack.tags = \
+                TemplateURL, Parameters, Capabilities, tags
+            self.cloudformation.start_operation(self.region, stack, 'update',
+                                                fail=self.cloudformation.scenario.get('Fail', False))
+            return {'StackId': stack.stack_id}
+        return self.cloudformation.call(self.region, 'UpdateStack', update)
+
+    def delete_stack(self, StackName):
+        def delete():
+            stack = self.cloudformation.find(self.region, StackName)
+            self.cloudformation.start_operation(self.region, stack, 'delete')
+            return {}
+        return self.cloudformation.call(self.region, 'DeleteStack', delete)
+
+    def describe_stacks(self, StackName):
+        def describe():
+            stack = self.cloudformation.find(self.region, StackName)
+            return {'Stacks': [{
+                'StackId': stack.stack_id,
+                'StackName': stack.name,
+                'StackStatus': stack.status(self.cloudformation.clock.time()),
+                'Tags': stack.tags,
+            }]}
+        return self.cloudformation.call(self.region, 'DescribeStacks', describe)
+
+    def describe_stack_events(self, StackName, NextToken=None):
+        def describe():
+            from datetime import datetime, timezone
+            stack = self.cloudformation.find(self.region, StackName)
+            # newest first, timestamps of simulated clock
+            events = list(reversed(stack.visible_events(self.cloudformation.clock.time())))
+            start = int(NextToken or 0)
+            page = []
+            for event in events[start:start + EVENTS_PAGE_SIZE]:
+                event = dict(event)
+                event['Timestamp'] = datetime.fromtimestamp(event.pop('Time') + 1700000000, timezone.utc)
+                page.append(event)
+            resp = {'StackEvents': page}
+            if start + EVENTS_PAGE_SIZE < len(events):
+                resp['NextToken'] = str(start + EVENTS_PAGE_SIZE)
+            return resp
+        return self.cloudformation.call(self.region, 'DescribeStackEvents', describe)
+
+
+class S3Client:
+    """boto3 s3 client stand-in, serving ETag of stack template"""
+
+    def __init__(self, clock, counter, args):
+        self.clock = clock
+        self.counter = counter
+        self.args = args
+
+    def head_object(self, Bucket, Key, VersionId=None):
+        self.clock.sleep(self.args.latency_ms / 1000)
+        self.counter.count('s3.HeadObject')
+        return {'ETag': '"benchmark-template-etag"', 'ContentLength': 1024}
+
+
+class LambdaClient:
+    """boto3 lambda client stand-in, queuing asynchronous invocations of function itself"""
+
+    def __init__(self, counter, invocations):
+        self.counter = counter
+        self.invocations = invocations
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.counter.count('lambda.Invoke')
+        self.invocations.append(json.loads(bytes(Payload).decode('utf-8')))
+        return {'StatusCode': 202}
+
+
+def request_payload(scenario):
+    properties = {
+        'ServiceToken': 'arn:aws:lambda:us-east-1:123456789012:function:regional-cfn-stack',
+        'StackName': STACK_NAME,
+        'TemplateUrl': TEMPLATE_URL,
+        'Capabilities': 'CAPABILITY_IAM',
+        'StackParam_Environment': 'benchmark',
+    }
+    if 'Regions' in scenario:
+        properties['Regions'] = ','.join(REGIONS[:scenario['Regions']])
+        properties['MaxConcurrentRegions'] = str(scenario.get('MaxConcurrentRegions', scenario['Regions']))
+    else:
+        properties['Region'] = REGIONS[0]
+    payload = {
+        'RequestType': scenario['RequestType'],
+        'ResponseURL': 'https://cloudformation-custom-resource-response.example.com/benchmark',
+        'StackId': f"arn:aws:cloudformation:us-east-1:{ACCOUNT_ID}:stack/parent/00000000",
+        'RequestId': f"benchmark-{os.getpid()}",
+        'LogicalResourceId': 'RegionalStack',
+        'ResourceType': 'Custom::RegionalStack',
+        'ResourceProperties': properties,
+    }
+    if scenario['RequestType'] != 'Create':
+        payload['OldResourceProperties'] = dict(properties)
+    return payload
+
+
+def existing_stack(cloudformation, stack_manage, payload, scenario):
+    """Deploy stack before request, an hour earlier, returns its id"""
+    properties = payload['ResourceProperties']
+    region = properties.get('Region', REGIONS[0])
+    stack = cloudformation.new_stack(region, STACK_NAME)
+    stack.template_url = TEMPLATE_URL
+    stack.capabilities = properties['Capabilities'].split(',')
+    stack.parameters = [{'ParameterKey': 'Environment', 'ParameterValue': 'benchmark'}]
+    if not scenario.get('Unchanged', False):
+        stack.parameters = [{'ParameterKey': 'Environment', 'ParameterValue': 'previous'}]
+    params = dict(map(lambda x: (x['ParameterKey'], x['ParameterValue']), stack.parameters))
+    fingerprint = stack_manage.StackManagement().fingerprint(TEMPLATE_URL, params, stack.capabilities)
+    stack.tags = [{'Key': stack_manage.FINGERPRINT_TAG, 'Value': fingerprint}]
+    cloudformation.start_operation(region, stack, 'create', started=cloudformation.clock.time() - 3600)
+    return stack.stack_id
+
+
+def run_scenario(name, args):
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('LAMBDA_TASK_ROOT', STACK_DIR)
+    os.environ.setdefault('AWS_LAMBDA_FUNCTION_NAME', 'regional-cfn-stack-benchmark')
+    sys.path.append(STACK_DIR)
+
+    import boto3
+    import cr_response
+    import handler
+    import stack_manage
+    import region_fan_out
+
+    scenario = SCENARIOS[name]
+    clock = SimulatedClock(args.speedup)
+    counter = ApiCounter()
+    invocations = []
+    responses = []
+    cloudformation = CloudFormationStandIn(clock, counter, args, scenario)
+    s3 = S3Client(clock, counter, args)
+    lambda_client = LambdaClient(counter, invocations)
+
+    def client(service, region_name=None, **kwargs):
+        if service == 'cloudformation':
+            return CloudFormationClient(cloudformation, region_name or os.environ['AWS_DEFAULT_REGION'])
+        if service == 's3':
+            return s3
+        if service == 'lambda':
+            return lambda_client
+        raise Exception(f"No stand-in for {service} client")
+
+    def respond(request):
+        responses.append((clock.time(), json.loads(request.data.decode('utf-8'))))
+
+    boto3.client = client
+    cr_response.urlopen = respond
+    stack_manage.time = clock
+    region_fan_out.time = clock
+
+    payload = request_payload(scenario)
+    output = io.StringIO()
+    with redirect_stdout(output):
+        if scenario.get('Exists', False):
+            payload['PhysicalResourceId'] = existing_stack(cloudformation, stack_manage, payload, scenario)
+        counter.reset()
+        invocations.append(payload)
+        started = clock.time()
+        billed_ms = 0
+        count = 0
+        while len(invocations) > 0 and count < MAX_INVOCATIONS:
+            event = invocations.pop(0)
+            if count > 0:
+                clock.sleep(INVOKE_DELAY_SECONDS)
+            count += 1
+            invocation_started = clock.time()
+            try:
+                handler.lambda_handler(event, BenchmarkContext(clock, args.timeout))
+            except Exception as e:
+                print(f"Invocation failed: {e}")
+            billed_ms += math.ceil((clock.time() - invocation_started) * 1000)
+
+    response_time, response = responses[0] if len(responses) > 0 else (None, {})
+    return {
+        'scenario': name,
+        'request_type': scenario['RequestType'],
+        'regions': scenario.get('Regions', 1),
+        'status': response.get('Status'),
+        'reason': response.get('Reason', ''),
+        'responses': len(responses),
+        'response_seconds': round(response_time - started, 1) if response_time is not None else None,
+        'billed_ms': billed_ms,
+        'invocations': count,
+        'self_invocations': count - 1,
+        'api_calls': sum(counter.counts.values()),
+        'api_calls_by_operation': counter.counts,
+        'throttled_attempts': counter.throttled,
+        'latency_ms': args.latency_ms,
+        'speedup': args.speedup,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=STACK_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark regional-cfn-stack handler against CloudFormation stand-in')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS.keys()), default=list(SCENARIOS.keys()))
+    parser.add_argument('--latency-ms', type=float, default=100, help='Latency of every api call')
+    parser.add_argument('--throttle-rps', type=float, default=0,
+                        help='CloudFormation requests per second allowed per region, 0 for no throttling')
+    parser.add_argument('--timeout', type=int, default=300, help='Lambda timeout in seconds')
+    parser.add_argument('--speedup', type=float, default=100, help='Simulated seconds per real second')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', help='Append json results to this file')
+    args = parser.parse_args()
+
+    revision = git_revision()
+    print(f"{'scenario':24} {'status':>8} {'response s':>11} {'billed ms':>10} {'self-invokes':>13} {'api calls':>10}")
+    for name in args.scenarios:
+        for run in range(args.repeat):
+            # fresh process per scenario, as boto3 and handler modules are patched with stand-ins
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_scenario, name, args).result()
+            result['revision'] = revision
+            result['run'] = run
+            print(f"{name:24} {str(result['status']):>8} {str(result['response_seconds']):>11} "
+                  f"{result['billed_ms']:>10} {result['self_invocations']:>13} {result['api_calls']:>10}")
+            if args.output:
+                with open(args.output, 'a') as output:
+                    output.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
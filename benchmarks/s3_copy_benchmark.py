@@ -0,0 +1,278 @@
+"""
+Benchmark of s3-copy S3CopyLogic against local S3 emulator (moto server).
+
+Every scenario runs against fresh emulator on freshly generated, deterministic
+synthetic data, so results are comparable across commits. Emulator and data
+generation stay in benchmark process, while copy runs in spawned process of its
+own, so its peak RSS is that of copy alone, as in lambda. Reported metrics:
+objects/sec, MB/sec, peak RSS, peak /tmp usage and S3 requests per operation.
+
+Requirements (not packaged with lambda): boto3, moto[server], python-magic
+
+    python benchmarks/s3_copy_benchmark.py
+    python benchmarks/s3_copy_benchmark.py --scenarios sync-small-files --output bench.jsonl
+"""
+import argparse
+import io
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+S3_COPY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 's3-copy')
+SOURCE_BUCKET = 'benchmark-source'
+DESTINATION_BUCKET = 'benchmark-destination'
+MB = 1024 * 1024
+
+# name -> (copy type, copy mode, data set)
+SCENARIOS = {
+    'sync-small-files': ('sync', 'download', 'small-files'),
+    'sync-small-files-server-side': ('sync', 'server-side', 'small-files'),
+    'sync-huge-files': ('sync', 'download', 'huge-files'),
+    'sync-huge-files-server-side': ('sync', 'server-side', 'huge-files'),
+    'object-huge': ('object', 'download', 'huge-object'),
+    'object-huge-server-side': ('object', 'server-side', 'huge-object'),
+    'object-zip-deep': ('object-zip', 'download', 'deep-zip'),
+    'object-zip-deep-stream': ('object-zip', 'stream', 'deep-zip'),
+    'sync-small-files-auto': ('sync', 'auto', 'small-files'),
+    'object-huge-auto': ('object', 'auto', 'huge-object'),
+    'object-zip-deep-auto': ('object-zip', 'auto', 'deep-zip'),
+}
+
+
+class BenchmarkContext:
+    """Lambda context stand-in, with 15 minutes of execution time"""
+
+    def __init__(self):
+        self.aws_request_id = f"benchmark-{os.getpid()}"
+        self.memory_limit_in_mb = 1024
+        self.deadline = time.time() + 900
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.time()) * 1000)
+
+
+class RequestCounter:
+    """Counts S3 api calls per operation, through botocore event hooks of default session"""
+
+    def __init__(self, session):
+        self.counts = {}
+        self.lock = threading.Lock()
+        session.events.register('before-call.s3', self.count)
+
+    def count(self, model, **kwargs):
+        with self.lock:
+            self.counts[model.name] = self.counts.get(model.name, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+
+
+class DiskSampler(threading.Thread):
+    """Samples size of directory tree in background thread, recording the peak"""
+
+    def __init__(self, path, interval=0.05):
+        super().__init__(daemon=True)
+        self.path = path
+        self.interval = interval
+        self.peak = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            self.peak = max(self.peak, directory_size(self.path))
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        self.join()
+        self.peak = max(self.peak, directory_size(self.path))
+
+
+def directory_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def current_rss_mb():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize() / MB
+
+
+def peak_rss_mb():
+    """
+    High-water mark of resident memory of this process image. Unlike ru_maxrss, it is not carried
+    over from parent forking the process, nor across exec
+    """
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def generate_data(client, data_set, args):
+    """Upload synthetic source data, returns (source parameter, number of objects, bytes)"""
+    rnd = random.Random(42)
+    if data_set == 'small-files':
+        total = 0
+        for index in range(args.small_files):
+            size = rnd.randint(512, 16 * 1024)
+            depth = '/'.join(f"d{rnd.randint(0, 9)}" for _ in range(rnd.randint(0, 3)))
+            key = f"small/{depth}/file-{index}.txt".replace('//', '/')
+            client.put_object(Bucket=SOURCE_BUCKET, Key=key, Body=rnd.getrandbits(size * 8).to_bytes(size, 'little'))
+            total += size
+        return {'Bucket': SOURCE_BUCKET, 'Prefix': 'small/'}, args.small_files, total
+    if data_set == 'huge-files':
+        size = args.huge_size_mb * MB
+        for index in range(args.huge_files):
+            client.put_object(Bucket=SOURCE_BUCKET, Key=f"huge/file-{index}.bin", Body=os.urandom(size))
+        return {'Bucket': SOURCE_BUCKET, 'Prefix': 'huge/'}, args.huge_files, args.huge_files * size
+    if data_set == 'huge-object':
+        size = args.huge_size_mb * MB
+        client.put_object(Bucket=SOURCE_BUCKET, Key='huge/object.bin', Body=os.urandom(size))
+        return {'Bucket': SOURCE_BUCKET, 'Key': 'huge/object.bin'}, 1, size
+    if data_set == 'deep-zip':
+        buffer = io.BytesIO()
+        total = 0
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for index in range(args.zip_members):
+                depth = '/'.join(f"level{level}" for level in range(rnd.randint(1, args.zip_depth)))
+                # half random, half repetitive content, so members are deflated to varying ratios
+                size = rnd.randint(1024, 64 * 1024)
+                content = os.urandom(size // 2) + b'benchmark ' * (size // 20)
+                archive.writestr(f"{depth}/member-{index}.txt", content)
+                total += len(content)
+        client.put_object(Bucket=SOURCE_BUCKET, Key='archive/deep.zip', Body=buffer.getvalue())
+        return {'Bucket': SOURCE_BUCKET, 'Key': 'archive/deep.zip'}, args.zip_members, total
+    raise Exception(f"Unknown data set {data_set}")
+
+
+def start_emulator():
+    """Starts moto server on free local port, clients pick its url up from AWS_ENDPOINT_URL"""
+    from moto.server import ThreadedMotoServer
+    # request log of emulator would bury results
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    os.environ['AWS_ENDPOINT_URL'] = f"http://{host}:{port}"
+    return server
+
+
+def prepare_scenario(name, args):
+    """Create buckets and source data of scenario in emulator, returns (source parameter, number of objects, bytes)"""
+    import boto3
+    client = boto3.client('s3')
+    client.create_bucket(Bucket=SOURCE_BUCKET)
+    client.create_bucket(Bucket=DESTINATION_BUCKET)
+    return generate_data(client, SCENARIOS[name][2], args)
+
+
+def run_scenario(name, src, objects, total_bytes, args):
+    """Runs copy of scenario, in process of its own which imports nothing but copy logic"""
+    os.environ.setdefault('LAMBDA_TASK_ROOT', S3_COPY_DIR)
+    sys.path.append(S3_COPY_DIR)
+
+    import boto3
+    import logic
+
+    copy_type, copy_mode = SCENARIOS[name][:2]
+    boto3.setup_default_session()
+    counter = RequestCounter(boto3.DEFAULT_SESSION)
+    context = BenchmarkContext()
+    copy_logic = logic.S3CopyLogic(context, type=copy_type, src=src,
+                                   dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'benchmark'},
+                                   canned_acl=None, concurrency=args.concurrency, copy_mode=copy_mode)
+    rss_before = current_rss_mb()
+    sampler = DiskSampler(copy_logic.local_download_path)
+    sampler.start()
+    started = time.time()
+    copy_logic.copy()
+    elapsed = time.time() - started
+    sampler.stop()
+
+    return {
+        'scenario': name,
+        'type': copy_type,
+        'copy_mode': copy_mode,
+        'objects': objects,
+        'mb': round(total_bytes / MB, 2),
+        'seconds': round(elapsed, 3),
+        'objects_per_sec': round(objects / elapsed, 1),
+        'mb_per_sec': round(total_bytes / MB / elapsed, 2),
+        'rss_before_mb': round(rss_before, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'peak_tmp_mb': round(sampler.peak / MB, 2),
+        's3_requests': sum(counter.counts.values()),
+        's3_requests_by_operation': counter.counts,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=S3_COPY_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def run_isolated(name, args):
+    server = start_emulator()
+    try:
+        src, objects, total_bytes = prepare_scenario(name, args)
+        # spawned rather than forked process, so it does not share pages of emulator and generated data
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            return executor.submit(run_scenario, name, src, objects, total_bytes, args).result()
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark s3-copy logic against local S3 emulator')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS.keys()), default=list(SCENARIOS.keys()))
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--small-files', type=int, default=2000)
+    parser.add_argument('--huge-files', type=int, default=3)
+    parser.add_argument('--huge-size-mb', type=int, default=64)
+    parser.add_argument('--zip-members', type=int, default=2000)
+    parser.add_argument('--zip-depth', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', help='Append json results to this file')
+    args = parser.parse_args()
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+    revision = git_revision()
+    print(f"{'scenario':32} {'objects/s':>10} {'MB/s':>8} {'peak RSS MB':>12} {'peak /tmp MB':>13} {'requests':>9}")
+    for name in args.scenarios:
+        for run in range(args.repeat):
+            # fresh emulator and copy process per run, so peak RSS and emulator state are not shared
+            result = run_isolated(name, args)
+            result['revision'] = revision
+            result['run'] = run
+            print(f"{name:32} {result['objects_per_sec']:>10} {result['mb_per_sec']:>8} "
+                  f"{result['peak_rss_mb']:>12} {result['peak_tmp_mb']:>13} {result['s3_requests']:>9}")
+            if args.output:
+                with open(args.output, 'a') as output:
+                    output.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
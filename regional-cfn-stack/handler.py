@@ -1,4 +1,3 @@
-import boto3
 import json
 import os
 import sys
@@ -9,6 +8,7 @@ sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 import cr_response
 import stack_manage
 import lambda_invoker
+import region_fan_out
 import traceback
 
 create_stack_success_states = ['CREATE_COMPLETE']
@@ -24,6 +24,12 @@ create_stack_failure_states = ['CREATE_FAILED',
 update_stack_failure_states = ['CREATE_FAILED', 'DELETE_FAILED', 'UPDATE_FAILED', 'ROLLBACK_COMPLETE','UPDATE_ROLLBACK_COMPLETE']
 delete_stack_failure_states = ['DELETE_FAILED']
 
+fan_out_operation_states = {
+    region_fan_out.OPERATION_CREATE: (create_stack_success_states, create_stack_failure_states),
+    region_fan_out.OPERATION_UPDATE: (update_stack_success_states, update_stack_failure_states),
+    region_fan_out.OPERATION_DELETE: (delete_stack_success_states, delete_stack_failure_states)
+}
+
 
 def respond_disabled_region(region, payload):
     cfn_response = cr_response.CustomResourceResponse(payload)
@@ -33,25 +39,123 @@ def respond_disabled_region(region, payload):
     return
 
 
-def create_update_stack(cmd, payload):
-    if 'Capabilities' not in payload['ResourceProperties']:
-        payload['ResourceProperties']['Capabilities'] = 'CAPABILITY_IAM'
-    
-    # compile stack parameters
+def respond_failed(payload, e):
+    print(f"Exception:{e}\n{str(e)}")
+    print(traceback.format_exc())
+    cfn_response = cr_response.CustomResourceResponse(payload)
+    if 'PhysicalResourceId' in payload:
+        cfn_response.response['PhysicalResourceId'] = payload['PhysicalResourceId']
+    cfn_response.response['Status'] = 'FAILED'
+    cfn_response.response['Reason'] = str(e)
+    cfn_response.respond()
+
+
+def stack_parameters(payload):
     stack_params = {}
     for key, value in payload['ResourceProperties'].items():
         if key.startswith('StackParam_'):
             param_key = key.replace('StackParam_', '')
             param_value = value
             stack_params[param_key] = param_value
+    return stack_params
+
+
+def template_changed(payload):
+    """Whether update request points stack to other template url than it was deployed with"""
+    if 'OldResourceProperties' not in payload:
+        return False
+    return payload['OldResourceProperties'].get('TemplateUrl') != payload['ResourceProperties'].get('TemplateUrl')
+
+
+def split_regions(regions):
+    return [x.strip() for x in regions.split(',') if x.strip() != '']
+
+
+def fan_out_plan(payload):
+    """
+    Operation of every region for request. Stack is deployed to enabled regions out of Regions,
+    and deleted from regions removed from the list (or no longer enabled) by update
     
-    # instantiate and use management handler
-    manage = stack_manage.StackManagement()
+    :param payload:
+    :return:
+    """
+    properties = payload['ResourceProperties']
+    regions = split_regions(properties['Regions'])
+    if payload['RequestType'] == 'Delete':
+        return region_fan_out.plan(regions, region_fan_out.OPERATION_DELETE)
+    
+    if 'EnabledRegions' in properties:
+        enabled_regions = split_regions(properties['EnabledRegions'])
+        print(f"EnabledRegions: {enabled_regions}. Regions={regions}")
+        regions = [x for x in regions if x in enabled_regions]
+    region_states = region_fan_out.plan(regions, region_fan_out.OPERATION_DEPLOY)
+    if payload['RequestType'] == 'Update':
+        old_regions = split_regions(payload.get('OldResourceProperties', {}).get('Regions', ''))
+        removed_regions = [x for x in old_regions if x not in regions]
+        region_states += region_fan_out.plan(removed_regions, region_fan_out.OPERATION_DELETE)
+    return region_states
+
+
+def fan_out_stack(payload, lambda_context):
+    """
+    Create, update or delete stack in all regions listed in Regions property at once. Region states
+    are kept in payload, and lambda is re-invoked with them if it is running out of time
+    
+    :param payload:
+    :param lambda_context:
+    :return:
+    """
+    properties = payload['ResourceProperties']
+    if payload['RequestType'] != 'Delete':
+        payload['PhysicalResourceId'] = f"MultiRegion{properties['StackName']}"
+    if 'FanOutState' not in payload:
+        payload['FanOutState'] = fan_out_plan(payload)
+    
+    fan_out = region_fan_out.RegionFanOut(
+        properties['StackName'],
+        properties.get('TemplateUrl'),
+        stack_parameters(payload),
+        properties.get('Capabilities', 'CAPABILITY_IAM').split(','),
+        properties.get('OnFailure', 'DELETE'),
+        fan_out_operation_states,
+        int(properties.get('MaxConcurrentRegions', len(payload['FanOutState']))),
+        int(properties.get('FailureToleranceCount', 0)),
+        payload['FanOutState'],
+        template_changed(payload)
+    )
+    if not fan_out.run(lambda_context):
+        invoker = lambda_invoker.LambdaInvoker()
+        invoker.invoke(payload)
+        return
+    
+    cfn_response = cr_response.CustomResourceResponse(payload)
+    cfn_response.response['Status'] = 'SUCCESS' if fan_out.succeeded() else 'FAILED'
+    cfn_response.response['Reason'] = fan_out.failure_reason()
+    cfn_response.response['Data'] = fan_out.data()
+    cfn_response.respond()
+
+
+def create_update_stack(cmd, payload, manage=None):
+    if 'Capabilities' not in payload['ResourceProperties']:
+        payload['ResourceProperties']['Capabilities'] = 'CAPABILITY_IAM'
+    
+    # compile stack parameters
+    stack_params = stack_parameters(payload)
+    
+    # instantiate and use management handler, unless one with stacks described already is passed
+    if manage is None:
+        manage = stack_manage.StackManagement()
     
     on_failure = 'DELETE'
     if 'OnFailure' in payload['ResourceProperties']:
         on_failure = payload['ResourceProperties']['OnFailure']
     
+    fingerprint = manage.fingerprint(
+        payload['ResourceProperties']['TemplateUrl'],
+        stack_params,
+        payload['ResourceProperties']['Capabilities'].split(',')
+    )
+    
     stack_id = ''
     if cmd == 'create':
         stack_id = manage.create(
@@ -60,17 +164,26 @@ def create_update_stack(cmd, payload):
             payload['ResourceProperties']['TemplateUrl'],
             stack_params,
             payload['ResourceProperties']['Capabilities'].split(','),
-            on_failure
+            on_failure,
+            fingerprint
         )
     elif cmd == 'update':
         stack_id = payload['PhysicalResourceId']
-        result = manage.update(
-            payload['ResourceProperties']['Region'],
-            stack_id,
-            payload['ResourceProperties']['TemplateUrl'],
-            stack_params,
-            payload['ResourceProperties']['Capabilities'].split(','),
-        )
+        stack_details = manage.find_stack(payload['ResourceProperties']['Region'], stack_id)
+        if stack_details is not None and manage.is_up_to_date(stack_details, fingerprint):
+            # deployed with same template, parameters and capabilities, there is nothing to wait for
+            print(f"Stack {stack_id} is up to date, skipping update")
+            result = None
+        else:
+            result = manage.update(
+                payload['ResourceProperties']['Region'],
+                stack_id,
+                payload['ResourceProperties']['TemplateUrl'],
+                stack_params,
+                payload['ResourceProperties']['Capabilities'].split(','),
+                fingerprint,
+                template_changed(payload)
+            )
         # no updates to be performed
         if result is None:
             cfn_response = cr_response.CustomResourceResponse(payload)
@@ -82,8 +195,7 @@ def create_update_stack(cmd, payload):
     return stack_id
 
 
-def delete_stack(payload):
-    manage = stack_manage.StackManagement()
+def delete_stack(payload, manage):
     region = payload['ResourceProperties']['Region']
     stack_id = payload['PhysicalResourceId']
     manage.delete(region, payload['ResourceProperties']['StackName'])
@@ -103,16 +215,24 @@ def wait_stack_states(success_states, failure_states, lambda_payload, lambda_con
     :return:
     """
     manage = stack_manage.StackManagement()
+    # stack events seen by previous executions are not read again
+    tail = stack_manage.StackEventTail(
+        lambda_payload['ResourceProperties']['Region'],
+        lambda_payload['PhysicalResourceId'],
+        lambda_payload.get('WaitState')
+    )
     result = manage.wait_stack_status(
         lambda_payload['ResourceProperties']['Region'],
         lambda_payload['PhysicalResourceId'],
         success_states,
         failure_states,
-        lambda_context
+        lambda_context,
+        tail
     )
     
     # in this case we need to restart lambda execution
     if result is None:
+        lambda_payload['WaitState'] = tail.state()
         invoke = lambda_invoker.LambdaInvoker()
         invoke.invoke(lambda_payload)
     else:
@@ -129,6 +249,15 @@ def lambda_handler(payload, context):
     # if lambda invoked to wait for stack status
     print(f"Received event:{json.dumps(payload)}")
     
+    # stack deployed to list of regions at once, whether invoked by cf or by itself
+    if 'Regions' in payload['ResourceProperties']:
+        try:
+            fan_out_stack(payload, context)
+        except Exception as e:
+            respond_failed(payload, e)
+            raise e
+        return
+    
     # handle disable region situation
     if 'EnabledRegions' in payload['ResourceProperties']:
         region_list = payload['ResourceProperties']['EnabledRegions'].split(',')
@@ -196,13 +325,13 @@ def lambda_handler(payload, context):
                     lambda_handler(payload, context)
                     return
                 else:
-                    stack_id = create_update_stack('create', payload)
+                    stack_id = create_update_stack('create', payload, manage)
             
             elif payload['RequestType'] == 'Update':
                 # stack exists, update request => update
                 # stack not exists, update request => create
                 if stack_exists:
-                    stack_id = create_update_stack('update', payload)
+                    stack_id = create_update_stack('update', payload, manage)
                     if stack_id is None:
                         # no updates to be performed
                         return
@@ -215,10 +344,11 @@ def lambda_handler(payload, context):
             elif payload['RequestType'] == 'Delete':
                 # stack exists, delete request => delete
                 # stack not exists, delete request => report ok
-                # for delete we are interested in actual stack id
-                stack_exists = manage.stack_exists(region, stack_id)
+                # for delete we are interested in actual stack id. Stack found by name is described
+                # by its id as well, and if there is none, stack with that id is gone too
+                stack_exists = stack_exists and manage.stack_exists(region, stack_id)
                 if stack_exists:
-                    delete_stack(payload)
+                    delete_stack(payload, manage)
                 else:
                     # reply with success
                     print(f"Delete request came for {stack_name}, but it is nowhere to be found...")
@@ -235,12 +365,5 @@ def lambda_handler(payload, context):
             invoker.invoke(payload)
         
         except Exception as e:
-            print(f"Exception:{e}\n{str(e)}")
-            print(traceback.format_exc())
-            cfn_response = cr_response.CustomResourceResponse(payload)
-            if 'PhysicalResourceId' in payload:
-                cfn_response.response['PhysicalResourceId'] = payload['PhysicalResourceId']
-            cfn_response.response['Status'] = 'FAILED'
-            cfn_response.response['Reason'] = str(e)
-            cfn_response.respond()
+            respond_failed(payload, e)
             raise e
@@ -0,0 +1,171 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import stack_manage
+
+OPERATION_DEPLOY = 'deploy'
+OPERATION_CREATE = 'create'
+OPERATION_UPDATE = 'update'
+OPERATION_DELETE = 'delete'
+
+STATUS_PENDING = 'PENDING'
+STATUS_IN_PROGRESS = 'IN_PROGRESS'
+STATUS_SUCCESS = 'SUCCESS'
+STATUS_FAILED = 'FAILED'
+# not started, as more regions failed than tolerated
+STATUS_SKIPPED = 'SKIPPED'
+
+
+def plan(regions, operation):
+    """Initial state of every region, state is a plain dict so it travels in payload of lambda re-invocations"""
+    return list(map(lambda x: {'Region': x, 'Operation': operation, 'Status': STATUS_PENDING}, regions))
+
+
+class RegionFanOut:
+    """
+    Creates, updates or deletes same stack in multiple regions at once. At most max_concurrent
+    regions are in progress at any time, and once more than failure_tolerance regions fail, no
+    new regions are started. All regions in progress are waited for in single loop, polling
+    their stack events in parallel
+    """
+    
+    def __init__(self, stack_name, url, params, capabilities, on_failure, operation_states,
+                 max_concurrent, failure_tolerance, region_states, template_changed=False):
+        self.stack_name = stack_name
+        self.url = url
+        self.params = params
+        self.capabilities = capabilities
+        self.on_failure = on_failure
+        # operation => (success states, failure states)
+        self.operation_states = operation_states
+        self.max_concurrent = max(1, max_concurrent)
+        self.failure_tolerance = failure_tolerance
+        self.region_states = region_states
+        # stacks created without fingerprint tag are tagged only by updates changing them anyway
+        self.template_changed = template_changed
+        self.manage = stack_manage.StackManagement()
+        self.tails = {}
+        self._fingerprint = None
+    
+    def with_status(self, *statuses):
+        return [x for x in self.region_states if x['Status'] in statuses]
+    
+    # Start pending regions up to max in-flight count. Stack operations return immediately,
+    # so regions are started one by one
+    def start_pending(self):
+        failed = len(self.with_status(STATUS_FAILED))
+        for state in self.with_status(STATUS_PENDING):
+            if failed > self.failure_tolerance:
+                print(f"{failed} regions failed, tolerating {self.failure_tolerance}, skipping {state['Region']}")
+                state['Status'] = STATUS_SKIPPED
+            elif len(self.with_status(STATUS_IN_PROGRESS)) < self.max_concurrent:
+                self.start(state)
+                if state['Status'] == STATUS_FAILED:
+                    failed += 1
+    
+    # Template of all regions is same, so its fingerprint is computed once
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = self.manage.fingerprint(self.url, self.params, self.capabilities)
+        return self._fingerprint
+    
+    def start(self, state):
+        region = state['Region']
+        try:
+            stack = self.manage.find_stack(region, self.stack_name)
+            if state['Operation'] == OPERATION_DELETE:
+                if stack is None:
+                    print(f"Stack {self.stack_name} not found in {region}, nothing to delete")
+                    state['Status'] = STATUS_SUCCESS
+                    return
+                state['StackId'] = stack['StackId']
+                self.manage.delete(region, stack['StackId'])
+            elif stack is None:
+                state['Operation'] = OPERATION_CREATE
+                state['StackId'] = self.manage.create(region, self.stack_name, self.url, self.params,
+                                                      self.capabilities, self.on_failure, self.fingerprint())
+            else:
+                state['Operation'] = OPERATION_UPDATE
+                state['StackId'] = stack['StackId']
+                if self.manage.is_up_to_date(stack, self.fingerprint()):
+                    print(f"Stack {self.stack_name} in {region} is up to date, skipping update")
+                    state['Status'] = STATUS_SUCCESS
+                    return
+                if self.manage.update(region, stack['StackId'], self.url, self.params, self.capabilities,
+                                      self.fingerprint(), self.template_changed) is None:
+                    state['Status'] = STATUS_SUCCESS
+                    return
+            state['Status'] = STATUS_IN_PROGRESS
+        except Exception as e:
+            print(f"Failed to {state['Operation']} stack {self.stack_name} in {region}: {e}")
+            state['Status'] = STATUS_FAILED
+            state['Reason'] = str(e)
+    
+    def tail(self, state):
+        # clients are created here, in main thread, as boto3 default session is not thread safe
+        if state['Region'] not in self.tails:
+            self.tails[state['Region']] = stack_manage.StackEventTail(state['Region'], state['StackId'],
+                                                                      state.get('WaitState'))
+        return self.tails[state['Region']]
+    
+    # Poll stack events of region once, returns seconds to wait before its next poll
+    def poll(self, state):
+        tail = self.tails[state['Region']]
+        success_states, failure_states = self.operation_states[state['Operation']]
+        try:
+            interval = tail.advance()
+        except Exception as e:
+            state['Status'] = STATUS_FAILED
+            state['Reason'] = str(e)
+            return 0
+        state['WaitState'] = tail.state()
+        if tail.stack_status in success_states:
+            state['Status'] = STATUS_SUCCESS
+        elif tail.stack_status in failure_states:
+            state['Status'] = STATUS_FAILED
+            state['Reason'] = tail.failure_reason()
+        if state['Status'] != STATUS_IN_PROGRESS:
+            print(f"Stack {self.stack_name} in {state['Region']}: {tail.stack_status} - {state['Status']}")
+        return interval
+    
+    def run(self, lambda_context):
+        """
+        Start and wait for regions until all of them are done. Returns False if lambda is running
+        out of time, region states should then be passed to re-invoked lambda
+        """
+        while True:
+            self.start_pending()
+            in_progress = self.with_status(STATUS_IN_PROGRESS)
+            if len(in_progress) == 0:
+                return True
+            for state in in_progress:
+                self.tail(state)
+            with ThreadPoolExecutor(max_workers=len(in_progress)) as executor:
+                intervals = list(executor.map(self.poll, in_progress))
+            # some regions are done, pending ones are started without waiting
+            regions_done = len(self.with_status(STATUS_IN_PROGRESS)) < len(in_progress)
+            interval = 0 if regions_done else min(intervals)
+            remaining = lambda_context.get_remaining_time_in_millis()
+            if remaining < stack_manage.REINVOKE_MARGIN_MS + interval * 1000:
+                print(f"Less than {stack_manage.REINVOKE_MARGIN_MS + interval * 1000}ms left of Lambda "
+                      f"execution time, {len(self.with_status(STATUS_IN_PROGRESS, STATUS_PENDING))} regions "
+                      f"still pending or in progress")
+                return False
+            if regions_done:
+                continue
+            print(f"Waiting for {interval} seconds for {len(in_progress)} regions, time remaining "
+                  f"in this lambda execution {remaining}ms")
+            time.sleep(interval)
+    
+    def succeeded(self):
+        return len(self.with_status(STATUS_FAILED)) <= self.failure_tolerance
+    
+    def failure_reason(self):
+        return '; '.join(map(lambda x: f"{x['Region']}: {x.get('Reason', '')}", self.with_status(STATUS_FAILED)))
+    
+    # Stack id and status of every region, for Fn::GetAtt as StackId.<region> and Status.<region>
+    def data(self):
+        data = {}
+        for state in self.region_states:
+            data[f"StackId.{state['Region']}"] = state.get('StackId', '')
+            data[f"Status.{state['Region']}"] = state['Status']
+        return data
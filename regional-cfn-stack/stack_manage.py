@@ -1,57 +1,429 @@
 import boto3
-from functools import reduce
+import hashlib
+from botocore.exceptions import ClientError
+from urllib.parse import urlparse, parse_qs, unquote
 import time
 import json
 
+# polling interval adapts to pace of stack events, between these bounds
+MIN_POLL_SECONDS = 2
+MAX_POLL_SECONDS = 15
+# interval grows up to this bound while CloudFormation throttles requests
+MAX_THROTTLED_POLL_SECONDS = 60
+THROTTLING_CODES = ['Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException']
+# lambda is re-invoked once less than this is left after next poll
+REINVOKE_MARGIN_MS = 10000
+# stack statuses of events starting user initiated stack operation
+OPERATION_START_STATUSES = ['CREATE_IN_PROGRESS', 'UPDATE_IN_PROGRESS', 'DELETE_IN_PROGRESS', 'IMPORT_IN_PROGRESS']
+# stack statuses automatic delete of stack created with OnFailure=DELETE follows, it belongs to create operation.
+# Terminal statuses of failed create are not among them, stack is then deleted by operation of its own
+AUTOMATIC_DELETE_AFTER_STATUSES = ['CREATE_IN_PROGRESS', 'ROLLBACK_IN_PROGRESS']
+# reason of stack events starting operations requested by user
+USER_INITIATED_REASON = 'User Initiated'
+# failures kept in waiter state, state travels in payload of lambda re-invocations
+MAX_FAILURES = 10
+# failure reasons reported to CloudFormation
+REPORTED_FAILURE_REASONS = 3
+# failed nested stacks are scanned for their failure reasons down to this depth
+MAX_NESTED_STACK_DEPTH = 5
+# failures caused by other failures, reported only if there is nothing else
+CONSEQUENTIAL_FAILURE_MARKERS = ['cancelled', 'The following resource(s) failed to']
+# stack tag holding fingerprint of template, parameters and capabilities stack was last deployed with
+FINGERPRINT_TAG = 'RegionalStackFingerprint'
+# statuses of stacks that are deployed as their fingerprint tag says, failed updates roll tags back
+UP_TO_DATE_STATUSES = ['CREATE_COMPLETE', 'UPDATE_COMPLETE']
+# value of NoEcho parameters in stack description
+NO_ECHO_VALUE = '****'
+
+
+def is_throttling(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLING_CODES
+
+
+def is_stack_event(event):
+    return event['ResourceType'] == 'AWS::CloudFormation::Stack' and event['PhysicalResourceId'] == event['StackId']
+
+
+def is_operation_start(event):
+    return is_stack_event(event) and event['ResourceStatus'] in OPERATION_START_STATUSES
+
+
+def is_automatic_delete_start(event):
+    return (event['ResourceStatus'] == 'DELETE_IN_PROGRESS' and
+            event.get('ResourceStatusReason') != USER_INITIATED_REASON)
+
+
+def operation_start(events, complete=False):
+    """
+    Index of event starting current stack operation within events listed newest first, or None if it
+    is not among them. Delete that is not user initiated and follows failed create without terminal
+    status in between deletes stack created with OnFailure=DELETE, and belongs to create operation,
+    so it starts operation only if older stack event is of other status, or if there are no older
+    events (complete listing)
+    """
+    delete_start = None
+    for index, event in enumerate(events):
+        if not is_stack_event(event):
+            continue
+        status = event['ResourceStatus']
+        if delete_start is not None:
+            if status not in AUTOMATIC_DELETE_AFTER_STATUSES:
+                return delete_start
+            delete_start = None
+        if is_automatic_delete_start(event):
+            delete_start = index
+        elif status in OPERATION_START_STATUSES:
+            return index
+    return delete_start if complete else None
+
+
+def operation_events(cfn_client, stack_id, since=None):
+    """
+    Events of current operation of stack, in chronological order. Events are listed newest first,
+    pages are read only back to event starting operation, or back to since timestamp for nested
+    stacks, whose operations are started by parent stack
+    """
+    events = []
+    args = {'StackName': stack_id}
+    while True:
+        resp = cfn_client.describe_stack_events(**args)
+        for event in resp['StackEvents']:
+            if since is not None and event['Timestamp'].timestamp() < since:
+                return list(reversed(events))
+            events.append(event)
+        if since is None:
+            start = operation_start(events, 'NextToken' not in resp)
+            if start is not None:
+                return list(reversed(events[:start + 1]))
+        if 'NextToken' not in resp:
+            return list(reversed(events))
+        args['NextToken'] = resp['NextToken']
+
+
+def failure_entry(event):
+    """Failed event reduced to fields needed to explain failure, or None for events of other statuses"""
+    if not event['ResourceStatus'].endswith('FAILED'):
+        return None
+    return {
+        'LogicalResourceId': event['LogicalResourceId'],
+        'PhysicalResourceId': event.get('PhysicalResourceId', ''),
+        'ResourceType': event['ResourceType'],
+        'StackId': event['StackId'],
+        'Reason': event.get('ResourceStatusReason', '')
+    }
+
+
+def is_nested_stack_failure(failure):
+    return (failure['ResourceType'] == 'AWS::CloudFormation::Stack' and failure['PhysicalResourceId'] != '' and
+            failure['PhysicalResourceId'] != failure['StackId'])
+
+
+def failure_rank(failure):
+    """
+    Root causes first: failures of resources, then failures of nested stacks, whose own events
+    tell what failed in them, then failures of stack itself and cancellations caused by others
+    """
+    if (failure['PhysicalResourceId'] == failure['StackId'] or
+            any(map(lambda x: x in failure['Reason'], CONSEQUENTIAL_FAILURE_MARKERS))):
+        return 2
+    if is_nested_stack_failure(failure):
+        return 1
+    return 0
+
+
+def rank_failures(failures):
+    # sort is stable, so failures of same rank stay in chronological order
+    return sorted(failures, key=failure_rank)
+
+
+def failure_reasons(cfn_client, failures, since, path='', depth=0):
+    """
+    Reasons of highest ranked failures, prefixed with logical id path of resource. Failed nested stacks
+    are replaced with their own failure reasons, their events are read only when reasons are still needed
+    """
+    reasons = []
+    for failure in rank_failures(failures):
+        if len(reasons) >= REPORTED_FAILURE_REASONS:
+            break
+        if failure_rank(failure) == 2 and len(reasons) > 0:
+            break
+        name = f"{path}{failure['LogicalResourceId']}"
+        if is_nested_stack_failure(failure) and depth < MAX_NESTED_STACK_DEPTH:
+            nested_events = operation_events(cfn_client, failure['PhysicalResourceId'], since)
+            nested_failures = list(filter(None, map(failure_entry, nested_events)))
+            nested_reasons = failure_reasons(cfn_client, nested_failures, since, f"{name}/", depth + 1)
+            if len(nested_reasons) > 0:
+                reasons += nested_reasons
+                continue
+        reasons.append(f"{name}: {failure['Reason']}")
+    return reasons[:REPORTED_FAILURE_REASONS]
+
+
+def parse_s3_url(url):
+    """
+    Bucket, key and version of template in S3, from virtual hosted or path style S3 url,
+    as head_object arguments. None for urls of other hosts
+    """
+    parsed = urlparse(url)
+    labels = parsed.netloc.lower().split('.')
+    if 'amazonaws' not in labels:
+        return None
+    s3_labels = [i for i, x in enumerate(labels) if x == 's3' or x.startswith('s3-')]
+    if len(s3_labels) == 0:
+        return None
+    path = unquote(parsed.path).lstrip('/')
+    if s3_labels[0] == 0:
+        if '/' not in path:
+            return None
+        bucket, key = path.split('/', 1)
+    else:
+        bucket, key = '.'.join(labels[:s3_labels[0]]), path
+    location = {'Bucket': bucket, 'Key': key}
+    version = parse_qs(parsed.query).get('versionId')
+    if version:
+        location['VersionId'] = version[0]
+    return location
+
+
 class StackStatus:
     def __init__(self, success, reason):
         self.status = 'SUCCESS' if success else 'FAILED'
         self.reason = reason
 
 
+class PollInterval:
+    """
+    Seconds to wait before next poll. Interval is halved while stack events keep coming,
+    grows while stack is quiet, and doubles when CloudFormation throttles requests
+    """
+    
+    def __init__(self, seconds=None):
+        self.seconds = seconds or MIN_POLL_SECONDS
+    
+    def after_events(self, new_events):
+        if new_events > 0:
+            self.seconds = max(MIN_POLL_SECONDS, round(self.seconds / 2, 1))
+        else:
+            self.seconds = min(MAX_POLL_SECONDS, round(self.seconds * 1.5, 1))
+        return self.seconds
+    
+    def after_throttling(self):
+        self.seconds = min(MAX_THROTTLED_POLL_SECONDS, self.seconds * 2)
+        return self.seconds
+
+
+class StackEventTail:
+    """
+    Reads stack events incrementally, newer than last event seen. Stack status is taken from events
+    of stack itself, and failures are collected as events arrive. First read goes back to event
+    starting current stack operation only, so events of earlier operations are ignored.
+    State is a plain dict, so tail can be resumed by re-invoked lambda
+    """
+    
+    def __init__(self, region, stack_id, state=None):
+        self.cfn_client = boto3.client('cloudformation', region_name=region)
+        self.stack_id = stack_id
+        state = state or {}
+        self.last_event_id = state.get('LastEventId')
+        self.stack_status = state.get('StackStatus')
+        # timestamp of operation start, nested stack events older than it are of earlier operations
+        self.operation_start = state.get('OperationStart')
+        self.failures = state.get('Failures', [])
+        self.poll_interval = PollInterval(state.get('PollInterval'))
+    
+    def state(self):
+        return {
+            'LastEventId': self.last_event_id,
+            'StackStatus': self.stack_status,
+            'OperationStart': self.operation_start,
+            'Failures': self.failures,
+            'PollInterval': self.poll_interval.seconds
+        }
+    
+    # Read events since last poll, returns number of new events
+    def poll(self):
+        events = self.new_events()
+        for event in events:
+            self.process(event)
+        if self.stack_status is None:
+            # operation start event not visible yet
+            stack_details = self.cfn_client.describe_stacks(StackName=self.stack_id)['Stacks'][0]
+            self.stack_status = stack_details['StackStatus']
+        return len(events)
+    
+    # New events in chronological order. Events are listed newest first, pages are read only
+    # until last seen event, or until start of current operation on first poll
+    def new_events(self):
+        events = []
+        args = {'StackName': self.stack_id}
+        while True:
+            resp = self.cfn_client.describe_stack_events(**args)
+            for event in resp['StackEvents']:
+                if event['EventId'] == self.last_event_id:
+                    return self.remember(events)
+                events.append(event)
+            if self.last_event_id is None:
+                start = operation_start(events, 'NextToken' not in resp)
+                if start is not None:
+                    return self.remember(events[:start + 1])
+            if 'NextToken' not in resp:
+                break
+            args['NextToken'] = resp['NextToken']
+        if self.last_event_id is None:
+            # start of operation not found, events are of earlier operations
+            return []
+        return self.remember(events)
+    
+    def remember(self, events):
+        if len(events) > 0:
+            self.last_event_id = events[0]['EventId']
+        return list(reversed(events))
+    
+    def process(self, event):
+        status = event['ResourceStatus']
+        print(f"{event['Timestamp']} {event['LogicalResourceId']} {status} {event.get('ResourceStatusReason', '')}")
+        if is_stack_event(event):
+            self.stack_status = status
+        # only start of operation being waited for, deletion of failed create is part of it
+        if is_operation_start(event) and self.operation_start is None:
+            self.operation_start = event['Timestamp'].timestamp()
+        failure = failure_entry(event)
+        if failure is not None:
+            # lowest ranked failures are dropped once there are too many
+            self.failures = rank_failures(self.failures + [failure])[:MAX_FAILURES]
+    
+    # Poll once, returns seconds to wait before next poll
+    def advance(self):
+        try:
+            return self.poll_interval.after_events(self.poll())
+        except ClientError as e:
+            if not is_throttling(e):
+                raise e
+            interval = self.poll_interval.after_throttling()
+            print(f"Throttled by CloudFormation, backing off to {interval}s polling")
+            return interval
+    
+    def failure_reason(self):
+        return '; '.join(failure_reasons(self.cfn_client, self.failures, self.operation_start))
+
+
 class StackManagement:
     def __init__(self):
         print("Initialize stack management handler object")
+        # stack details described by this object, by (region, stack name or id), so single request
+        # describes every stack once. Entries of region are dropped once stack in it is changed
+        self.stacks = {}
+        self.template_etags = {}
     
-    def create(self, region, name, url, params, capabilities, on_failure):
+    def create(self, region, name, url, params, capabilities, on_failure, fingerprint=None):
         cfn_client = boto3.client('cloudformation', region_name=region)
         s_params = params
         
         # log stack creation info
         print(f"Creating stack\n\tName:{name}\n\tTemplate:{url}\n\tParams:{s_params}\n\tCapabilities:{capabilities}")
+        self.forget_stacks(region)
         response = cfn_client.create_stack(
             StackName=name,
             TemplateURL=url,
             Parameters=list(map(lambda x: {'ParameterKey': x[0], 'ParameterValue': x[1]}, params.items())),
             Capabilities=capabilities,
-            OnFailure=on_failure
+            OnFailure=on_failure,
+            Tags=self.fingerprint_tags([], fingerprint)
         )
         return response['StackId']
     
-    def stack_exists(selfs, region, stack_name):
+    def find_stack(self, region, stack_name):
+        """Details of stack as returned by describe_stacks, or None if stack does not exist"""
+        if (region, stack_name) in self.stacks:
+            return self.stacks[(region, stack_name)]
         cfn_client = boto3.client('cloudformation', region_name=region)
         try:
             stack_details = cfn_client.describe_stacks(StackName=stack_name)['Stacks'][0]
-            return stack_details['StackStatus'] != 'DELETE_COMPLETE'
         except Exception as e:
             if 'does not exist' in e.response['Error']['Message']:
-                return False
+                stack_details = None
             else:
                 raise e
+        if stack_details is not None and stack_details['StackStatus'] == 'DELETE_COMPLETE':
+            stack_details = None
+        self.stacks[(region, stack_name)] = stack_details
+        if stack_details is not None:
+            self.stacks[(region, stack_details['StackId'])] = stack_details
+            self.stacks[(region, stack_details['StackName'])] = stack_details
+        return stack_details
+    
+    def forget_stacks(self, region):
+        self.stacks = {k: v for k, v in self.stacks.items() if k[0] != region}
+    
+    def fingerprint(self, url, params, capabilities):
+        """
+        Hash of template content, parameters and capabilities. Template content is identified by
+        ETag of template object, so template is not downloaded. None if ETag can not be read
+        """
+        if url not in self.template_etags:
+            location = parse_s3_url(url)
+            try:
+                if location is None:
+                    raise Exception('not an S3 url')
+                self.template_etags[url] = boto3.client('s3').head_object(**location)['ETag']
+            except Exception as e:
+                print(f"Can not read ETag of template {url}, stack will be updated: {e}")
+                self.template_etags[url] = None
+        if self.template_etags[url] is None:
+            return None
+        content = json.dumps({'Template': self.template_etags[url], 'Parameters': params,
+                              'Capabilities': sorted(capabilities)}, sort_keys=True)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+    
+    def is_up_to_date(self, stack_details, fingerprint):
+        """Whether stack was successfully deployed with same template, parameters and capabilities"""
+        tags = dict(map(lambda x: (x['Key'], x['Value']), stack_details.get('Tags', [])))
+        return (fingerprint is not None and tags.get(FINGERPRINT_TAG) == fingerprint and
+                stack_details['StackStatus'] in UP_TO_DATE_STATUSES)
     
-    def update(self, region, stack_id, url, params, capabilities):
+    def parameters_changed(self, stack_details, params):
+        """Whether any of parameters differs from stack ones, NoEcho parameters are masked and never compared"""
+        deployed = dict(map(lambda x: (x['ParameterKey'], x.get('ParameterValue')),
+                            stack_details.get('Parameters', [])))
+        return any(map(lambda x: deployed.get(x[0]) not in (x[1], NO_ECHO_VALUE), params.items()))
+    
+    # Stack tags with fingerprint tag replaced, or removed when fingerprint is unknown
+    def fingerprint_tags(self, tags, fingerprint):
+        tags = [x for x in tags if x['Key'] != FINGERPRINT_TAG]
+        if fingerprint is not None:
+            tags.append({'Key': FINGERPRINT_TAG, 'Value': fingerprint})
+        return tags
+    
+    def stack_exists(selfs, region, stack_name):
+        return selfs.find_stack(region, stack_name) is not None
+    
+    def update(self, region, stack_id, url, params, capabilities, fingerprint=None, template_changed=False):
         cfn_client = boto3.client('cloudformation', region_name=region)
         s_params = params
         
         # log stack update info
         print(f"Updating stack\n\t" +
               f"StackId:{stack_id}\n\tTemplate:{url}\n\tParams:{s_params}\n\tCapabilities:{capabilities}")
+        # tags are replaced as whole, other tags of stack are kept
+        stack_details = self.find_stack(region, stack_id)
+        tags = stack_details.get('Tags', []) if stack_details else []
+        if any(x['Key'] == FINGERPRINT_TAG for x in tags):
+            tags = self.fingerprint_tags(tags, fingerprint)
+        elif stack_details is not None and (template_changed or self.parameters_changed(stack_details, params)):
+            # stack created without fingerprint is tagged once it is updated anyway
+            print(f"Stack {stack_id} has no {FINGERPRINT_TAG} tag, tagging it along with changes of this update")
+            tags = self.fingerprint_tags(tags, fingerprint)
+        else:
+            # tag alone would update every resource of unchanged stack
+            print(f"Stack {stack_id} has no {FINGERPRINT_TAG} tag, keeping its tags")
+        self.forget_stacks(region)
         try:
-            response = cfn_client.update_stack(
+            cfn_client.update_stack(
                 StackName=stack_id,
                 TemplateURL=url,
                 Parameters=list(map(lambda x: {'ParameterKey': x[0], 'ParameterValue': x[1]}, params.items())),
-                Capabilities=capabilities
+                Capabilities=capabilities,
+                Tags=tags
             )
         except Exception as e:
             if (not 'Error' in e.response):
@@ -59,7 +431,7 @@ class StackManagement:
             if (not 'Message' in e.response['Error']):
                 raise e
             if ('No updates are to be performed' in e.response['Error']['Message']):
-                print("No updates for stack {stack_id}")
+                print(f"No updates for stack {stack_id}")
                 return None
             else:
                 raise e
@@ -69,14 +441,22 @@ class StackManagement:
     def delete(self, region, stack_id):
         cfn_client = boto3.client('cloudformation', region_name=region)
         print(f"Deleting stack: {stack_id}")
+        self.forget_stacks(region)
         cfn_client.delete_stack(StackName=stack_id)
     
-    def wait_stack_status(self, region, stack_id, success_states, failure_states, lambda_context):
-        cfn_client = boto3.client('cloudformation', region_name=region)
+    def wait_stack_status(self, region, stack_id, success_states, failure_states, lambda_context, tail=None):
+        """
+        Wait for stack status by tailing stack events. Returns None if lambda is running out of time,
+        tail state should then be passed to re-invoked lambda
+        
+        :param tail: StackEventTail resumed from previous lambda execution, new one is started if not given
+        """
+        if tail is None:
+            tail = StackEventTail(region, stack_id)
         print(f"Monitoring stack:{stack_id}\n\tSUCCESS states={success_states}\n\tFAILURE states={failure_states}")
         while True:
-            stack_details = cfn_client.describe_stacks(StackName=stack_id)['Stacks'][0]
-            stack_status = stack_details['StackStatus']
+            interval = tail.advance()
+            stack_status = tail.stack_status
             
             print(f"Stack status: {stack_status}")
             if stack_status in success_states:
@@ -84,39 +464,12 @@ class StackManagement:
                 return StackStatus(True, '')
             elif stack_status in failure_states:
                 print(f"Matched {stack_status} - ERROR ")
-                return StackStatus(False, self.get_failure_reason(region, stack_id))
-            elif lambda_context.get_remaining_time_in_millis() < 10000:
-                print(f"Less than 10 seconds left of Lambda execution time, exiting with empty hands")
+                return StackStatus(False, tail.failure_reason())
+            elif lambda_context.get_remaining_time_in_millis() < REINVOKE_MARGIN_MS + interval * 1000:
+                print(f"Less than {REINVOKE_MARGIN_MS + interval * 1000}ms left of Lambda execution time, "
+                      f"exiting with empty hands")
                 return None
             else:
-                print(f"Waiting for 5 seconds, time remaining" +
+                print(f"Waiting for {interval} seconds, time remaining " +
                       f"in this lambda execution {lambda_context.get_remaining_time_in_millis()}ms")
-                time.sleep(5)
-    
-    def get_failure_reason(self, region, stack_id):
-        """
-        Get stack failure reason by reading stack events. Any event with status
-        *FAILED will be considered as failure reason. Only last 3 status reasons
-        are considered relevant, as other may be older
-        
-        :param region:
-        :param stack_id:
-        :param cut_off_op:
-        :return:
-        """
-        cfn_client = boto3.client('cloudformation', region_name=region)
-        events = cfn_client.describe_stack_events(StackName=stack_id)['StackEvents']
-        status_reason = ''
-        count = 0
-        for event in events:
-            # only last 3 status reasons will be returned, more than enough
-            # for troubleshooting purposes
-            if count == 3:
-                return status_reason
-            
-            event_status = event['ResourceStatus']
-            if event_status.endswith('FAILED'):
-                count = count + 1
-                status_reason = status_reason + event['ResourceStatusReason']
-        
-        return status_reason
+                time.sleep(interval)
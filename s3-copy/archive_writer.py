@@ -0,0 +1,168 @@
+import logging
+import shutil
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import tar_stream
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MB = 1024 * 1024
+# every part but last must be at least 5MB
+MIN_PART_SIZE = 5 * MB
+# part size doubles every 1000 parts, so 10000 parts limit is not hit for archives of unknown size
+PARTS_PER_SIZE_STEP = 1000
+READ_CHUNK_SIZE = 256 * 1024
+# permissions of packed files, archives without them unpack into unreadable files
+FILE_MODE = 0o644
+
+
+class MultipartUploadWriter:
+    """
+    Write-only, non-seekable file object uploading written data as S3 multipart upload.
+    Parts are uploaded in background, at most concurrency parts are held in memory.
+    Multipart upload is created only once first part is full, smaller objects are
+    uploaded with single put on close
+    """
+
+    def __init__(self, client, bucket, key, part_size, extra_args, concurrency):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        self.extra_args = extra_args
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.buffer = bytearray()
+        self.position = 0
+        self.upload_id = None
+        self.parts = []
+        self.pending = set()
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= self.part_size:
+            part = bytes(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+            self.submit_part(part)
+        return len(data)
+
+    def submit_part(self, data):
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                                                 **self.extra_args)['UploadId']
+        if len(self.pending) >= self.concurrency:
+            done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                self.parts.append(future.result())
+        part_number = len(self.parts) + len(self.pending) + 1
+        self.pending.add(self.executor.submit(self.upload_part, part_number, data))
+        if part_number % PARTS_PER_SIZE_STEP == 0:
+            self.part_size *= 2
+
+    def upload_part(self, part_number, data):
+        resp = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                       PartNumber=part_number, Body=data)
+        return {'PartNumber': part_number, 'ETag': resp['ETag']}
+
+    # Upload remaining data and complete upload
+    def close(self):
+        try:
+            if self.upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer), **self.extra_args)
+                return
+            if len(self.buffer) > 0:
+                self.submit_part(bytes(self.buffer))
+                self.buffer = bytearray()
+            for future in self.pending:
+                self.parts.append(future.result())
+            self.pending = set()
+            self.parts.sort(key=lambda x: x['PartNumber'])
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                  MultipartUpload={'Parts': self.parts})
+        finally:
+            self.executor.shutdown()
+
+    def abort(self):
+        for future in self.pending:
+            future.cancel()
+        self.executor.shutdown()
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+class ZipArchiveWriter:
+    """Streams files into deflated zip archive, written with data descriptors as output is not seekable"""
+
+    def __init__(self, output):
+        self.output = output
+        self.zip_ref = zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED)
+
+    def add(self, name, size, mtime, stream):
+        info = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = FILE_MODE << 16
+        # known size lets zipfile decide on zip64 extensions upfront
+        info.file_size = size
+        with self.zip_ref.open(info, 'w') as member:
+            shutil.copyfileobj(stream, member, READ_CHUNK_SIZE)
+
+    def close(self):
+        self.zip_ref.close()
+        self.output.close()
+
+
+class TarArchiveWriter:
+    """Streams files into tar archive, optionally gzip or zstd compressed"""
+
+    def __init__(self, output, archive_type):
+        self.output = output
+        self.compressor = None
+        if archive_type == tar_stream.ARCHIVE_TAR_ZST:
+            tar_stream.check_supported(archive_type)
+            self.compressor = zstandard.ZstdCompressor().stream_writer(output)
+            self.tar = tarfile.open(fileobj=self.compressor, mode='w|', format=tarfile.PAX_FORMAT)
+        elif archive_type == tar_stream.ARCHIVE_TAR_GZ:
+            self.tar = tarfile.open(fileobj=output, mode='w|gz', format=tarfile.PAX_FORMAT)
+        else:
+            self.tar = tarfile.open(fileobj=output, mode='w|', format=tarfile.PAX_FORMAT)
+
+    def add(self, name, size, mtime, stream):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = FILE_MODE
+        self.tar.addfile(info, stream)
+
+    def close(self):
+        # tar files opened over passed file object leave it open
+        self.tar.close()
+        if self.compressor is not None:
+            self.compressor.flush(zstandard.FLUSH_FRAME)
+        self.output.close()
+
+
+def open_archive(output, archive_type):
+    """Archive writer of given type over file object output"""
+    if archive_type == tar_stream.ARCHIVE_ZIP:
+        return ZipArchiveWriter(output)
+    if archive_type in tar_stream.TAR_TYPES:
+        return TarArchiveWriter(output, archive_type)
+    raise Exception(f"Archive type must be one of {tar_stream.ARCHIVE_TYPES}, got {archive_type}")
@@ -0,0 +1,116 @@
+import logging
+import os
+import resource
+import shutil
+import threading
+import time
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MB = 1024 * 1024
+
+STRATEGY_MEMORY = 'memory'
+STRATEGY_DISK = 'disk'
+STRATEGY_STREAM = 'stream'
+
+# share of configured lambda memory objects may be buffered in, rest is left to runtime and transfers
+MEMORY_BUDGET_FRACTION = 0.25
+# share of free /tmp space that may be used for spooling
+DISK_BUDGET_FRACTION = 0.8
+TMP_PATH = '/tmp'
+SAMPLE_INTERVAL_SECONDS = 0.2
+# resident set size of this process, in pages
+STATM_PATH = '/proc/self/statm'
+
+
+class ExecutionBudget:
+    """
+    Memory and /tmp space available to single invocation, and strategy selection for
+    objects of given size: buffered in memory, spooled through /tmp disk, or streamed
+    """
+
+    def __init__(self, context, workers):
+        memory_mb = getattr(context, 'memory_limit_in_mb', None) or os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', 128)
+        self.memory_bytes = int(memory_mb) * MB
+        self.free_disk_bytes = shutil.disk_usage(TMP_PATH).free
+        self.workers = max(1, workers)
+        self.memory_budget = int(self.memory_bytes * MEMORY_BUDGET_FRACTION)
+        self.disk_budget = int(self.free_disk_bytes * DISK_BUDGET_FRACTION)
+        logger.info(f"Execution budget: {self.memory_budget // MB}MB of {self.memory_bytes // MB}MB memory, "
+                    f"{self.disk_budget // MB}MB of {self.free_disk_bytes // MB}MB free /tmp space")
+
+    # Strategy for single object needing memory_bytes when buffered, or disk_bytes when spooled
+    def strategy(self, memory_bytes, disk_bytes=None):
+        if disk_bytes is None:
+            disk_bytes = memory_bytes
+        if memory_bytes <= self.memory_budget:
+            return STRATEGY_MEMORY
+        if disk_bytes <= self.disk_budget:
+            return STRATEGY_DISK
+        return STRATEGY_STREAM
+
+    # Strategy for one of many objects transferred concurrently, every worker gets equal share of budget
+    def worker_strategy(self, size):
+        if size <= self.memory_budget // self.workers:
+            return STRATEGY_MEMORY
+        if size <= self.disk_budget // self.workers:
+            return STRATEGY_DISK
+        return STRATEGY_STREAM
+
+
+class ResourceMonitor:
+    """
+    Records peak memory (RSS) and /tmp usage over copy operation, sampled in background thread.
+    /tmp usage is relative to usage at start. Where RSS can not be sampled, peak RSS of whole
+    process is reported instead, which includes previous copies of warm lambda container
+    """
+
+    def __init__(self):
+        self.running = False
+        self.thread = None
+        self.disk_baseline = 0
+        self.peak_disk_bytes = 0
+        self.peak_memory_bytes = None
+
+    def start(self):
+        self.disk_baseline = shutil.disk_usage(TMP_PATH).used
+        self.peak_disk_bytes = 0
+        self.peak_memory_bytes = None
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def sample(self):
+        while self.running:
+            self.record_disk()
+            self.record_memory()
+            time.sleep(SAMPLE_INTERVAL_SECONDS)
+
+    def record_disk(self):
+        self.peak_disk_bytes = max(self.peak_disk_bytes, shutil.disk_usage(TMP_PATH).used - self.disk_baseline)
+
+    def record_memory(self):
+        try:
+            with open(STATM_PATH) as statm:
+                memory_bytes = int(statm.read().split()[1]) * resource.getpagesize()
+        except (OSError, IndexError, ValueError):
+            return
+        self.peak_memory_bytes = max(self.peak_memory_bytes or 0, memory_bytes)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.record_disk()
+        self.record_memory()
+        if self.peak_memory_bytes is not None:
+            peak_memory_bytes = self.peak_memory_bytes
+            logger.info(f"Peak memory usage during copy {peak_memory_bytes // MB}MB, "
+                        f"peak /tmp usage {self.peak_disk_bytes // MB}MB")
+        else:
+            # ru_maxrss is reported in kilobytes on linux
+            peak_memory_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            logger.info(f"Peak memory usage of process {peak_memory_bytes // MB}MB, "
+                        f"peak /tmp usage {self.peak_disk_bytes // MB}MB")
+        return {'PeakMemoryMB': peak_memory_bytes // MB, 'PeakDiskMB': self.peak_disk_bytes // MB}
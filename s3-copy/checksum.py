@@ -0,0 +1,81 @@
+import base64
+import hashlib
+import zlib
+
+try:
+    from awscrt import checksums as crt_checksums
+except ImportError:
+    crt_checksums = None
+
+ALGORITHM_CRC32 = 'CRC32'
+ALGORITHM_CRC32C = 'CRC32C'
+ALGORITHM_SHA256 = 'SHA256'
+ALGORITHMS = [ALGORITHM_CRC32, ALGORITHM_CRC32C, ALGORITHM_SHA256]
+
+
+def validate(algorithm):
+    if algorithm not in ALGORITHMS:
+        raise Exception(f"ChecksumAlgorithm must be one of {ALGORITHMS}, got {algorithm}")
+    if algorithm == ALGORITHM_CRC32C and crt_checksums is None:
+        raise Exception("awscrt package must be installed for ChecksumAlgorithm CRC32C")
+
+
+def field(algorithm):
+    """Name of checksum field in S3 api requests and responses, e.g. ChecksumSHA256"""
+    return f"Checksum{algorithm}"
+
+
+def is_full_object(value):
+    """Checksums of multipart uploads are checksums of part checksums, suffixed with part count"""
+    return value is not None and '-' not in value
+
+
+class Checksum:
+    """Running checksum of object content, digest is base64 encoded as S3 reports it"""
+
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        self.crc = 0
+        self.sha256 = hashlib.sha256() if algorithm == ALGORITHM_SHA256 else None
+
+    def update(self, data):
+        if self.algorithm == ALGORITHM_SHA256:
+            self.sha256.update(data)
+        elif self.algorithm == ALGORITHM_CRC32C:
+            self.crc = crt_checksums.crc32c(data, self.crc)
+        else:
+            self.crc = zlib.crc32(data, self.crc)
+
+    def digest(self):
+        if self.algorithm == ALGORITHM_SHA256:
+            raw = self.sha256.digest()
+        else:
+            raw = self.crc.to_bytes(4, 'big')
+        return base64.b64encode(raw).decode('ascii')
+
+
+class ChecksumReader:
+    """
+    Non-seekable file object computing checksum and size of wrapped stream as it is read,
+    so checksum of uploaded content is known without another pass over it
+    """
+
+    def __init__(self, stream, algorithm):
+        self.stream = stream
+        self.checksum = Checksum(algorithm)
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.checksum.update(data)
+        self.size += len(data)
+        return data
+
+    def close(self):
+        pass
@@ -0,0 +1,80 @@
+import mimetypes
+import os
+import threading
+import magic
+
+# bytes needed by libmagic to sniff content type
+HEADER_SIZE = 2048
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+# web asset types missing from older python / lambda runtime mime tables
+EXTRA_TYPES = {
+    '.js': 'application/javascript',
+    '.mjs': 'application/javascript',
+    '.json': 'application/json',
+    '.map': 'application/json',
+    '.webmanifest': 'application/manifest+json',
+    '.wasm': 'application/wasm',
+    '.svg': 'image/svg+xml',
+    '.webp': 'image/webp',
+    '.ico': 'image/x-icon',
+    '.woff': 'font/woff',
+    '.woff2': 'font/woff2',
+    '.ttf': 'font/ttf',
+    '.otf': 'font/otf',
+    '.eot': 'application/vnd.ms-fontobject',
+    '.md': 'text/markdown',
+    '.gz': 'application/gzip',
+    '.tgz': 'application/gzip',
+    '.zst': 'application/zstd',
+    '.tzst': 'application/zstd',
+}
+
+
+class ContentTypeResolver:
+    """
+    Resolves object content type from its file extension, memoized per extension.
+    Content is sniffed with libmagic only for unknown extensions, using header bytes
+    already held in memory
+    """
+
+    def __init__(self):
+        self.by_extension = {}
+        self.mime = None
+        self.lock = threading.Lock()
+
+    # Content type for file name based on extension, or None if extension is unknown
+    def guess(self, name):
+        extension = os.path.splitext(name)[1].lower()
+        if extension == '':
+            return None
+        if extension not in self.by_extension:
+            content_type = EXTRA_TYPES.get(extension)
+            if content_type is None:
+                content_type = mimetypes.types_map.get(extension)
+            self.by_extension[extension] = content_type
+        return self.by_extension[extension]
+
+    # Content type sniffed from header bytes
+    def sniff(self, header):
+        with self.lock:
+            if self.mime is None:
+                self.mime = magic.Magic(mime=True)
+            return self.mime.from_buffer(header) or DEFAULT_CONTENT_TYPE
+
+    def from_file(self, path):
+        content_type = self.guess(path)
+        if content_type is not None:
+            return content_type
+        with open(path, 'rb') as f:
+            return self.sniff(f.read(HEADER_SIZE))
+
+    def from_header(self, name, header):
+        return self.guess(name) or self.sniff(header)
+
+    # Content type of stream with peek method, header is only read for unknown extensions
+    def from_stream(self, name, stream):
+        content_type = self.guess(name)
+        if content_type is not None:
+            return content_type
+        return self.sniff(stream.peek(HEADER_SIZE)[:HEADER_SIZE])
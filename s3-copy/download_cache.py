@@ -0,0 +1,78 @@
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+CACHE_ROOT = '/tmp/cache/objects'
+
+
+class DownloadCache:
+    """
+    Content addressed cache of downloaded S3 objects, keyed by bucket, key and ETag.
+    Lives in /tmp, so it is shared by all invocations of warm lambda container. File
+    modification time records last use, least recently used objects are evicted once
+    cache grows over max_bytes
+    """
+
+    def __init__(self, max_bytes, root=CACHE_ROOT):
+        self.max_bytes = max_bytes
+        self.root = root
+
+    def path(self, bucket, key, etag):
+        digest = hashlib.sha256(f"{bucket}/{key}/{etag}".encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest)
+
+    # Local path of S3 object, downloaded only if not cached already. None is returned
+    # for objects larger than the whole cache. Object is downloaded with ETag of HEAD response,
+    # so object changed in between fails download instead of being cached under stale ETag
+    def get(self, client, bucket, key, transfer_config):
+        head = client.head_object(Bucket=bucket, Key=key)
+        cached_path = self.path(bucket, key, head['ETag'])
+        if os.path.exists(cached_path):
+            logger.info(f"Cache hit for s3://{bucket}/{key} ({head['ETag']}) at {cached_path}")
+            os.utime(cached_path)
+            return cached_path
+
+        if head['ContentLength'] > self.max_bytes:
+            logger.info(f"s3://{bucket}/{key} is larger than download cache, not caching")
+            return None
+        os.makedirs(self.root, exist_ok=True)
+        self.evict(head['ContentLength'])
+        # download under temporary name, so interrupted downloads are never picked up as cached
+        partial_path = f"{cached_path}.{uuid.uuid4().hex}.part"
+        logger.info(f"Cache miss for s3://{bucket}/{key} ({head['ETag']}), downloading to {cached_path}")
+        try:
+            # download_file does not accept IfMatch, object is streamed from single GET instead
+            body = client.get_object(Bucket=bucket, Key=key, IfMatch=head['ETag'])['Body']
+            with open(partial_path, 'wb') as partial_file:
+                shutil.copyfileobj(body, partial_file, transfer_config.io_chunksize)
+            os.rename(partial_path, cached_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        return cached_path
+
+    # Remove least recently used objects until required bytes fit within cache size
+    def evict(self, required_bytes):
+        entries = []
+        for name in os.listdir(self.root):
+            entry_path = os.path.join(self.root, name)
+            if name.endswith('.part'):
+                # left over by invocation that timed out
+                os.remove(entry_path)
+                continue
+            stat = os.stat(entry_path)
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+        entries.sort()
+        total = sum(map(lambda x: x[1], entries))
+        free = shutil.disk_usage(self.root).free
+        while len(entries) > 0 and (total + required_bytes > self.max_bytes or free < required_bytes):
+            mtime, size, entry_path = entries.pop(0)
+            logger.info(f"Evicting {entry_path} ({size} bytes) from download cache")
+            os.remove(entry_path)
+            total -= size
+            free += size
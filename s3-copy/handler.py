@@ -6,9 +6,53 @@ sys.path.append(f"{os.environ['LAMBDA_TASK_ROOT']}/lib")
 sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 
 import cr_response
+import lambda_invoker
 import logic
+import shards
+import tar_stream
+import hashlib
 import json
 
+# State of sharded copies of single resource, under state location prefix. Resource is identified by
+# stack and logical id, as state location may be shared by other resources copying to same bucket
+def resource_shard_state(cr_params, dst, event):
+    state_location = cr_params.get('StateLocation', f"s3://{dst['Bucket']}/.s3-copy-state/")
+    state_match = re.match(r's3:\/\/(.*?)\/(.*)', state_location)
+    if state_match is None:
+        raise Exception("StateLocation must be in s3://bucket/prefix format")
+    stack_hash = hashlib.sha256(event['StackId'].encode('utf-8')).hexdigest()[:16]
+    return shards.ShardState(state_match.group(1), f"{state_match.group(2)}{event['LogicalResourceId']}-{stack_hash}/")
+
+# State of sharded copy shared by workers of single CloudFormation request
+def request_shard_state(cr_params, dst, event):
+    resource_state = resource_shard_state(cr_params, dst, event)
+    return shards.ShardState(resource_state.bucket, f"{resource_state.prefix}{event['RequestId']}/")
+
+# Copy sub-prefixes of single shard one after another, and top level objects of source prefix for first
+# shard. Returns checkpoint with position within shard if lambda is about to time out, otherwise None
+def copy_shard(context, event, shard, shard_state, src, dst, canned_acl, transfer_opts):
+    sources = []
+    for prefix in shard['Prefixes']:
+        relative_prefix = prefix[len(src['Prefix']):]
+        dst_prefix = dst['Prefix'] if dst['Prefix'].endswith('/') else dst['Prefix'] + '/'
+        sources.append(({'Bucket': src['Bucket'], 'Prefix': prefix},
+                         {'Bucket': dst['Bucket'], 'Prefix': dst_prefix + relative_prefix}, transfer_opts))
+    if shard.get('TopLevelKeys'):
+        # destination of top level objects holds other shards too, so it is never delta synced
+        top_level_opts = dict(transfer_opts, sync_mode=logic.SYNC_MODE_FULL, delete_removed=False,
+                              source_manifest=shard_state.top_level_keys_manifest())
+        sources.append((src, dst, top_level_opts))
+    
+    checkpoint = event.get('Checkpoint') or {'Source': 0}
+    for position in range(checkpoint['Source'], len(sources)):
+        shard_src, shard_dst, opts = sources[position]
+        listing_checkpoint = checkpoint.get('Listing') if position == checkpoint['Source'] else None
+        listing_checkpoint = logic.S3CopyLogic(context, type='sync', src=shard_src, dst=shard_dst,
+                                               canned_acl=canned_acl, checkpoint=listing_checkpoint, **opts).copy()
+        if listing_checkpoint is not None:
+            return {'Source': position, 'Listing': listing_checkpoint}
+    return None
+
 def lambda_handler(event, context):
     
     print(f"Received event:{json.dumps(event)}")
@@ -31,19 +75,74 @@ def lambda_handler(event, context):
     if 'CannedAcl' in cr_params:
         canned_acl = cr_params['CannedAcl']
     
+    # optional transfer tuning, values are validated by copy logic
+    transfer_opts = {}
+    if 'Concurrency' in cr_params:
+        transfer_opts['concurrency'] = cr_params['Concurrency']
+    if 'MultipartThresholdMB' in cr_params:
+        transfer_opts['multipart_threshold_mb'] = cr_params['MultipartThresholdMB']
+    if 'MultipartChunkSizeMB' in cr_params:
+        transfer_opts['multipart_chunk_size_mb'] = cr_params['MultipartChunkSizeMB']
+    if 'CopyMode' in cr_params:
+        transfer_opts['copy_mode'] = cr_params['CopyMode']
+    if 'SyncMode' in cr_params:
+        transfer_opts['sync_mode'] = cr_params['SyncMode']
+    if 'DeleteRemoved' in cr_params:
+        transfer_opts['delete_removed'] = cr_params['DeleteRemoved'].lower() == 'true'
+    if 'UseManifest' in cr_params:
+        transfer_opts['use_manifest'] = cr_params['UseManifest'].lower() == 'true'
+    if 'PurgeVersions' in cr_params:
+        transfer_opts['purge_versions'] = cr_params['PurgeVersions'].lower() == 'true'
+    if 'MetadataPolicy' in cr_params:
+        transfer_opts['metadata_rules'] = cr_params['MetadataPolicy']
+    if 'CacheSizeMB' in cr_params:
+        transfer_opts['cache_size_mb'] = cr_params['CacheSizeMB']
+    if 'ParallelUnzip' in cr_params:
+        transfer_opts['parallel_unzip'] = cr_params['ParallelUnzip'].lower() == 'true'
+    if 'ArchiveType' in cr_params:
+        transfer_opts['archive_type'] = cr_params['ArchiveType']
+    if 'ChecksumAlgorithm' in cr_params:
+        transfer_opts['checksum_algorithm'] = cr_params['ChecksumAlgorithm']
+    if 'ChecksumManifest' in cr_params:
+        transfer_opts['checksum_manifest'] = cr_params['ChecksumManifest'].lower() == 'true'
+    
     if src_param_match is None or dst_param_match is None:
         lambda_response.respond_error(f"Source/Destination must be in s3://bucket/key format")
         return
     
+    if 'SourceManifest' in cr_params:
+        manifest_match = re.match(r's3:\/\/(.*?)\/(.*)', cr_params['SourceManifest'])
+        if manifest_match is None:
+            lambda_response.respond_error("SourceManifest must be in s3://bucket/key format")
+            return
+        transfer_opts['source_manifest'] = {'Bucket': manifest_match.group(1), 'Key': manifest_match.group(2)}
+    
     # get prefixes
     src_prefix = src_param_match.group(2)
     dst_prefix = dst_param_match.group(2)
     
     dst = {'Bucket': dst_param_match.group(1), 'Prefix': dst_prefix}
+    shard_state = None
+    # prefix is packed into single archive object only when asked to, archive type is taken from its key
+    pack = cr_params.get('Pack', 'false').lower() == 'true'
+    if pack:
+        if not src_prefix.endswith('/') or tar_stream.from_key(dst_prefix) is None:
+            if event['RequestType'] == 'Delete':
+                # archive was never created
+                lambda_response.respond()
+                return
+            lambda_response.respond_error(f"Pack requires Source prefix ending with / and Destination archive key "
+                                          f"ending with one of {[x[0] for x in tar_stream.EXTENSIONS]}")
+            return
+        dst = {'Bucket': dst_param_match.group(1), 'Key': dst_prefix}
     
     try:
         if event['RequestType'] == 'Delete':
-            logic.S3CopyLogic(context, type='clean', src=None, dst=dst, canned_acl=canned_acl).clean_destination()
+            logic.S3CopyLogic(context, type='clean', src=None, dst=dst, canned_acl=canned_acl,
+                              **transfer_opts).clean_destination()
+            # state left behind by failed sharded copies of any request of this resource
+            if int(cr_params.get('Shards', 1)) > 1:
+                resource_shard_state(cr_params, dst, event).clean()
             lambda_response.respond()
             return
         
@@ -51,23 +150,81 @@ def lambda_handler(event, context):
         if event['RequestType'] == 'Create':
             event['PhysicalResourceId'] = dst_param
         
+        if pack:
+            src = {'Bucket': src_param_match.group(1), 'Prefix': src_prefix}
+            logic.S3CopyLogic(context, type='pack', src=src, dst=dst, canned_acl=canned_acl,
+                              **transfer_opts).copy()
+            lambda_response.respond()
+        # shard worker, last completed shard responds
+        elif 'Shard' in event:
+            src = {'Bucket': src_param_match.group(1), 'Prefix': src_prefix}
+            shard_state = request_shard_state(cr_params, dst, event)
+            # shard definitions of failed copy are removed, only its response marker is kept
+            if shard_state.is_responded():
+                print(f"Sharded copy already failed, not starting shard {event['Shard']}")
+                return 'OK'
+            shard_definitions = shard_state.load_shards()
+            checkpoint = copy_shard(context, event, shard_definitions[event['Shard']], shard_state, src, dst,
+                                    canned_acl, transfer_opts)
+            if checkpoint is not None:
+                if shard_state.is_responded():
+                    print(f"Sharded copy already failed, not resuming shard {event['Shard']}")
+                    return 'OK'
+                print(f"Re-invoking to resume shard {event['Shard']} from checkpoint")
+                event['Checkpoint'] = checkpoint
+                lambda_invoker.LambdaInvoker().invoke(event)
+                return 'OK'
+            if shard_state.complete(event['Shard'], len(shard_definitions)) and shard_state.claim_response('SUCCESS'):
+                lambda_response.respond()
+                shard_state.clean()
+            return 'OK'
+        # split prefix into shards copied by worker invocations
+        elif src_prefix.endswith('/') and int(cr_params.get('Shards', 1)) > 1 and 'SourceManifest' not in cr_params:
+            src = {'Bucket': src_param_match.group(1), 'Prefix': src_prefix}
+            shard_state = request_shard_state(cr_params, dst, event)
+            shard_definitions = shard_state.split(src, int(cr_params['Shards']))
+            invoker = lambda_invoker.LambdaInvoker()
+            for index in range(len(shard_definitions)):
+                print(f"Invoking worker for shard {index}")
+                invoker.invoke(dict(event, Shard=index))
+            return 'OK'
         # check if source is prefix - than it is sync type
-        if src_prefix.endswith('/'):
+        elif src_prefix.endswith('/'):
             src = {'Bucket': src_param_match.group(1), 'Prefix': src_prefix}
-            logic.S3CopyLogic(context, type='sync', src=src, dst=dst, canned_acl=canned_acl).copy()
+            checkpoint = logic.S3CopyLogic(context, type='sync', src=src, dst=dst, canned_acl=canned_acl,
+                                           checkpoint=event.get('Checkpoint'), **transfer_opts).copy()
+            # lambda is running out of time, resume copy from checkpoint in new invocation
+            if checkpoint is not None:
+                print("Re-invoking to resume copy from checkpoint")
+                event['Checkpoint'] = checkpoint
+                lambda_invoker.LambdaInvoker().invoke(event)
+                return 'OK'
             lambda_response.respond()
         # if prefix ends with zip, we need to unpack file first
         elif src_prefix.endswith('.zip'):
             src = {'Bucket': src_param_match.group(1), 'Key': src_prefix}
-            logic.S3CopyLogic(context, type='object-zip', src=src, dst=dst, canned_acl=canned_acl).copy()
+            logic.S3CopyLogic(context, type='object-zip', src=src, dst=dst, canned_acl=canned_acl,
+                              **transfer_opts).copy()
+            lambda_response.respond()
+        # tar archives are unpacked in single streaming pass
+        elif tar_stream.from_key(src_prefix) in tar_stream.TAR_TYPES:
+            src = {'Bucket': src_param_match.group(1), 'Key': src_prefix}
+            logic.S3CopyLogic(context, type='object-tar', src=src, dst=dst, canned_acl=canned_acl,
+                              **transfer_opts).copy()
             lambda_response.respond()
         # by default consider prefix as key - regular s3 object
         else:
             src = {'Bucket': src_param_match.group(1), 'Key': src_prefix}
-            logic.S3CopyLogic(context, type='object', src=src, dst=dst, canned_acl=canned_acl).copy()
+            logic.S3CopyLogic(context, type='object', src=src, dst=dst, canned_acl=canned_acl,
+                              **transfer_opts).copy()
             lambda_response.respond()
     except Exception as e:
         message = str(e)
+        # only first failed shard responds
+        if shard_state is not None and not shard_state.claim_response('FAILED', message):
+            return 'OK'
         lambda_response.respond_error(message)
+        if shard_state is not None:
+            shard_state.clean(keep_response=True)
         
     return 'OK'
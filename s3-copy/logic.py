@@ -1,23 +1,121 @@
 import boto3
+import collections
+import io
+import json
 import os
 import zipfile
-import glob
 import logging
 import shutil
-import magic
+import threading
+import time
+import archive_writer
+import budget
+import checksum
+import content_type
+import metadata_policy
+import tar_stream
+import zip_stream
+import download_cache
+import manifest
+import parallel_unzip
+import pipeline
+import regions
+import source_manifest
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+MB = 1024 * 1024
+
+# number of objects transferred in parallel
+DEFAULT_CONCURRENCY = 10
+# items queued per worker, bounds memory used by items produced from listings
+QUEUED_ITEMS_PER_WORKER = 2
+# listing pages fetched ahead of transfers
+PREFETCH_PAGES = 2
+# multipart threshold and part size used by s3 transfer manager
+DEFAULT_MULTIPART_THRESHOLD_MB = 8
+DEFAULT_MULTIPART_CHUNK_SIZE_MB = 8
+# number of parts of a single object transferred in parallel
+MULTIPART_CONCURRENCY = 4
+
+# copy modes - download to /tmp and upload, copy within S3 without data passing through lambda,
+# stream data through lambda memory without touching /tmp, or pick one of these based on object
+# sizes, lambda memory and free /tmp space
+COPY_MODE_DOWNLOAD = 'download'
+COPY_MODE_SERVER_SIDE = 'server-side'
+COPY_MODE_STREAM = 'stream'
+COPY_MODE_AUTO = 'auto'
+COPY_MODES = [COPY_MODE_DOWNLOAD, COPY_MODE_SERVER_SIDE, COPY_MODE_STREAM, COPY_MODE_AUTO]
+# sync modes - copy every source object, or only new and changed ones
+SYNC_MODE_FULL = 'full'
+SYNC_MODE_DELTA = 'delta'
+SYNC_MODES = [SYNC_MODE_FULL, SYNC_MODE_DELTA]
+# delete objects api limit
+MAX_DELETE_KEYS = 1000
+# CopyObject api limit, larger objects are copied using UploadPartCopy
+MAX_COPY_OBJECT_SIZE = 5 * 1024 * MB
+COPY_PART_SIZE = 512 * MB
+MAX_PARTS = 10000
+# every part of multipart upload but last must be at least 5MB
+MIN_PART_SIZE = 5 * MB
+# no new transfers are started when less time is left in lambda execution, progress is checkpointed
+# instead and copy is resumed in next invocation. Functions with short timeouts keep quarter of their
+# execution time as margin instead
+CHECKPOINT_MARGIN_MS = 60 * 1000
+CHECKPOINT_MARGIN_FRACTION = 0.25
+# async invocation payload is limited to 256KB, larger checkpoints keep only listing position
+MAX_CHECKPOINT_KEYS_SIZE = 128 * 1024
+# error codes of objects missing in source
+NOT_FOUND_CODES = ['404', 'NoSuchKey']
 
 
 class S3CopyLogic:
     
     
     ### src - dict with Bucket and Key elements
-    ### destination - dict with Bucket and Key elements
+    ### destination - dict with Bucket and Key elements, or Bucket and Key of archive for pack type
+    ###
+    ### concurrency - number of objects transferred in parallel
+    ### multipart_threshold_mb / multipart_chunk_size_mb - s3 transfer manager settings
+    ### copy_mode - one of COPY_MODES, server-side applies to object and sync types only,
+    ###             stream applies to object, object-zip and sync types, auto applies to all types
+    ### sync_mode - one of SYNC_MODES, delta copies only new or changed objects of sync type
+    ### delete_removed - in delta mode, delete destination objects no longer present in source
+    ### use_manifest - in delta mode, compare against manifest of last copy stored in destination
+    ### purge_versions - when cleaning destination, delete all object versions and delete markers
+    ### metadata_rules - list of per-glob metadata rules, see metadata_policy.MetadataPolicy
+    ### checkpoint - progress of sync type copy returned by previous invocation, to be resumed
+    ### cache_size_mb - size of /tmp cache of downloaded objects shared by invocations, 0 disables cache
+    ### parallel_unzip - inflate zip archive members in one process per available vCPU
+    ### archive_type - one of tar_stream.ARCHIVE_TYPES to unpack object regardless of its extension,
+    ###                or auto to sniff archive type from object content
+    ### checksum_algorithm - one of checksum.ALGORITHMS, checksum of copied content is computed while it is
+    ###                      transferred, sent to S3 and compared with source checksum where available
+    ### checksum_manifest - save manifest with size and checksum of every copied object to destination prefix
+    ### source_manifest - dict with Bucket and Key of S3 inventory or key list, read instead of listing source prefix
     ###
-    def __init__(self, context, type, src, dst, canned_acl):
+    def __init__(self, context, type, src, dst, canned_acl,
+                 concurrency=DEFAULT_CONCURRENCY,
+                 multipart_threshold_mb=DEFAULT_MULTIPART_THRESHOLD_MB,
+                 multipart_chunk_size_mb=DEFAULT_MULTIPART_CHUNK_SIZE_MB,
+                 copy_mode=COPY_MODE_DOWNLOAD,
+                 sync_mode=SYNC_MODE_FULL,
+                 delete_removed=False,
+                 use_manifest=False,
+                 purge_versions=False,
+                 metadata_rules=None,
+                 checkpoint=None,
+                 cache_size_mb=0,
+                 parallel_unzip=False,
+                 archive_type=None,
+                 checksum_algorithm=None,
+                 checksum_manifest=False,
+                 source_manifest=None):
         self.context = context
         self.type = type
         self.src = src
@@ -27,41 +125,236 @@ class S3CopyLogic:
         self.local_prefix_unzip = f"/tmp/cache/{self.context.aws_request_id}/unpacked"
         self.local_prefix = f"/tmp/cache/{self.context.aws_request_id}/upload"
         self.canned_acl = canned_acl
-        self.mime = magic.Magic(mime=True)
-
-
-    def apply_acl(self, s3_resource, path):
-        if self.canned_acl is not None:
-            logger.info(f"Apply canned acl {self.canned_acl} for {path}")
-            acl = s3_resource.ObjectAcl(self.dst['Bucket'], path)
-            acl.put(ACL=self.canned_acl)
+        self.content_types = content_type.ContentTypeResolver()
+        self.concurrency = max(1, int(concurrency))
+        self.transfer_config = TransferConfig(
+            multipart_threshold=int(multipart_threshold_mb) * MB,
+            multipart_chunksize=int(multipart_chunk_size_mb) * MB,
+            max_concurrency=MULTIPART_CONCURRENCY
+        )
+        if copy_mode not in COPY_MODES:
+            raise Exception(f"CopyMode must be one of {COPY_MODES}, got {copy_mode}")
+        self.copy_mode = copy_mode
+        self.budget = None
+        if copy_mode == COPY_MODE_AUTO:
+            self.budget = budget.ExecutionBudget(context, self.concurrency)
+        self.resource_usage = None
+        if sync_mode not in SYNC_MODES:
+            raise Exception(f"SyncMode must be one of {SYNC_MODES}, got {sync_mode}")
+        self.sync_mode = sync_mode
+        self.delete_removed = delete_removed
+        self.use_manifest = use_manifest
+        self.purge_versions = purge_versions
+        self.metadata_policy = metadata_policy.MetadataPolicy(metadata_rules, canned_acl)
+        self.checkpoint = checkpoint
+        self.checkpoint_margin_ms = min(CHECKPOINT_MARGIN_MS,
+                                        int(context.get_remaining_time_in_millis() * CHECKPOINT_MARGIN_FRACTION))
+        self.download_cache = None
+        if int(cache_size_mb) > 0:
+            self.download_cache = download_cache.DownloadCache(int(cache_size_mb) * MB)
+        self.parallel_unzip = parallel_unzip
+        if archive_type is not None and archive_type not in tar_stream.ARCHIVE_TYPES + [tar_stream.ARCHIVE_AUTO]:
+            raise Exception(f"ArchiveType must be one of {tar_stream.ARCHIVE_TYPES + [tar_stream.ARCHIVE_AUTO]}, "
+                            f"got {archive_type}")
+        self.archive_type = archive_type
+        # archives needing optional packages are rejected before anything is copied
+        if type in ['object', 'object-zip', 'object-tar'] and archive_type != tar_stream.ARCHIVE_AUTO:
+            tar_stream.check_supported(archive_type or tar_stream.from_key(src['Key']))
+        if type == 'pack':
+            tar_stream.check_supported(tar_stream.from_key(dst['Key']))
+        if checksum_algorithm is not None:
+            checksum.validate(checksum_algorithm)
+        self.checksum_algorithm = checksum_algorithm
+        self.checksum_manifest = checksum_manifest
+        self.copied_manifest = None
+        self.source_manifest = source_manifest
+        self._s3_clients = {}
+        self.clients_lock = threading.Lock()
+        if source_manifest is not None:
+            self.check_source_manifest()
+    
+    # Manifests needing optional packages are rejected before anything is copied
+    def check_source_manifest(self):
+        if self.source_manifest['Key'].endswith('.parquet'):
+            source_manifest.check_parquet_supported()
+    
+    # S3 client of bucket region, shared by all transfer workers, clients (unlike resources) are thread safe.
+    # Buckets in other regions than lambda are not reached through redirects and retries this way.
+    # Connection pool is sized so that every worker thread of transfer manager gets a connection
+    def s3_client(self, bucket):
+        region = regions.bucket_region(bucket)
+        with self.clients_lock:
+            if region not in self._s3_clients:
+                max_connections = self.concurrency * MULTIPART_CONCURRENCY
+                self._s3_clients[region] = boto3.client('s3', region_name=region,
+                                                        config=Config(max_pool_connections=max_connections))
+            return self._s3_clients[region]
+    
+    def src_client(self):
+        return self.s3_client(self.src['Bucket'])
+    
+    def dst_client(self):
+        return self.s3_client(self.dst['Bucket'])
+    
+    # Run fn against every item in bounded thread pool. Items are submitted in given order, and
+    # consumed from iterable only as workers free up, so generators are not read ahead of workers.
+    # First failure cancels pending items and is re-raised. If should_stop returns True, no more
+    # items are submitted and False is returned once submitted ones are done. At least one item
+    # is always submitted, so every invocation makes progress
+    def run_concurrently(self, fn, items, should_stop=None):
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = set()
+            submitted = 0
+            try:
+                for item in items:
+                    if should_stop is not None and submitted > 0 and should_stop():
+                        for future in as_completed(pending):
+                            future.result()
+                        return False
+                    if len(pending) >= self.concurrency * QUEUED_ITEMS_PER_WORKER:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                    pending.add(executor.submit(fn, item))
+                    submitted += 1
+                for future in as_completed(pending):
+                    future.result()
+            except Exception:
+                for future in pending:
+                    future.cancel()
+                raise
+        return True
+    
+    def deadline_reached(self):
+        return self.context.get_remaining_time_in_millis() < self.checkpoint_margin_ms
     
+    # Copy objects according to type. Returns checkpoint if copy has to be resumed in next
+    # invocation, or None when it is complete
     def copy(self):
         shutil.rmtree(self.local_download_path, ignore_errors=True)
-        
-        if self.type == 'object-zip':
+        monitor = budget.ResourceMonitor().start()
+        try:
+            if self.checksum_manifest and 'Prefix' in self.dst:
+                self.copied_manifest = manifest.CopyManifest(self.dst_client(), self.dst['Bucket'],
+                                                             self.destination_key('') + manifest.MANIFEST_NAME)
+                # manifest is saved with checkpoint, and completed by resumed copy
+                if self.checkpoint is not None:
+                    self.copied_manifest.load()
+            checkpoint = self.copy_type()
+            if self.copied_manifest is not None:
+                self.copied_manifest.save()
+            return checkpoint
+        finally:
+            shutil.rmtree(self.local_download_path, ignore_errors=True)
+            self.resource_usage = monitor.stop()
+    
+    def copy_type(self):
+        if self.type in ['object', 'object-zip', 'object-tar'] and self.archive_type is not None:
+            self.resolve_archive_type()
+        if self.type == 'object-tar':
+            self.stream_tar_upload()
+        elif self.type in ['object', 'object-zip'] and self.copy_mode == COPY_MODE_AUTO:
+            self.auto_copy_object()
+        elif self.type == 'object-zip' and self.copy_mode == COPY_MODE_STREAM:
+            self.stream_zip_upload()
+        elif self.type == 'object-zip':
             self.download_object_unpack_zip_upload()
+        elif self.type == 'object' and self.copy_mode == COPY_MODE_SERVER_SIDE:
+            self.server_side_copy_object()
+        elif self.type == 'object' and self.copy_mode == COPY_MODE_STREAM:
+            self.pipe_object()
         elif self.type == 'object':
             self.download_object_upload()
+        elif self.type == 'sync' and self.sync_mode == SYNC_MODE_DELTA:
+            return self.delta_sync()
         elif self.type == 'sync':
-            self.download_prefix_upload_prefix()
+            return self.sync_prefix()
+        elif self.type == 'pack':
+            self.pack_prefix()
+        else:
+            raise Exception(f"{self.type} type not supported")
+        return None
+    
+    # Type of source object from archive_type, which overrides type derived from key extension
+    def resolve_archive_type(self):
+        if self.archive_type == tar_stream.ARCHIVE_AUTO:
+            try:
+                header = self.src_client().get_object(Bucket=self.src['Bucket'], Key=self.src['Key'],
+                                                     Range=f"bytes=0-{tar_stream.SNIFF_SIZE - 1}")['Body'].read()
+            except ClientError as e:
+                # empty objects can not be read by range
+                if e.response['Error']['Code'] != 'InvalidRange':
+                    raise
+                header = b''
+            self.archive_type = tar_stream.sniff(header)
+            logger.info(f"Sniffed archive type of s3://{self.src['Bucket']}/{self.src['Key']}: {self.archive_type}")
+        if self.archive_type is None:
+            self.type = 'object'
+        elif self.archive_type == tar_stream.ARCHIVE_ZIP:
+            self.type = 'object-zip'
         else:
-            raise f"{self.type} type not supported"
+            self.type = 'object-tar'
     
+    # Delete all objects under destination prefix. Listing pages are deleted in parallel batches
+    # while listing continues. With purge_versions, all object versions and delete markers are removed
     def clean_destination(self):
-        client = boto3.client('s3')
-        bucket = boto3.resource('s3').Bucket(self.dst['Bucket'])
-        resp = client.list_objects_v2(Bucket=self.dst['Bucket'], Prefix=self.dst['Prefix'])
-        logger.info(resp)
-        if resp['KeyCount'] > 0:
-            # delete api allow deletion of multiple objects in single call
-            bucket.delete_objects(Delete={'Objects': list(map(lambda x: {'Key': x['Key']}, resp['Contents']))})
-            
-            while resp['IsTruncated']:
-                resp = client.list_objects_v2(Bucket=self.dst['Bucket'],
-                                              Prefix=self.dst['Prefix'],
-                                              ContinuationToken=resp['NextContinuationToken'])
-                bucket.delete_objects(Delete={'Objects': list(map(lambda x: {'Key': x['Key']}, resp['Contents']))})
+        if 'Key' in self.dst:
+            # destination of pack type is single archive object
+            key = self.dst['Key']
+            batches = [[{'Key': key}]]
+            if self.purge_versions:
+                batches = self.list_version_batches(self.dst['Bucket'], key, exact_key=True)
+        elif self.purge_versions:
+            batches = self.list_version_batches(self.dst['Bucket'], self.dst['Prefix'])
+        else:
+            batches = self.list_key_batches(self.dst['Bucket'], self.dst['Prefix'])
+        self.delete_batches(batches)
+    
+    # Yield batches of keys under prefix, as accepted by delete objects api
+    def list_key_batches(self, bucket, prefix):
+        for position, objects in self.list_pages(bucket, prefix):
+            objects = [{'Key': x['Key']} for x in objects]
+            for start in range(0, len(objects), MAX_DELETE_KEYS):
+                yield objects[start:start + MAX_DELETE_KEYS]
+    
+    # Yield batches of object versions and delete markers under prefix, or of single key only if exact_key is set
+    def list_version_batches(self, bucket, prefix, exact_key=False):
+        client = self.s3_client(bucket)
+        list_args = {'Bucket': bucket, 'Prefix': prefix}
+        while True:
+            resp = client.list_object_versions(**list_args)
+            objects = [{'Key': x['Key'], 'VersionId': x['VersionId']}
+                       for x in resp.get('Versions', []) + resp.get('DeleteMarkers', [])
+                       if not exact_key or x['Key'] == prefix]
+            for start in range(0, len(objects), MAX_DELETE_KEYS):
+                yield objects[start:start + MAX_DELETE_KEYS]
+            if not resp['IsTruncated']:
+                return
+            list_args['KeyMarker'] = resp['NextKeyMarker']
+            list_args['VersionIdMarker'] = resp['NextVersionIdMarker']
+    
+    # Delete batches of objects from destination bucket in parallel. Any per-key error
+    # reported by delete objects api fails the whole operation
+    def delete_batches(self, batches):
+        bucket = self.dst['Bucket']
+        client = self.s3_client(bucket)
+        stats = {'deleted': 0}
+        lock = threading.Lock()
+        started = time.time()
+        
+        def delete_batch(batch):
+            resp = client.delete_objects(Bucket=bucket, Delete={'Objects': batch, 'Quiet': True})
+            errors = resp.get('Errors', [])
+            if len(errors) > 0:
+                details = '; '.join(map(lambda x: f"{x['Key']}: {x['Code']} {x['Message']}", errors[:3]))
+                raise Exception(f"Failed to delete {len(errors)} objects from s3://{bucket} ({details})")
+            with lock:
+                stats['deleted'] += len(batch)
+        
+        self.run_concurrently(delete_batch, batches)
+        elapsed = max(time.time() - started, 0.001)
+        logger.info(f"Deleted {stats['deleted']} objects from s3://{bucket} in {elapsed:.1f}s "
+                    f"({stats['deleted'] / elapsed:.0f} objects/s)")
     
     def download_object_unpack_zip_upload(self):
         self.download_object()
@@ -70,67 +363,675 @@ class S3CopyLogic:
     
     def download_object_upload(self):
         self.download_object()
-        self.upload(self.local_download_path)
+        self.upload_file(self.local_download_path, self.local_filename, self.source_checksum(self.src['Key']))
     
-    def download_prefix_upload_prefix(self):
-        self.download_prefix()
-        self.upload(self.local_download_path)
+    # Copy whole bucket prefix as it is being listed, largest objects of each page first. Next listing
+    # pages are fetched while current ones are transferred
+    def sync_prefix(self):
+        start, resumed_keys = self.resume_position()
+        
+        def pages():
+            for position, page in pipeline.prefetch(self.source_pages(start), PREFETCH_PAGES):
+                page = [x for x in page if not self.is_resumed(position, x, start, resumed_keys)]
+                page.sort(key=lambda x: x['Size'], reverse=True)
+                logger.info(f"Copying {len(page)} listed objects using {self.concurrency} workers")
+                yield position, page
+        
+        return self.transfer_pages(pages(), start, resumed_keys)
+    
+    # Position of source page and keys of that page already completed, from checkpoint copy is resumed from
+    def resume_position(self):
+        checkpoint = self.checkpoint or {}
+        resumed_keys = set(checkpoint.get('CompletedKeys', []))
+        if self.checkpoint is not None:
+            logger.info(f"Resuming copy from checkpoint, {len(resumed_keys)} keys of current page completed")
+        return checkpoint.get('Position'), resumed_keys
+    
+    # Whether object of page at given position was transferred before checkpoint with start position and
+    # resumed keys. Listings are resumed after key of position, source manifests at entry offset of position
+    def is_resumed(self, position, object, start, resumed_keys):
+        if object['Key'] in resumed_keys:
+            return True
+        if start is None:
+            return False
+        if self.source_manifest is None:
+            return object['Key'] <= start
+        return (position or 0) < start
     
-    # Download whole bucket prefix
-    def download_prefix(self):
-        client = boto3.client('s3')
-        bucket = boto3.resource('s3').Bucket(self.src['Bucket'])
+    # Position of page replayed from start of source, pages before start position are transferred at it,
+    # together with keys completed there by earlier invocations
+    def replayed_position(self, position, start):
+        if start is None or (position is not None and position > start):
+            return position
+        return start
+    
+    # Transfer objects of (position, objects) pages with transfer function, as pages are produced. When lambda is
+    # about to time out, no new transfers are started, and checkpoint with source position and keys completed
+    # within current page is returned instead. None is returned once all objects are transferred
+    def transfer_pages(self, pages, start, resumed_keys, transfer_fn=None):
+        transfer_fn = transfer_fn or self.transfer_key
+        # keys completed per page position, and page of last submitted object
+        completed = {start: set(resumed_keys)}
+        current = {'position': start}
+        lock = threading.Lock()
+        
+        def objects():
+            for position, page in pages:
+                with lock:
+                    # only current page is needed for checkpoint, as all submitted objects
+                    # are completed before checkpoint is taken
+                    for completed_position in list(completed.keys()):
+                        if completed_position not in (current['position'], position):
+                            del completed[completed_position]
+                    completed.setdefault(position, set(resumed_keys) if position == start else set())
+                    current['position'] = position
+                for object in page:
+                    yield position, object
+        
+        def transfer(item):
+            position, object = item
+            transfer_fn(object)
+            with lock:
+                completed.setdefault(position, set()).add(object['Key'])
+        
+        if self.run_concurrently(transfer, objects(), self.deadline_reached):
+            return None
+        return self.page_checkpoint(current['position'], completed[current['position']])
+    
+    # Checkpoint at given source page position. Checkpoint same as the one copy was resumed from would
+    # re-invoke lambda forever, copy is failed instead
+    def page_checkpoint(self, position, completed_keys):
+        checkpoint = {'Position': position, 'CompletedKeys': sorted(completed_keys)}
+        if len(json.dumps(checkpoint['CompletedKeys'])) > MAX_CHECKPOINT_KEYS_SIZE:
+            logger.warning("Completed keys too large for checkpoint, current page will be copied again")
+            checkpoint['CompletedKeys'] = []
+        if checkpoint == self.checkpoint:
+            raise Exception(f"Copy made no progress since last checkpoint, Lambda timeout is too short "
+                            f"to copy s3://{self.src['Bucket']}/{self.src['Prefix']}")
+        logger.info(f"Lambda is about to time out, checkpoint with {len(checkpoint['CompletedKeys'])} "
+                    f"completed keys of current page")
+        return checkpoint
+    
+    # Copy single source object to destination, either within S3, through memory or through /tmp.
+    # In auto mode, strategy is chosen by object size and execution budget of single worker
+    def transfer_key(self, object):
+        try:
+            self.transfer_object(object)
+        except ClientError as e:
+            # source manifests, such as daily inventory, may list objects deleted since
+            if self.source_manifest is None or e.response['Error']['Code'] not in NOT_FOUND_CODES:
+                raise
+            logger.warning(f"s3://{self.src['Bucket']}/{object['Key']} listed in source manifest does not exist")
+    
+    def transfer_object(self, object):
+        strategy = None
+        if self.copy_mode == COPY_MODE_AUTO:
+            strategy = self.budget.worker_strategy(object['Size'])
+        if self.copy_mode == COPY_MODE_SERVER_SIDE:
+            self.copy_key(object['Key'], self.relative_destination_key(object['Key']), object['Size'], object)
+        elif strategy == budget.STRATEGY_MEMORY:
+            self.transfer_in_memory(object['Key'], self.relative_source_key(object['Key']),
+                                    self.source_checksum(object['Key'], object))
+        elif self.copy_mode == COPY_MODE_STREAM or strategy == budget.STRATEGY_STREAM:
+            self.pipe_key(object['Key'], self.relative_source_key(object['Key']), object['Size'],
+                          MULTIPART_CONCURRENCY, self.source_checksum(object['Key'], object))
+        else:
+            local_path = self.download_key(object['Key'])
+            self.upload_file(self.local_download_path, local_path, self.source_checksum(object['Key'], object))
+            os.remove(local_path)
+    
+    # Yield (position, objects) pages of source objects, listed from source prefix or read from source manifest.
+    # Position is key listing page starts after, or offset of page in source manifest, from which source can be
+    # read again when copy is resumed
+    def source_pages(self, position=None):
+        if self.source_manifest is None:
+            return self.list_pages(self.src['Bucket'], self.src['Prefix'], position)
+        reader = source_manifest.SourceManifest(self.s3_client, self.source_manifest['Bucket'],
+                                                self.source_manifest['Key'])
+        return ((position, self.with_head_attributes(page))
+                for position, page in reader.pages(self.src['Bucket'], self.src['Prefix'], position))
+    
+    # Size of source manifest entries that lack it (and ETag needed by delta sync), read with parallel
+    # HEAD requests. Entries of objects no longer present in source are dropped
+    def with_head_attributes(self, page):
+        def head(object):
+            if 'Size' in object and ('ETag' in object or self.sync_mode != SYNC_MODE_DELTA):
+                return object
+            try:
+                resp = self.src_client().head_object(Bucket=self.src['Bucket'], Key=object['Key'])
+            except ClientError as e:
+                if e.response['Error']['Code'] not in NOT_FOUND_CODES:
+                    raise
+                logger.warning(f"s3://{self.src['Bucket']}/{object['Key']} listed in source manifest does not exist")
+                return None
+            return dict(object, Size=resp['ContentLength'], ETag=resp['ETag'])
+        
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return [x for x in executor.map(head, page) if x is not None]
+    
+    # Yield (start after key, objects) for every listing page under bucket prefix, starting after given key.
+    # Unlike continuation tokens, keys stay valid positions however long copy takes
+    def list_pages(self, bucket, prefix, start_after=None):
+        client = self.s3_client(bucket)
+        list_args = {'Bucket': bucket, 'Prefix': prefix}
+        if start_after is not None:
+            list_args['StartAfter'] = start_after
+        while True:
+            resp = client.list_objects_v2(**list_args)
+            objects = resp.get('Contents', [])
+            yield start_after, objects
+            if not resp['IsTruncated']:
+                return
+            list_args['ContinuationToken'] = resp['NextContinuationToken']
+            if len(objects) > 0:
+                start_after = objects[-1]['Key']
+    
+    # List all objects under bucket prefix, largest objects first
+    def list_objects(self, bucket, prefix):
         objects = []
-        resp = client.list_objects_v2(Bucket=self.src['Bucket'], Prefix=self.src['Prefix'])
-        objects += map(lambda x: x['Key'], resp['Contents'])
-        while resp['IsTruncated']:
-            resp = client.list_objects_v2(Bucket=self.src['Bucket'],
-                                          Prefix=self.src['Prefix'],
-                                          ContinuationToken=resp['NextContinuationToken'])
-            objects += map(lambda x: x['Key'], resp['Contents'])
-        
-        for object in objects:
-            local_path = self.local_download_path + "/"
-            local_path += object.replace(self.src['Prefix'], '')
-            logger.info(f"s3://{self.src['Bucket']}/{object} -> {local_path}")
-            os.makedirs(os.path.dirname(local_path), exist_ok=True)
-            bucket.download_file(object, local_path)
+        for position, page in self.list_pages(bucket, prefix):
+            objects += page
+        objects.sort(key=lambda x: x['Size'], reverse=True)
+        return objects
+    
+    def download_key(self, key):
+        local_path = self.local_download_path + "/"
+        local_path += key.replace(self.src['Prefix'], '')
+        logger.info(f"s3://{self.src['Bucket']}/{key} -> {local_path}")
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        self.src_client().download_file(self.src['Bucket'], key, local_path, Config=self.transfer_config)
+        return local_path
     
     # Download S3 object to lambda /tmp under current request
     def download_object(self):
         local_filename = os.path.basename(self.src['Key'])
         self.local_filename = f"{self.local_download_path}/{local_filename}"
         os.makedirs(os.path.dirname(self.local_filename), exist_ok=True)
-        s3 = boto3.resource('s3')
+        if self.download_cache is not None:
+            cached_path = self.download_cache.get(self.src_client(), self.src['Bucket'], self.src['Key'],
+                                                  self.transfer_config)
+            if cached_path is not None:
+                # hard link keeps cached copy when request directory is removed
+                logger.info(f"{cached_path} -> {self.local_filename}")
+                os.link(cached_path, self.local_filename)
+                return
         logger.info(f"s3://{self.src['Bucket']}/{self.src['Key']} -> {self.local_filename}")
-        s3.Bucket(self.src['Bucket']).download_file(self.src['Key'], self.local_filename)
+        self.src_client().download_file(self.src['Bucket'], self.src['Key'], self.local_filename,
+                                       Config=self.transfer_config)
     
     # Unpack downloaded zip archive
     def unpack_zip(self):
         os.makedirs(os.path.dirname(self.local_prefix_unzip), exist_ok=True)
         logger.info(f"Unpack {self.local_filename} to {self.local_prefix_unzip}")
+        cpus = parallel_unzip.available_cpus()
+        if self.parallel_unzip and cpus > 1:
+            parallel_unzip.extract(self.local_filename, self.local_prefix_unzip, cpus)
+            return
         zip_ref = zipfile.ZipFile(self.local_filename, 'r')
         zip_ref.extractall(self.local_prefix_unzip)
         zip_ref.close()
     
-    # Upload files to destination
+    # Upload files to destination as directory tree is walked, largest files of each directory first
     def upload(self, path):
-        s3_resource = boto3.resource('s3')
-        s3_client = boto3.client('s3')
-        bucket = s3_resource.Bucket(self.dst['Bucket'])
-        logger.info(f"Uploading from {path}")
-        for local_path in glob.glob(f"{path}/**/*", recursive=True):
-            if not os.path.isdir(local_path):
-                content_type = self.mime.from_file(local_path)
-                destination_key = self.dst['Prefix']
-                if not destination_key[-1] == '/':
-                    destination_key += '/'
-                destination_key += local_path.replace(f"{path}/", '')
-                logger.info(f"{local_path} -> s3://{self.dst['Bucket']}/{destination_key}")
-                bucket.upload_file(local_path, destination_key, ExtraArgs={
-                    "Metadata": {
-                        "Content-Type": content_type
-                    }
-                })
-                self.apply_acl(s3_resource,  destination_key)
-                
+        logger.info(f"Uploading from {path} using {self.concurrency} workers")
+        self.run_concurrently(lambda x: self.upload_file(path, x), pipeline.walk_files(path))
+    
+    def upload_file(self, path, local_path, source_checksum=None):
+        relative_path = local_path.replace(f"{path}/", '')
+        destination_key = self.destination_key(relative_path)
+        extra_args, compress = self.metadata_policy.extra_args(relative_path, self.content_types.from_file(local_path))
+        logger.info(f"{local_path} -> s3://{self.dst['Bucket']}/{destination_key}")
+        if compress is None and self.checksum_algorithm is None:
+            self.dst_client().upload_file(local_path, self.dst['Bucket'], destination_key, ExtraArgs=extra_args,
+                                         Config=self.transfer_config)
+        else:
+            with open(local_path, 'rb') as stream:
+                self.upload_stream(stream, destination_key, extra_args, compress, source_checksum)
+    
+    # Upload stream to destination key, ACL and metadata are set within upload request itself.
+    # With checksums enabled, checksum is computed as stream is read, and S3 validates received content against it
+    def upload_stream(self, stream, destination_key, extra_args, compress, source_checksum=None):
+        if compress is not None:
+            stream = metadata_policy.CompressingReader(stream, compress)
+            # compressed content never matches source checksum
+            source_checksum = None
+        if self.checksum_algorithm is None:
+            self.dst_client().upload_fileobj(stream, self.dst['Bucket'], destination_key, ExtraArgs=extra_args,
+                                            Config=self.transfer_config)
+            return
+        reader = checksum.ChecksumReader(stream, self.checksum_algorithm)
+        self.dst_client().upload_fileobj(reader, self.dst['Bucket'], destination_key,
+                                        ExtraArgs=dict(extra_args, ChecksumAlgorithm=self.checksum_algorithm),
+                                        Config=self.transfer_config)
+        self.record_checksum(destination_key, reader.checksum.digest(), reader.size, source_checksum)
+    
+    # Full object checksum stored with source object, if it was uploaded with one of configured algorithm.
+    # Listed objects tell their checksum algorithm, so only those having one are queried
+    def source_checksum(self, src_key, listed_object=None):
+        if self.checksum_algorithm is None:
+            return None
+        if listed_object is not None and self.checksum_algorithm not in listed_object.get('ChecksumAlgorithm', []):
+            return None
+        head = self.src_client().head_object(Bucket=self.src['Bucket'], Key=src_key, ChecksumMode='ENABLED')
+        value = head.get(checksum.field(self.checksum_algorithm))
+        if not checksum.is_full_object(value):
+            return None
+        return value
+    
+    # Record checksum of content written to destination key into manifest, failing if it differs from source
+    def record_checksum(self, destination_key, value, size, source_checksum=None):
+        if source_checksum is not None and checksum.is_full_object(value) and value != source_checksum:
+            raise Exception(f"Checksum mismatch for s3://{self.dst['Bucket']}/{destination_key}: "
+                            f"source {self.checksum_algorithm} {source_checksum}, copied {value}")
+        if self.copied_manifest is not None:
+            self.copied_manifest.put_checksum(destination_key[len(self.destination_key('')):],
+                                              checksum.field(self.checksum_algorithm), value, size)
+    
+    # Destination key for path relative to source prefix
+    def destination_key(self, relative_path):
+        destination_key = self.dst['Prefix']
+        if not destination_key[-1] == '/':
+            destination_key += '/'
+        return destination_key + relative_path
+    
+    # Destination key for source key under source prefix
+    def relative_destination_key(self, src_key):
+        return self.destination_key(self.relative_source_key(src_key))
+    
+    def relative_source_key(self, src_key):
+        return src_key.replace(self.src['Prefix'], '')
+    
+    # Copy object buffered in memory
+    def transfer_in_memory(self, src_key, relative_path, source_checksum=None):
+        destination_key = self.destination_key(relative_path)
+        logger.info(f"s3://{self.src['Bucket']}/{src_key} -> memory -> s3://{self.dst['Bucket']}/{destination_key}")
+        buffer = io.BytesIO()
+        self.src_client().download_fileobj(self.src['Bucket'], src_key, buffer, Config=self.transfer_config)
+        buffer.seek(0)
+        header = buffer.read(content_type.HEADER_SIZE)
+        buffer.seek(0)
+        extra_args, compress = self.metadata_policy.extra_args(relative_path,
+                                                               self.content_types.from_header(relative_path, header))
+        self.upload_stream(buffer, destination_key, extra_args, compress, source_checksum)
+    
+    # Pipe single large object through memory using all workers, for copies where server-side copy is not allowed
+    def pipe_object(self):
+        size = self.src_client().head_object(Bucket=self.src['Bucket'], Key=self.src['Key'])['ContentLength']
+        self.pipe_key(self.src['Key'], os.path.basename(self.src['Key']), size, self.concurrency,
+                      self.source_checksum(self.src['Key']))
+    
+    # Copy object through memory without touching /tmp. Parts are fetched with parallel ranged GETs and
+    # uploaded as multipart upload parts as soon as they arrive, so at most one part per worker is held in
+    # memory. Ranges are requested with ETag of first one, so object changed during copy fails it
+    def pipe_key(self, src_key, relative_path, size, workers, source_checksum=None):
+        if size <= self.transfer_config.multipart_threshold:
+            self.transfer_in_memory(src_key, relative_path, source_checksum)
+            return
+        src_client = self.src_client()
+        dst_client = self.dst_client()
+        destination_key = self.destination_key(relative_path)
+        part_size = max(self.transfer_config.multipart_chunksize, MIN_PART_SIZE, -(-size // MAX_PARTS))
+        ranges = [(offset, min(offset + part_size, size) - 1) for offset in range(0, size, part_size)]
+        
+        first_resp = src_client.get_object(Bucket=self.src['Bucket'], Key=src_key, Range=f"bytes=0-{ranges[0][1]}")
+        first_part = {1: first_resp['Body'].read()}
+        etag = first_resp['ETag']
+        extra_args, compress = self.metadata_policy.extra_args(
+            relative_path, self.content_types.from_header(relative_path, first_part[1][:content_type.HEADER_SIZE]))
+        if compress is not None:
+            # compressed content can not be split into source ranges, it is streamed from single GET instead
+            body = src_client.get_object(Bucket=self.src['Bucket'], Key=src_key, IfMatch=etag)['Body']
+            self.upload_stream(body, destination_key, extra_args, compress, source_checksum)
+            return
+        part_args = {}
+        if self.checksum_algorithm is not None:
+            part_args['ChecksumAlgorithm'] = self.checksum_algorithm
+        upload_id = dst_client.create_multipart_upload(Bucket=self.dst['Bucket'], Key=destination_key,
+                                                   **dict(extra_args, **part_args))['UploadId']
+        
+        def pipe_part(part):
+            part_number, (first_byte, last_byte) = part
+            data = first_part.pop(part_number, None)
+            if data is None:
+                data = src_client.get_object(Bucket=self.src['Bucket'], Key=src_key, IfMatch=etag,
+                                         Range=f"bytes={first_byte}-{last_byte}")['Body'].read()
+            resp = dst_client.upload_part(Bucket=self.dst['Bucket'], Key=destination_key, UploadId=upload_id,
+                                      PartNumber=part_number, Body=data, **part_args)
+            result = {'PartNumber': part_number, 'ETag': resp['ETag']}
+            if self.checksum_algorithm is not None:
+                result[checksum.field(self.checksum_algorithm)] = resp[checksum.field(self.checksum_algorithm)]
+            return result
+        
+        logger.info(f"s3://{self.src['Bucket']}/{src_key} -> {len(ranges)} parts using {workers} workers -> "
+                    f"s3://{self.dst['Bucket']}/{destination_key}")
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                parts = list(executor.map(pipe_part, enumerate(ranges, start=1)))
+            resp = dst_client.complete_multipart_upload(Bucket=self.dst['Bucket'],
+                                                    Key=destination_key,
+                                                    UploadId=upload_id,
+                                                    MultipartUpload={'Parts': parts})
+        except Exception:
+            dst_client.abort_multipart_upload(Bucket=self.dst['Bucket'], Key=destination_key, UploadId=upload_id)
+            raise
+        if self.checksum_algorithm is not None:
+            # checksum of part checksums is compared with source only where S3 returns full object checksum
+            self.record_checksum(destination_key, resp.get(checksum.field(self.checksum_algorithm)), size,
+                                 source_checksum)
+    
+    # Pick strategy for single object or zip archive from its size and execution budget. Zip archives
+    # spooled to disk need space for both archive and its extracted contents
+    def auto_copy_object(self):
+        if self.type == 'object':
+            size = self.src_client().head_object(Bucket=self.src['Bucket'], Key=self.src['Key'])['ContentLength']
+            strategy = self.budget.strategy(size)
+            logger.info(f"Copying {size} bytes object using {strategy} strategy")
+            if strategy == budget.STRATEGY_MEMORY:
+                self.transfer_in_memory(self.src['Key'], os.path.basename(self.src['Key']),
+                                        self.source_checksum(self.src['Key']))
+            elif strategy == budget.STRATEGY_DISK:
+                self.download_object_upload()
+            else:
+                self.pipe_object()
+            return
+        
+        archive = zip_stream.S3ZipArchive(self.src_client(), self.src['Bucket'], self.src['Key'])
+        strategy = self.budget.strategy(archive.size, archive.size + archive.uncompressed_size())
+        logger.info(f"Unpacking {archive.size} bytes archive ({archive.uncompressed_size()} bytes uncompressed) "
+                    f"using {strategy} strategy")
+        if strategy == budget.STRATEGY_MEMORY:
+            self.memory_zip_upload()
+        elif strategy == budget.STRATEGY_DISK:
+            self.download_object_unpack_zip_upload()
+        else:
+            self.stream_zip_upload(archive)
+    
+    # Unpack zip archive downloaded into memory, members are uploaded straight from archive buffer
+    def memory_zip_upload(self):
+        buffer = io.BytesIO()
+        self.src_client().download_fileobj(self.src['Bucket'], self.src['Key'], buffer, Config=self.transfer_config)
+        with zipfile.ZipFile(buffer, 'r') as zip_ref:
+            members = [info for info in zip_ref.infolist() if not info.filename.endswith('/')]
+            members.sort(key=lambda x: x.file_size, reverse=True)
+            logger.info(f"Uploading {len(members)} files from memory using {self.concurrency} workers")
+            self.run_concurrently(lambda x: self.upload_memory_zip_member(zip_ref, x), members)
+    
+    def upload_memory_zip_member(self, zip_ref, info):
+        destination_key = self.destination_key(info.filename)
+        logger.info(f"{info.filename} -> s3://{self.dst['Bucket']}/{destination_key}")
+        with zip_ref.open(info) as stream:
+            extra_args, compress = self.metadata_policy.extra_args(
+                info.filename, self.content_types.from_stream(info.filename, stream))
+            self.upload_stream(stream, destination_key, extra_args, compress)
+    
+    # Copy single object within S3, under destination prefix
+    def server_side_copy_object(self):
+        size = self.src_client().head_object(Bucket=self.src['Bucket'], Key=self.src['Key'])['ContentLength']
+        self.copy_key(self.src['Key'], self.destination_key(os.path.basename(self.src['Key'])), size)
+    
+    # Copy single key using CopyObject, or UploadPartCopy when object is over CopyObject limit.
+    # Source metadata is preserved in both cases, unless overridden by metadata policy. With checksums
+    # enabled, S3 computes checksum of copied object, which is compared with source one
+    def copy_key(self, src_key, dst_key, size, listed_object=None):
+        logger.info(f"s3://{self.src['Bucket']}/{src_key} -> s3://{self.dst['Bucket']}/{dst_key}")
+        copy_args, _ = self.metadata_policy.extra_args(dst_key[len(self.destination_key('')):])
+        if size > MAX_COPY_OBJECT_SIZE:
+            value = self.multipart_copy_key(src_key, dst_key, size, self.with_source_metadata(src_key, copy_args))
+            if self.checksum_algorithm is not None:
+                self.record_checksum(dst_key, value, size)
+            return
+        if len(set(copy_args.keys()) - {'ACL'}) > 0:
+            copy_args = self.with_source_metadata(src_key, copy_args)
+            copy_args['MetadataDirective'] = 'REPLACE'
+        if self.checksum_algorithm is not None:
+            copy_args['ChecksumAlgorithm'] = self.checksum_algorithm
+        resp = self.dst_client().copy_object(CopySource={'Bucket': self.src['Bucket'], 'Key': src_key},
+                                            Bucket=self.dst['Bucket'],
+                                            Key=dst_key,
+                                            **copy_args)
+        if self.checksum_algorithm is not None:
+            self.record_checksum(dst_key, resp['CopyObjectResult'].get(checksum.field(self.checksum_algorithm)), size,
+                                 self.source_checksum(src_key, listed_object))
+    
+    # Source object metadata, overridden by given copy arguments. Needed when metadata is replaced
+    # during copy or for multipart copies, which do not copy metadata
+    def with_source_metadata(self, src_key, copy_args):
+        head = self.src_client().head_object(Bucket=self.src['Bucket'], Key=src_key)
+        merged = {}
+        for attribute in ['ContentType', 'ContentEncoding', 'ContentDisposition', 'ContentLanguage',
+                          'CacheControl', 'Metadata']:
+            if attribute in head:
+                merged[attribute] = head[attribute]
+        merged.update(copy_args)
+        return merged
+    
+    # Returns checksum of parts checksums, when checksums are enabled
+    def multipart_copy_key(self, src_key, dst_key, size, copy_args):
+        client = self.dst_client()
+        if self.checksum_algorithm is not None:
+            copy_args = dict(copy_args, ChecksumAlgorithm=self.checksum_algorithm)
+        part_size = max(COPY_PART_SIZE, -(-size // MAX_PARTS))
+        ranges = [(offset, min(offset + part_size, size) - 1) for offset in range(0, size, part_size)]
+        upload_id = client.create_multipart_upload(Bucket=self.dst['Bucket'], Key=dst_key, **copy_args)['UploadId']
+        
+        def copy_part(part):
+            part_number, (first_byte, last_byte) = part
+            resp = client.upload_part_copy(CopySource={'Bucket': self.src['Bucket'], 'Key': src_key},
+                                           CopySourceRange=f"bytes={first_byte}-{last_byte}",
+                                           Bucket=self.dst['Bucket'],
+                                           Key=dst_key,
+                                           PartNumber=part_number,
+                                           UploadId=upload_id)
+            part = {'PartNumber': part_number, 'ETag': resp['CopyPartResult']['ETag']}
+            if self.checksum_algorithm is not None:
+                checksum_field = checksum.field(self.checksum_algorithm)
+                part[checksum_field] = resp['CopyPartResult'][checksum_field]
+            return part
+        
+        logger.info(f"Copying {size} bytes in {len(ranges)} parts to s3://{self.dst['Bucket']}/{dst_key}")
+        try:
+            with ThreadPoolExecutor(max_workers=MULTIPART_CONCURRENCY) as executor:
+                parts = list(executor.map(copy_part, enumerate(ranges, start=1)))
+            resp = client.complete_multipart_upload(Bucket=self.dst['Bucket'],
+                                                    Key=dst_key,
+                                                    UploadId=upload_id,
+                                                    MultipartUpload={'Parts': parts})
+        except Exception:
+            client.abort_multipart_upload(Bucket=self.dst['Bucket'], Key=dst_key, UploadId=upload_id)
+            raise
+        if self.checksum_algorithm is not None:
+            return resp.get(checksum.field(self.checksum_algorithm))
+        return None
+    
+    # Unpack zip archive directly from S3 to destination. Archive's central directory is read
+    # with ranged GETs, and every member is streamed into its own (multipart) upload, so neither
+    # archive nor its contents are ever written to /tmp
+    def stream_zip_upload(self, archive=None):
+        if archive is None:
+            archive = zip_stream.S3ZipArchive(self.src_client(), self.src['Bucket'], self.src['Key'])
+        members = sorted(archive.files(), key=lambda x: x.file_size, reverse=True)
+        logger.info(f"Streaming {len(members)} files using {self.concurrency} workers")
+        self.run_concurrently(lambda x: self.upload_zip_member(archive, x), members)
+    
+    def upload_zip_member(self, archive, info):
+        destination_key = self.destination_key(info.filename)
+        logger.info(f"s3://{self.src['Bucket']}/{self.src['Key']}:{info.filename} -> "
+                    f"s3://{self.dst['Bucket']}/{destination_key}")
+        reader = archive.open(info)
+        try:
+            extra_args, compress = self.metadata_policy.extra_args(
+                info.filename, self.content_types.from_stream(info.filename, reader))
+            self.upload_stream(reader, destination_key, extra_args, compress)
+        finally:
+            reader.close()
+    
+    # Unpack tar archive in single pass over S3 GET body, without touching /tmp. Members up to multipart
+    # threshold are read into memory and uploaded by workers, larger ones are uploaded as they are read
+    def stream_tar_upload(self):
+        archive_type = self.archive_type or tar_stream.from_key(self.src['Key'])
+        logger.info(f"Streaming {archive_type} archive s3://{self.src['Bucket']}/{self.src['Key']} "
+                    f"using {self.concurrency} workers")
+        body = self.src_client().get_object(Bucket=self.src['Bucket'], Key=self.src['Key'])['Body']
+        with tar_stream.open_tar(body, archive_type) as tar:
+            self.run_concurrently(lambda x: self.upload_tar_member(*x), self.tar_members(tar))
+    
+    def tar_members(self, tar):
+        for member in tar:
+            name = tar_stream.member_name(member)
+            if name is None:
+                continue
+            stream = tar_stream.open_member(tar, member)
+            if member.size <= self.transfer_config.multipart_threshold:
+                yield name, io.BufferedReader(io.BytesIO(stream.read()))
+            else:
+                self.upload_tar_member(name, stream)
+    
+    def upload_tar_member(self, name, stream):
+        destination_key = self.destination_key(name)
+        logger.info(f"s3://{self.src['Bucket']}/{self.src['Key']}:{name} -> s3://{self.dst['Bucket']}/{destination_key}")
+        extra_args, compress = self.metadata_policy.extra_args(name, self.content_types.from_stream(name, stream))
+        self.upload_stream(stream, destination_key, extra_args, compress)
+    
+    # Pack source prefix into single archive object, with files in listing order. Archive is written
+    # to destination as multipart upload while sources are read, so nothing is staged in /tmp
+    def pack_prefix(self):
+        archive_type = tar_stream.from_key(self.dst['Key'])
+        name = os.path.basename(self.dst['Key'])
+        extra_args, compress = self.metadata_policy.extra_args(
+            name, self.content_types.guess(name) or content_type.DEFAULT_CONTENT_TYPE)
+        logger.info(f"Packing s3://{self.src['Bucket']}/{self.src['Prefix']} into {archive_type} archive "
+                    f"s3://{self.dst['Bucket']}/{self.dst['Key']}")
+        output = archive_writer.MultipartUploadWriter(self.dst_client(), self.dst['Bucket'], self.dst['Key'],
+                                                      self.transfer_config.multipart_chunksize, extra_args,
+                                                      MULTIPART_CONCURRENCY)
+        try:
+            archive = archive_writer.open_archive(output, archive_type)
+            packed = 0
+            for object, stream in self.pack_sources():
+                archive.add(self.relative_source_key(object['Key']), object['Size'],
+                            object['LastModified'].timestamp(), stream)
+                packed += 1
+            archive.close()
+        except Exception:
+            output.abort()
+            raise
+        logger.info(f"Packed {packed} objects into {output.tell()} bytes archive")
+    
+    # Yield source objects with streams of their content, in listing order. Objects up to multipart
+    # threshold are fetched into memory ahead by workers, larger ones are streamed from GET body once reached.
+    # Size and modification time are taken from GET response, as source manifest entries may lack or predate them
+    def pack_sources(self):
+        client = self.src_client()
+        
+        def fetch(object):
+            resp = client.get_object(Bucket=self.src['Bucket'], Key=object['Key'])
+            return resp, resp['Body'].read()
+        
+        def open_source(object, future):
+            if future is None:
+                resp = client.get_object(Bucket=self.src['Bucket'], Key=object['Key'])
+                body = resp['Body']
+            else:
+                resp, data = future.result()
+                body = io.BytesIO(data)
+            return dict(object, Size=resp['ContentLength'], LastModified=resp['LastModified']), body
+        
+        pages = pipeline.prefetch(self.source_pages(), PREFETCH_PAGES)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = collections.deque()
+            for token, page in pages:
+                for object in page:
+                    # folder placeholder objects
+                    if object['Key'].endswith('/'):
+                        continue
+                    future = None
+                    if object['Size'] <= self.transfer_config.multipart_threshold:
+                        future = executor.submit(fetch, object)
+                    pending.append((object, future))
+                    if len(pending) > self.concurrency * QUEUED_ITEMS_PER_WORKER:
+                        yield open_source(*pending.popleft())
+            while len(pending) > 0:
+                yield open_source(*pending.popleft())
+    
+    # Copy only source objects that are missing in destination or have changed since last copy,
+    # optionally removing destination objects no longer present in source. Checkpointed like full
+    # sync, removed objects are deleted and manifest is saved only once whole source is compared
+    def delta_sync(self):
+        start, resumed_keys = self.resume_position()
+        destination_prefix = self.destination_key('')
+        copy_manifest = manifest.CopyManifest(self.dst_client(), self.dst['Bucket'],
+                                              destination_prefix + manifest.MANIFEST_NAME)
+        # previous manifest also carries checksums of unchanged objects over to new one
+        if self.use_manifest or self.copied_manifest is not None:
+            copy_manifest.load()
+        
+        destination_objects = {}
+        for object in self.list_objects(self.dst['Bucket'], destination_prefix):
+            destination_objects[object['Key'][len(destination_prefix):]] = {'ETag': object['ETag'],
+                                                                           'Size': object['Size']}
+        destination_objects.pop(manifest.MANIFEST_NAME, None)
+        
+        # source is compared and transferred as it is being listed
+        source_keys = set()
+        stats = {'source': 0, 'changed': 0}
+        latest_manifest = self.copied_manifest or manifest.CopyManifest(self.dst_client(), self.dst['Bucket'],
+                                                                        copy_manifest.key)
+        track_manifest = self.use_manifest or self.copied_manifest is not None
+        # pages copied by previous invocations are listed again only when keys of whole source are needed,
+        # to find removed objects or to write manifest of whole source
+        replay = self.checkpoint is not None and (self.delete_removed or self.use_manifest)
+        
+        def changed_pages():
+            pages = pipeline.prefetch(self.source_pages(None if replay else start), PREFETCH_PAGES)
+            for position, page in pages:
+                changed_objects = []
+                for object in page:
+                    relative_key = self.relative_source_key(object['Key'])
+                    source_keys.add(relative_key)
+                    stats['source'] += 1
+                    previous = copy_manifest.get(relative_key)
+                    changed = self.is_changed(object, destination_objects.get(relative_key),
+                                              previous if self.use_manifest else None)
+                    if changed and not self.is_resumed(position, object, start, resumed_keys):
+                        stats['changed'] += 1
+                        changed_objects.append(object)
+                    elif track_manifest:
+                        # unchanged, or copied by previous invocation
+                        latest_manifest.put(relative_key, object['ETag'], object['Size'],
+                                            latest_manifest.get(relative_key) if changed else previous)
+                # replayed pages are transferred at position copy was resumed from, unless they are past it
+                yield self.replayed_position(position, start), changed_objects
+        
+        # manifest entry of changed object is recorded once it is submitted, so manifest saved with
+        # checkpoint has no entries of objects still to be copied
+        def transfer(object):
+            if track_manifest:
+                latest_manifest.put(self.relative_source_key(object['Key']), object['ETag'], object['Size'])
+            self.transfer_key(object)
+        
+        checkpoint = self.transfer_pages(changed_pages(), start, resumed_keys, transfer)
+        if checkpoint is not None:
+            return checkpoint
+        removed = [destination_prefix + key for key in destination_objects if key not in source_keys]
+        logger.info(f"Delta sync: {stats['changed']} of {stats['source']} source objects new or changed, "
+                    f"{len(removed)} destination objects removed from source")
+        
+        if self.delete_removed and len(removed) > 0:
+            self.delete_keys(removed)
+        
+        if self.use_manifest and latest_manifest is not self.copied_manifest:
+            latest_manifest.save()
+    
+    # Source object needs copying if it is missing in destination, or if its ETag/size differs
+    # from the one recorded in manifest. Without manifest entry, destination ETag/size is compared,
+    # which only matches for objects that were not uploaded in multiple parts
+    def is_changed(self, source_object, destination_object, manifest_entry):
+        if destination_object is None:
+            return True
+        if manifest_entry is not None:
+            return manifest_entry['ETag'] != source_object['ETag'] or manifest_entry['Size'] != source_object['Size']
+        return destination_object['ETag'] != source_object['ETag'] or destination_object['Size'] != source_object['Size']
+    
+    def delete_keys(self, keys):
+        self.delete_batches([{'Key': key} for key in keys[start:start + MAX_DELETE_KEYS]]
+                            for start in range(0, len(keys), MAX_DELETE_KEYS))
@@ -0,0 +1,55 @@
+import json
+import logging
+import threading
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MANIFEST_NAME = '.s3-copy-manifest.json'
+
+
+class CopyManifest:
+    """
+    Record of source objects copied to destination prefix, keyed by path relative
+    to source prefix. Stored as json object next to copied objects. Entries hold
+    source ETag and size, and checksum of copied content when checksums are enabled
+    """
+
+    def __init__(self, client, bucket, key):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self.key)['Body'].read()
+        except self.client.exceptions.NoSuchKey:
+            logger.info(f"No manifest found at s3://{self.bucket}/{self.key}")
+            return self
+        self.entries = json.loads(body.decode('utf-8'))['Objects']
+        logger.info(f"Loaded manifest s3://{self.bucket}/{self.key} with {len(self.entries)} entries")
+        return self
+
+    def save(self):
+        body = json.dumps({'Objects': self.entries}, sort_keys=True).encode('utf-8')
+        self.client.put_object(Bucket=self.bucket, Key=self.key, Body=body, ContentType='application/json')
+        logger.info(f"Saved manifest s3://{self.bucket}/{self.key} with {len(self.entries)} entries")
+
+    def get(self, relative_key):
+        return self.entries.get(relative_key)
+
+    # Entry of source object, fields of previous entry (e.g. checksum) are kept for unchanged objects
+    def put(self, relative_key, etag, size, previous=None):
+        entry = dict(previous or {})
+        entry.update({'ETag': etag, 'Size': size})
+        with self.lock:
+            self.entries[relative_key] = entry
+
+    # Checksum of copied content, size is only recorded for objects without source entry
+    def put_checksum(self, relative_key, checksum_field, value, size):
+        with self.lock:
+            entry = self.entries.setdefault(relative_key, {})
+            entry.setdefault('Size', size)
+            entry[checksum_field] = value
@@ -0,0 +1,134 @@
+import fnmatch
+import json
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_GZIP = 'gzip'
+COMPRESS_BROTLI = 'br'
+COMPRESSIONS = [COMPRESS_GZIP, COMPRESS_BROTLI]
+
+# content types worth precompressing, other types (images, archives..) are already compressed
+COMPRESSIBLE_TYPES = [
+    'application/javascript',
+    'application/json',
+    'application/manifest+json',
+    'application/wasm',
+    'application/xml',
+    'image/svg+xml',
+    'image/x-icon',
+    'font/ttf',
+    'font/otf',
+    'application/vnd.ms-fontobject',
+]
+
+# rule properties and upload ExtraArgs they map to
+RULE_ARGS = {
+    'Acl': 'ACL',
+    'CacheControl': 'CacheControl',
+    'ContentType': 'ContentType',
+    'ContentEncoding': 'ContentEncoding',
+    'ContentDisposition': 'ContentDisposition',
+}
+RULE_KEYS = ['Pattern', 'Compress'] + list(RULE_ARGS.keys())
+
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class MetadataPolicy:
+    """
+    Per-glob object metadata applied within upload requests. Rules are matched against
+    object path relative to destination prefix, all matching rules are applied in order,
+    so later rules override earlier ones. Canned ACL is applied to every object,
+    unless overridden by rule
+    """
+
+    def __init__(self, rules, canned_acl):
+        if rules is None:
+            rules = []
+        if isinstance(rules, str):
+            rules = json.loads(rules)
+        for rule in rules:
+            if 'Pattern' not in rule:
+                raise Exception(f"MetadataPolicy rule {rule} is missing Pattern")
+            unknown = [key for key in rule.keys() if key not in RULE_KEYS]
+            if len(unknown) > 0:
+                raise Exception(f"MetadataPolicy rule {rule} has unknown keys {unknown}, allowed keys are {RULE_KEYS}")
+            if 'Compress' in rule and rule['Compress'] not in COMPRESSIONS:
+                raise Exception(f"MetadataPolicy Compress must be one of {COMPRESSIONS}, got {rule['Compress']}")
+            if rule.get('Compress') == COMPRESS_BROTLI and brotli is None:
+                raise Exception("brotli package must be installed for MetadataPolicy Compress=br")
+        self.rules = rules
+        self.canned_acl = canned_acl
+
+    # Upload ExtraArgs for object, and compression to apply to its content (or None).
+    # Without content type (server side copies) compression is never applied
+    def extra_args(self, relative_key, content_type=None):
+        extra_args = {}
+        if content_type is not None:
+            extra_args['ContentType'] = content_type
+        if self.canned_acl is not None:
+            extra_args['ACL'] = self.canned_acl
+        compress = None
+        for rule in self.rules:
+            if fnmatch.fnmatch(relative_key, rule['Pattern']):
+                for rule_key, arg in RULE_ARGS.items():
+                    if rule_key in rule:
+                        extra_args[arg] = rule[rule_key]
+                if 'Compress' in rule:
+                    compress = rule['Compress']
+
+        if compress is not None and not is_compressible(extra_args.get('ContentType', '')):
+            compress = None
+        if compress is not None:
+            extra_args['ContentEncoding'] = compress
+        return extra_args, compress
+
+
+def is_compressible(content_type):
+    content_type = content_type.split(';')[0].strip()
+    return content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES
+
+
+class CompressingReader:
+    """
+    Non-seekable file object returning gzip or brotli compressed content of wrapped stream
+    """
+
+    def __init__(self, stream, compression):
+        self.stream = stream
+        if compression == COMPRESS_GZIP:
+            compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress = compressor.compress
+            self.finish = compressor.flush
+        elif compression == COMPRESS_BROTLI:
+            compressor = brotli.Compressor()
+            self.compress = compressor.process
+            self.finish = compressor.finish
+        else:
+            raise Exception(f"Compression {compression} not supported")
+        self.buffer = bytearray()
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while not self.eof and (size is None or size < 0 or len(self.buffer) < size):
+            data = self.stream.read(READ_CHUNK_SIZE)
+            if data:
+                self.buffer += self.compress(data)
+            else:
+                self.buffer += self.finish()
+                self.eof = True
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def close(self):
+        self.stream.close()
@@ -0,0 +1,102 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import traceback
+import zipfile
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# workers are started in fresh interpreters, as forking lambda process would copy locks held by
+# its other threads (transfer workers, boto3 connection pools) into child in locked state
+START_METHOD = 'spawn'
+
+
+def available_cpus():
+    """vCPUs this process may run on, lambda allocates them in proportion to configured memory"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def partition(members, workers):
+    """
+    Split archive members into per-worker shares of about equal compressed size,
+    largest members are assigned first, each to the least loaded worker. Of members with
+    duplicate names only the last one is kept, as extractall would leave it on disk
+    """
+    by_name = {}
+    for info in members:
+        by_name[info.filename] = info
+    shares = [[] for _ in range(workers)]
+    loads = [0] * workers
+    for info in sorted(by_name.values(), key=lambda x: x.compress_size, reverse=True):
+        index = loads.index(min(loads))
+        shares[index].append(info.filename)
+        loads[index] += info.compress_size
+    return [share for share in shares if len(share) > 0]
+
+
+def extract_share(zip_path, destination, names, connection):
+    """
+    Extract members into staging directory unique to worker, next to destination, and move them into
+    destination one by one. Members are sanitized by ZipFile.extract, and paths of other workers are
+    never written, so workers only share parent directories, which are created if they do not exist
+    """
+    staging = None
+    try:
+        staging = tempfile.mkdtemp(prefix='.unzip-', dir=os.path.dirname(os.path.normpath(destination)))
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            for name in names:
+                staged_path = zip_ref.extract(name, staging)
+                target = os.path.join(destination, os.path.relpath(staged_path, staging))
+                if os.path.isdir(staged_path):
+                    os.makedirs(target, exist_ok=True)
+                else:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(staged_path, target)
+        connection.send((True, len(names)))
+    except Exception:
+        connection.send((False, traceback.format_exc()))
+    finally:
+        connection.close()
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors=True)
+
+
+def extract(zip_path, destination, workers):
+    """
+    Extract zip archive the same way ZipFile.extractall does, with members inflated by
+    multiple processes. Uses Process and Pipe only, as lambda provides no /dev/shm for
+    multiprocessing Pool and Queue semaphores
+    """
+    context = multiprocessing.get_context(START_METHOD)
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        members = zip_ref.infolist()
+    shares = partition(members, max(1, workers))
+    logger.info(f"Extracting {len(members)} members of {zip_path} using {len(shares)} processes")
+    processes = []
+    for names in shares:
+        parent_connection, child_connection = context.Pipe(duplex=False)
+        process = context.Process(target=extract_share, args=(zip_path, destination, names, child_connection))
+        process.start()
+        # close parent copy of sending end, so recv fails instead of blocking if worker dies
+        child_connection.close()
+        processes.append((process, parent_connection))
+
+    errors = []
+    for process, connection in processes:
+        try:
+            ok, result = connection.recv()
+            if not ok:
+                errors.append(result)
+        except EOFError:
+            errors.append(f"Extracting process {process.pid} exited without result")
+        finally:
+            connection.close()
+            process.join()
+    if len(errors) > 0:
+        raise Exception(f"Parallel extraction of {zip_path} failed: {errors[0]}")
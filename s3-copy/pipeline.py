@@ -0,0 +1,68 @@
+import os
+import queue
+import threading
+
+# how long producer waits for free queue slot before checking if consumer went away
+PUT_TIMEOUT_SECONDS = 0.5
+
+
+class _ProducerFailure:
+    def __init__(self, exception):
+        self.exception = exception
+
+
+_END = object()
+
+
+def prefetch(iterable, size):
+    """
+    Iterate over iterable in background thread, keeping up to size items ready ahead of
+    consumer. Used to overlap S3 listing calls with transfers of already listed objects,
+    while bounding memory used by listed items. Producer failures are re-raised to consumer
+    """
+    items = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=PUT_TIMEOUT_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_END)
+        except Exception as e:
+            put(_ProducerFailure(e))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                return
+            if isinstance(item, _ProducerFailure):
+                raise item.exception
+            yield item
+    finally:
+        stopped.set()
+
+
+def walk_files(path):
+    """
+    Yield paths of all files under path, directory by directory, largest files
+    of each directory first
+    """
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        local_paths = [os.path.join(root, name) for name in files]
+        local_paths.sort(key=os.path.getsize, reverse=True)
+        for local_path in local_paths:
+            yield local_path
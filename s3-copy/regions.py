@@ -0,0 +1,50 @@
+import boto3
+import logging
+import threading
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# location constraints of buckets in us-east-1 and of legacy EU buckets are not region names
+LOCATION_REGIONS = {None: 'us-east-1', '': 'us-east-1', 'EU': 'eu-west-1'}
+REGION_HEADER = 'x-amz-bucket-region'
+
+# buckets never change region, so lookups are kept for lifetime of warm lambda container
+_regions = {}
+_lock = threading.Lock()
+_lookup_client = None
+
+
+def bucket_region(bucket):
+    """
+    Region of bucket, looked up once and cached. Falls back to region header of HEAD bucket response
+    when GetBucketLocation is not allowed, None is returned if region can not be found at all, so
+    caller uses default region and relies on redirects
+    """
+    global _lookup_client
+    # lookups are serialized, so transfer workers starting at once do not all look up same bucket
+    with _lock:
+        if bucket not in _regions:
+            if _lookup_client is None:
+                _lookup_client = boto3.client('s3')
+            _regions[bucket] = lookup_region(_lookup_client, bucket)
+        return _regions[bucket]
+
+
+def lookup_region(client, bucket):
+    try:
+        location = client.get_bucket_location(Bucket=bucket)['LocationConstraint']
+        region = LOCATION_REGIONS.get(location, location)
+    except ClientError:
+        try:
+            headers = client.head_bucket(Bucket=bucket)['ResponseMetadata']['HTTPHeaders']
+        except ClientError as e:
+            # redirects and access denied responses carry region header as well
+            headers = e.response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+        region = headers.get(REGION_HEADER)
+    if region is None:
+        logger.info(f"Region of bucket {bucket} is unknown, using default region")
+    else:
+        logger.info(f"Bucket {bucket} is in {region}")
+    return region
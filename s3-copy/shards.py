@@ -0,0 +1,117 @@
+import boto3
+import json
+import logging
+import regions
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+SHARDS_NAME = 'shards.json'
+TOP_LEVEL_KEYS_NAME = 'top-level-keys.txt'
+COMPLETED_PREFIX = 'completed/'
+RESPONSE_NAME = 'response.json'
+# conditional put header, added to request as botocore bundled with python3.6 runtime lacks IfNoneMatch parameter
+CONDITIONAL_PUT_HEADER = 'If-None-Match'
+# completed shards are counted from single listing page
+MAX_SHARDS = 1000
+
+
+class ShardState:
+    """
+    State of sharded prefix copy shared by coordinator and worker invocations, stored as objects
+    under S3 prefix: shard definitions, completion marker of every shard, and response marker.
+    Response marker is created with conditional put, so exactly one invocation responds to
+    CloudFormation, either last completed shard or first failed one
+    """
+
+    def __init__(self, bucket, prefix):
+        self.client = boto3.client('s3', region_name=regions.bucket_region(bucket))
+        self.bucket = bucket
+        self.prefix = prefix
+        self._claim_client = None
+
+    def key(self, name):
+        return self.prefix + name
+
+    def put(self, name, body):
+        self.client.put_object(Bucket=self.bucket, Key=self.key(name), Body=body.encode('utf-8'))
+
+    # Split source prefix into at most count shards of its sub-prefixes, found with delimiter listing.
+    # Objects directly under source prefix are copied by first shard, from key list saved with state.
+    # Source is listed in its own region, which may differ from region of state bucket
+    def split(self, src, count):
+        count = max(1, min(count, MAX_SHARDS))
+        prefixes = []
+        keys = []
+        src_client = boto3.client('s3', region_name=regions.bucket_region(src['Bucket']))
+        list_args = {'Bucket': src['Bucket'], 'Prefix': src['Prefix'], 'Delimiter': '/'}
+        while True:
+            resp = src_client.list_objects_v2(**list_args)
+            prefixes += [x['Prefix'] for x in resp.get('CommonPrefixes', [])]
+            keys += [x['Key'] for x in resp.get('Contents', [])]
+            if not resp['IsTruncated']:
+                break
+            list_args['ContinuationToken'] = resp['NextContinuationToken']
+        shards = [prefixes[index::count] for index in range(count)]
+        shards = [{'Prefixes': shard} for shard in shards if len(shard) > 0] or [{'Prefixes': []}]
+        if len(keys) > 0:
+            self.put(TOP_LEVEL_KEYS_NAME, '\n'.join(keys))
+            shards[0]['TopLevelKeys'] = True
+        self.put(SHARDS_NAME, json.dumps({'Shards': shards}))
+        logger.info(f"Split s3://{src['Bucket']}/{src['Prefix']} into {len(shards)} shards of {len(prefixes)} "
+                    f"prefixes, {len(keys)} top level objects")
+        return shards
+
+    def load_shards(self):
+        body = self.client.get_object(Bucket=self.bucket, Key=self.key(SHARDS_NAME))['Body'].read()
+        return json.loads(body.decode('utf-8'))['Shards']
+
+    def top_level_keys_manifest(self):
+        return {'Bucket': self.bucket, 'Key': self.key(TOP_LEVEL_KEYS_NAME)}
+
+    # Mark shard completed, returns True once all shards are completed
+    def complete(self, index, count):
+        self.put(f"{COMPLETED_PREFIX}{index}", '')
+        resp = self.client.list_objects_v2(Bucket=self.bucket, Prefix=self.key(COMPLETED_PREFIX))
+        completed = resp.get('KeyCount', 0)
+        logger.info(f"Shard {index} completed, {completed} of {count} shards done")
+        return completed >= count
+
+    # Create response marker, returns False if other invocation has already claimed response
+    def claim_response(self, status, reason=None):
+        body = json.dumps({'Status': status, 'Reason': reason}).encode('utf-8')
+        try:
+            self.claim_client().put_object(Bucket=self.bucket, Key=self.key(RESPONSE_NAME), Body=body)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'PreconditionFailed':
+                raise
+            logger.info("Response of sharded copy already sent by other shard")
+            return False
+
+    # Client of state bucket whose puts only create objects that do not exist yet
+    def claim_client(self):
+        if self._claim_client is None:
+            self._claim_client = boto3.client('s3', region_name=regions.bucket_region(self.bucket))
+            self._claim_client.meta.events.register('before-sign.s3.PutObject', add_conditional_put_header)
+        return self._claim_client
+
+    def is_responded(self):
+        resp = self.client.list_objects_v2(Bucket=self.bucket, Prefix=self.key(RESPONSE_NAME))
+        return resp.get('KeyCount', 0) > 0
+
+    # Remove state once all shards are completed and no invocation reads it anymore. Failed copy keeps
+    # its response marker, so shards still running stop instead of claiming response once more
+    def clean(self, keep_response=False):
+        while True:
+            resp = self.client.list_objects_v2(Bucket=self.bucket, Prefix=self.prefix)
+            objects = [{'Key': x['Key']} for x in resp.get('Contents', [])
+                       if not keep_response or x['Key'] != self.key(RESPONSE_NAME)]
+            if len(objects) == 0:
+                return
+            self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': objects, 'Quiet': True})
+
+
+def add_conditional_put_header(request, **kwargs):
+    request.headers[CONDITIONAL_PUT_HEADER] = '*'
@@ -0,0 +1,157 @@
+import csv
+import gzip
+import json
+import logging
+from urllib.parse import unquote_plus
+import zip_stream
+
+try:
+    import pyarrow.parquet as parquet
+except ImportError:
+    parquet = None
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# objects per page fed to transfer pipeline, same as list_objects_v2 page
+PAGE_SIZE = 1000
+READ_CHUNK_SIZE = 256 * 1024
+INVENTORY_MANIFEST_NAME = 'manifest.json'
+# columns of inventory csv files not described by inventory manifest
+DEFAULT_CSV_SCHEMA = ['Bucket', 'Key', 'Size']
+PARQUET_COLUMNS = ['bucket', 'key', 'size', 'e_tag', 'is_latest', 'is_delete_marker']
+
+
+def iter_lines(stream):
+    """Decoded lines of binary stream, read in chunks"""
+    pending = b''
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8').rstrip('\r')
+    if pending:
+        yield pending.decode('utf-8').rstrip('\r')
+
+
+def check_parquet_supported():
+    if parquet is None:
+        raise Exception("pyarrow package must be installed to read Parquet inventory")
+
+
+class SourceManifest:
+    """
+    List of source objects read from S3 instead of listing source bucket. Either S3 Inventory
+    report (its manifest.json, or single csv, csv.gz or parquet data file), or newline delimited
+    list of keys. Manifest is streamed, objects are yielded as dicts with Key, and Size and ETag
+    where manifest has them. Inventory data files may be delivered to other bucket than manifest,
+    so S3 client is looked up by bucket with given s3_client function
+    """
+
+    def __init__(self, s3_client, bucket, key):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        if key.endswith('.parquet'):
+            check_parquet_supported()
+
+    # Yield (offset, objects) pages of objects under prefix of given bucket, starting at offset of
+    # manifest entries, so copy checkpointed at page can be resumed. Offset of first page is None
+    def pages(self, bucket, prefix, start=None):
+        offset = start or 0
+        page_offset = offset
+        page = []
+        for index, object in enumerate(self.entries(bucket)):
+            if index < offset:
+                continue
+            if len(page) == 0:
+                page_offset = index
+            if object['Key'].startswith(prefix):
+                page.append(object)
+            if len(page) == PAGE_SIZE:
+                yield page_offset or None, page
+                page = []
+        if len(page) > 0:
+            yield page_offset or None, page
+
+    # All entries of manifest for given bucket, in manifest order
+    def entries(self, bucket):
+        logger.info(f"Reading source manifest s3://{self.bucket}/{self.key}")
+        if self.key.endswith(INVENTORY_MANIFEST_NAME):
+            return self.inventory_entries(bucket)
+        if self.key.endswith('.parquet'):
+            return self.parquet_entries(self.bucket, self.key, bucket)
+        if self.key.endswith('.csv') or self.key.endswith('.csv.gz'):
+            return self.csv_entries(self.bucket, self.key, bucket, DEFAULT_CSV_SCHEMA)
+        return self.key_list_entries()
+
+    def key_list_entries(self):
+        body = self.s3_client(self.bucket).get_object(Bucket=self.bucket, Key=self.key)['Body']
+        for line in iter_lines(body):
+            if line.strip() != '':
+                yield {'Key': line}
+
+    # Data files listed by inventory manifest, in order. Inventory is delivered to bucket named by its ARN
+    def inventory_entries(self, bucket):
+        inventory = json.loads(self.s3_client(self.bucket).get_object(Bucket=self.bucket, Key=self.key)['Body'].read())
+        files_bucket = inventory.get('destinationBucket', self.bucket).split(':')[-1]
+        file_format = inventory['fileFormat'].lower()
+        schema = [column.strip() for column in inventory['fileSchema'].split(',')]
+        logger.info(f"Inventory of s3://{inventory.get('sourceBucket')} with {len(inventory['files'])} "
+                    f"{file_format} files")
+        # unsupported format fails before any data file is read
+        if file_format == 'parquet':
+            check_parquet_supported()
+        for data_file in inventory['files']:
+            if file_format == 'csv':
+                entries = self.csv_entries(files_bucket, data_file['key'], bucket, schema)
+            elif file_format == 'parquet':
+                entries = self.parquet_entries(files_bucket, data_file['key'], bucket)
+            else:
+                raise Exception(f"Inventory format {inventory['fileFormat']} is not supported, use CSV or Parquet")
+            for entry in entries:
+                yield entry
+
+    # Inventory csv rows, keys are url encoded and files are usually gzip compressed
+    def csv_entries(self, files_bucket, key, bucket, schema):
+        stream = self.s3_client(files_bucket).get_object(Bucket=files_bucket, Key=key)['Body']
+        if key.endswith('.gz'):
+            stream = gzip.GzipFile(fileobj=stream)
+        for row in csv.reader(iter_lines(stream)):
+            values = dict(zip(schema, row))
+            entry = self.inventory_entry(bucket, values.get('Bucket'), unquote_plus(values['Key']),
+                                         values.get('Size'), values.get('ETag'),
+                                         values.get('IsLatest'), values.get('IsDeleteMarker'))
+            if entry is not None:
+                yield entry
+
+    # Parquet data file read in row batches, with ranged GETs as parquet needs seekable file
+    def parquet_entries(self, files_bucket, key, bucket):
+        check_parquet_supported()
+        client = self.s3_client(files_bucket)
+        size = client.head_object(Bucket=files_bucket, Key=key)['ContentLength']
+        parquet_file = parquet.ParquetFile(zip_stream.S3RangeReader(client, files_bucket, key, size))
+        columns = [x for x in PARQUET_COLUMNS if x in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(columns=columns):
+            for values in batch.to_pylist():
+                entry = self.inventory_entry(bucket, values.get('bucket'), values['key'], values.get('size'),
+                                             values.get('e_tag'), values.get('is_latest'),
+                                             values.get('is_delete_marker'))
+                if entry is not None:
+                    yield entry
+
+    # Object entry of inventory row, or None for rows of other buckets, noncurrent versions and delete markers
+    def inventory_entry(self, bucket, row_bucket, key, size, etag, is_latest, is_delete_marker):
+        if row_bucket is not None and row_bucket != bucket:
+            return None
+        if str(is_latest).lower() == 'false' or str(is_delete_marker).lower() == 'true':
+            return None
+        entry = {'Key': key}
+        if size is not None and size != '':
+            entry['Size'] = int(size)
+        if etag:
+            entry['ETag'] = f'"{etag}"'
+        return entry
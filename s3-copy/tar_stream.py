@@ -0,0 +1,136 @@
+import io
+import posixpath
+import tarfile
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_ZIP = 'zip'
+ARCHIVE_TAR = 'tar'
+ARCHIVE_TAR_GZ = 'tar.gz'
+ARCHIVE_TAR_ZST = 'tar.zst'
+ARCHIVE_TYPES = [ARCHIVE_ZIP, ARCHIVE_TAR, ARCHIVE_TAR_GZ, ARCHIVE_TAR_ZST]
+ARCHIVE_AUTO = 'auto'
+TAR_TYPES = [ARCHIVE_TAR, ARCHIVE_TAR_GZ, ARCHIVE_TAR_ZST]
+
+# longest suffixes first, so .tar.gz is not taken for plain .gz
+EXTENSIONS = [
+    ('.tar.gz', ARCHIVE_TAR_GZ),
+    ('.tgz', ARCHIVE_TAR_GZ),
+    ('.tar.zst', ARCHIVE_TAR_ZST),
+    ('.tzst', ARCHIVE_TAR_ZST),
+    ('.tar', ARCHIVE_TAR),
+    ('.zip', ARCHIVE_ZIP),
+]
+
+# compressed bytes fetched to sniff archive type, enough to decompress first tar header. zstd
+# decompresses whole blocks only, which are up to 128KB
+SNIFF_SIZE = 132 * 1024
+TAR_HEADER_SIZE = 512
+TAR_MAGIC_OFFSET = 257
+TAR_MAGIC = b'ustar'
+ZIP_MAGIC = b'PK\x03\x04'
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def from_key(key):
+    """Archive type by key extension, or None for keys of other objects"""
+    lower_key = key.lower()
+    for extension, archive_type in EXTENSIONS:
+        if lower_key.endswith(extension):
+            return archive_type
+    return None
+
+
+def is_tar_header(header):
+    return header[TAR_MAGIC_OFFSET:TAR_MAGIC_OFFSET + len(TAR_MAGIC)] == TAR_MAGIC
+
+
+def sniff(header):
+    """
+    Archive type from leading bytes of object, or None if it is not an archive. Compressed
+    streams are inflated just enough to check they hold tar archive, not single compressed file
+    """
+    if header.startswith(ZIP_MAGIC):
+        return ARCHIVE_ZIP
+    if is_tar_header(header):
+        return ARCHIVE_TAR
+    if header.startswith(GZIP_MAGIC):
+        try:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if is_tar_header(decompressor.decompress(header, TAR_HEADER_SIZE)):
+                return ARCHIVE_TAR_GZ
+        except zlib.error:
+            return None
+    if header.startswith(ZSTD_MAGIC):
+        check_supported(ARCHIVE_TAR_ZST)
+        try:
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+            if is_tar_header(decompressor.decompress(header)):
+                return ARCHIVE_TAR_ZST
+        except zstandard.ZstdError:
+            return None
+    return None
+
+
+def check_supported(archive_type):
+    """Fails for archive types whose compression package is not installed, see requirements-optional.txt"""
+    if archive_type == ARCHIVE_TAR_ZST and zstandard is None:
+        raise Exception("zstandard package must be installed for tar.zst archives")
+
+
+def open_tar(stream, archive_type):
+    """
+    Open tar archive for single forward pass over non-seekable stream, e.g. S3 GET body.
+    Members must be read in archive order, each one before moving to the next
+    """
+    if archive_type == ARCHIVE_TAR:
+        return tarfile.open(fileobj=stream, mode='r|')
+    if archive_type == ARCHIVE_TAR_GZ:
+        return tarfile.open(fileobj=stream, mode='r|gz')
+    if archive_type == ARCHIVE_TAR_ZST:
+        check_supported(archive_type)
+        # archives written by parallel compressors consist of multiple frames
+        reader = zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+        return tarfile.open(fileobj=reader, mode='r|')
+    raise Exception(f"Archive type must be one of {TAR_TYPES}, got {archive_type}")
+
+
+def member_name(member):
+    """
+    Path of regular file member relative to archive root, or None for directories, links,
+    devices and members pointing outside of archive root
+    """
+    if not member.isfile():
+        return None
+    name = posixpath.normpath(member.name).lstrip('/')
+    if name == '.' or name == '..' or name.startswith('../'):
+        return None
+    return name
+
+
+class MemberReader(io.RawIOBase):
+    """
+    Non-seekable reader of tar member data. Member file objects of tar archives opened in
+    stream mode fail when asked whether they are seekable, as transfer manager does
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def open_member(tar, member):
+    """Buffered reader of member data, supporting peek for content type sniffing"""
+    return io.BufferedReader(MemberReader(tar.extractfile(member)))
@@ -0,0 +1,206 @@
+import logging
+import struct
+import zipfile
+import zlib
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MIN_RANGE_SIZE = 64 * 1024
+READ_CHUNK_SIZE = 256 * 1024
+
+# local file header field positions, see zipfile.structFileHeader
+LOCAL_HEADER_SIGNATURE = 0
+LOCAL_HEADER_FILENAME_LENGTH = 10
+LOCAL_HEADER_EXTRA_LENGTH = 11
+
+
+class S3RangeReader:
+    """
+    Read-only, seekable file object over S3 object. Every read not served from
+    last fetched range issues ranged GET request, so zipfile can read archive
+    central directory without downloading whole archive
+    """
+
+    def __init__(self, client, bucket, key, size):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.position = 0
+        self.buffer = b''
+        self.buffer_start = 0
+        self.requests = 0
+        self.closed = False
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self.position = offset
+        elif whence == 1:
+            self.position += offset
+        elif whence == 2:
+            self.position = self.size + offset
+        self.position = max(0, min(self.position, self.size))
+        return self.position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.position
+        size = min(size, self.size - self.position)
+        if size <= 0:
+            return b''
+        buffer_end = self.buffer_start + len(self.buffer)
+        if not (self.buffer_start <= self.position and self.position + size <= buffer_end):
+            self.fetch(self.position, max(size, MIN_RANGE_SIZE))
+        offset = self.position - self.buffer_start
+        data = self.buffer[offset:offset + size]
+        self.position += len(data)
+        return data
+
+    def fetch(self, start, length):
+        end = min(start + length, self.size) - 1
+        resp = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end}")
+        self.buffer = resp['Body'].read()
+        self.buffer_start = start
+        self.requests += 1
+
+    def close(self):
+        self.buffer = b''
+        self.closed = True
+
+
+class ZipMemberReader:
+    """
+    Non-seekable file object streaming single zip member from S3. Member's local header
+    and compressed data are read with single ranged GET and inflated as they are consumed.
+    CRC and size are verified once member is read to the end
+    """
+
+    def __init__(self, client, bucket, key, info, range_end):
+        if info.flag_bits & 0x1:
+            raise Exception(f"{info.filename}: encrypted zip members are not supported")
+        if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise Exception(f"{info.filename}: compression type {info.compress_type} not supported in streaming mode")
+        self.info = info
+        resp = client.get_object(Bucket=bucket, Key=key, Range=f"bytes={info.header_offset}-{range_end}")
+        self.body = resp['Body']
+        self.skip_local_header()
+        self.compressed_left = info.compress_size
+        self.decompressor = zlib.decompressobj(-15) if info.compress_type == zipfile.ZIP_DEFLATED else None
+        # bytearray is appended to and consumed from front in place, without copying whole buffer
+        self.buffer = bytearray()
+        self.crc = 0
+        self.bytes_read = 0
+        self.eof = False
+
+    def skip_local_header(self):
+        header = self.read_body(zipfile.sizeFileHeader)
+        fields = struct.unpack(zipfile.structFileHeader, header)
+        if fields[LOCAL_HEADER_SIGNATURE] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f"{self.info.filename}: bad local file header")
+        self.read_body(fields[LOCAL_HEADER_FILENAME_LENGTH] + fields[LOCAL_HEADER_EXTRA_LENGTH])
+
+    def read_body(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.body.read(size - len(data))
+            if not chunk:
+                raise zipfile.BadZipFile(f"{self.info.filename}: unexpected end of archive")
+            data += chunk
+        return data
+
+    def readable(self):
+        return True
+
+    def next_chunk(self):
+        if self.decompressor is not None and self.decompressor.unconsumed_tail:
+            return self.decompressor.decompress(self.decompressor.unconsumed_tail, READ_CHUNK_SIZE)
+        if self.compressed_left == 0:
+            return self.decompressor.flush() if self.decompressor is not None else b''
+        data = self.body.read(min(READ_CHUNK_SIZE, self.compressed_left))
+        if not data:
+            raise zipfile.BadZipFile(f"{self.info.filename}: unexpected end of archive")
+        self.compressed_left -= len(data)
+        if self.decompressor is None:
+            return data
+        return self.decompressor.decompress(data, READ_CHUNK_SIZE)
+
+    def fill(self, size):
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            chunk = self.next_chunk()
+            if chunk:
+                self.crc = zlib.crc32(chunk, self.crc)
+                self.bytes_read += len(chunk)
+                self.buffer += chunk
+            elif self.compressed_left == 0 and (self.decompressor is None or not self.decompressor.unconsumed_tail):
+                self.eof = True
+                self.verify()
+
+    def peek(self, size):
+        self.fill(size)
+        return bytes(self.buffer[:size])
+
+    def read(self, size=-1):
+        self.fill(size if size is not None else -1)
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def verify(self):
+        if self.bytes_read != self.info.file_size:
+            raise zipfile.BadZipFile(f"{self.info.filename}: expected {self.info.file_size} bytes, "
+                                     f"got {self.bytes_read}")
+        if self.crc != self.info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {self.info.filename}")
+
+    def close(self):
+        self.body.close()
+
+
+class S3ZipArchive:
+    """
+    Zip archive stored in S3, read without downloading it. Central directory is read
+    with ranged GETs, members are streamed through ZipMemberReader
+    """
+
+    def __init__(self, client, bucket, key):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = client.head_object(Bucket=bucket, Key=key)['ContentLength']
+        reader = S3RangeReader(client, bucket, key, self.size)
+        with zipfile.ZipFile(reader, 'r') as zip_ref:
+            self.members = sorted(zip_ref.infolist(), key=lambda x: x.header_offset)
+            central_directory_start = zip_ref.start_dir
+        logger.info(f"Read central directory of s3://{bucket}/{key} with {len(self.members)} members "
+                    f"in {reader.requests} requests")
+
+        # member's data spans up to next member's local header, or to central directory
+        self.range_ends = {}
+        for index, info in enumerate(self.members):
+            if index + 1 < len(self.members):
+                next_offset = self.members[index + 1].header_offset
+            else:
+                next_offset = central_directory_start
+            self.range_ends[info.header_offset] = next_offset - 1
+
+    # Files in archive, directories entries are omitted
+    def files(self):
+        return [info for info in self.members if not info.filename.endswith('/')]
+
+    def uncompressed_size(self):
+        return sum(map(lambda x: x.file_size, self.members))
+
+    def open(self, info):
+        return ZipMemberReader(self.client, self.bucket, self.key, info, self.range_ends[info.header_offset])
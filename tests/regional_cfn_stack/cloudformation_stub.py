@@ -0,0 +1,122 @@
+"""CloudFormation client stand-in serving scripted stack events"""
+import datetime
+
+from botocore.exceptions import ClientError
+
+START = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+STACK_TYPE = 'AWS::CloudFormation::Stack'
+
+
+class CloudFormationStub:
+    """
+    Stack events are added in chronological order, one second apart, and listed newest
+    first in pages of page_size events, as describe_stack_events does. Stacks created and
+    updated through it complete at once. S3 HEAD requests return ETags of templates, so
+    same stand-in serves both clients
+    """
+
+    def __init__(self, page_size=100):
+        self.page_size = page_size
+        self.events = {}
+        self.clock = 0
+        # stack id => parameters, capabilities, tags and template ETag of stack
+        self.details = {}
+        # (bucket, key) => ETag of template
+        self.templates = {}
+        # requests of create_stack, update_stack and delete_stack calls, in order
+        self.requests = []
+
+    def stack_id(self, name):
+        return f"arn:aws:cloudformation:us-east-1:123456789012:stack/{name}/id"
+
+    def add(self, stack, logical_id, status, reason='', resource_type='AWS::S3::Bucket', physical_id=None):
+        stack_id = self.stack_id(stack)
+        if physical_id is None:
+            physical_id = stack_id if logical_id == stack else f"{logical_id.lower()}-physical-id"
+        self.clock += 1
+        events = self.events.setdefault(stack_id, [])
+        events.append({
+            'EventId': f"{stack_id}-{len(events)}",
+            'StackId': stack_id,
+            'StackName': stack,
+            'LogicalResourceId': logical_id,
+            'PhysicalResourceId': physical_id,
+            'ResourceType': STACK_TYPE if physical_id == stack_id else resource_type,
+            'ResourceStatus': status,
+            'ResourceStatusReason': reason,
+            'Timestamp': START + datetime.timedelta(seconds=self.clock)
+        })
+
+    def add_stack(self, stack, status, reason=''):
+        self.add(stack, stack, status, reason)
+
+    def add_nested_stack(self, stack, logical_id, nested_stack, status, reason=''):
+        self.add(stack, logical_id, status, reason, STACK_TYPE, self.stack_id(nested_stack))
+
+    def describe_stack_events(self, StackName, NextToken=None):
+        events = list(reversed(self.events[StackName]))
+        start = int(NextToken or 0)
+        resp = {'StackEvents': events[start:start + self.page_size]}
+        if start + self.page_size < len(events):
+            resp['NextToken'] = str(start + self.page_size)
+        return resp
+
+    def describe_stacks(self, StackName):
+        stack_id = StackName if StackName.startswith('arn:') else self.stack_id(StackName)
+        if stack_id not in self.events:
+            raise ClientError({'Error': {'Code': 'ValidationError',
+                                         'Message': f"Stack with id {StackName} does not exist"}}, 'DescribeStacks')
+        stack_events = [x for x in self.events[stack_id] if x['PhysicalResourceId'] == stack_id]
+        details = dict(self.details.get(stack_id, {}), StackId=stack_id, StackName=stack_events[-1]['StackName'],
+                       StackStatus=stack_events[-1]['ResourceStatus'])
+        details.pop('TemplateETag', None)
+        return {'Stacks': [details]}
+
+    def put_template(self, bucket, key, etag):
+        self.templates[(bucket, key)] = etag
+        return f"https://{bucket}.s3.amazonaws.com/{key}"
+
+    def head_object(self, Bucket, Key, **kwargs):
+        return {'ETag': self.templates[(Bucket, Key)]}
+
+    def template_etag(self, url):
+        bucket, key = url[len('https://'):].split('.s3.amazonaws.com/')
+        return self.templates[(bucket, key)]
+
+    def add_deployed_stack(self, name, url, parameters, tags=(), status='CREATE_COMPLETE'):
+        """Stack deployed before test, e.g. by earlier version of handler"""
+        self.details[self.stack_id(name)] = {
+            'Parameters': [{'ParameterKey': k, 'ParameterValue': v} for k, v in parameters.items()],
+            'Capabilities': ['CAPABILITY_IAM'],
+            'Tags': list(tags),
+            'TemplateETag': self.template_etag(url)
+        }
+        self.add_stack(name, 'CREATE_IN_PROGRESS', 'User Initiated')
+        self.add_stack(name, status)
+
+    def create_stack(self, StackName, TemplateURL, Parameters, Capabilities, OnFailure, Tags):
+        self.requests.append(('create', StackName, Tags))
+        self.details[self.stack_id(StackName)] = {'Parameters': Parameters, 'Capabilities': Capabilities,
+                                                  'Tags': Tags, 'TemplateETag': self.template_etag(TemplateURL)}
+        self.add_stack(StackName, 'CREATE_IN_PROGRESS', 'User Initiated')
+        self.add_stack(StackName, 'CREATE_COMPLETE')
+        return {'StackId': self.stack_id(StackName)}
+
+    def update_stack(self, StackName, TemplateURL, Parameters, Capabilities, Tags):
+        details = {'Parameters': Parameters, 'Capabilities': Capabilities, 'Tags': Tags,
+                   'TemplateETag': self.template_etag(TemplateURL)}
+        if self.details[StackName] == details:
+            raise ClientError({'Error': {'Code': 'ValidationError', 'Message': 'No updates are to be performed.'}},
+                              'UpdateStack')
+        self.requests.append(('update', StackName, Tags))
+        self.details[StackName] = details
+        name = self.events[StackName][0]['StackName']
+        self.add_stack(name, 'UPDATE_IN_PROGRESS', 'User Initiated')
+        self.add_stack(name, 'UPDATE_COMPLETE')
+        return {'StackId': StackName}
+
+    def delete_stack(self, StackName):
+        name = self.events[StackName][0]['StackName']
+        self.requests.append(('delete', name, None))
+        self.add_stack(name, 'DELETE_IN_PROGRESS', 'User Initiated')
+        self.add_stack(name, 'DELETE_COMPLETE')
@@ -0,0 +1,96 @@
+"""
+Fixtures of regional-cfn-stack tests. Stack events are served by scripted CloudFormation
+stand-in, as failure timelines can not be produced by moto.
+
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+
+import pytest
+
+from cloudformation_stub import CloudFormationStub
+
+STACK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))),
+                         'regional-cfn-stack')
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('LAMBDA_TASK_ROOT', STACK_DIR)
+sys.path.append(STACK_DIR)
+
+# modules of lambda functions sharing names, tests of all functions run in single session
+LAMBDA_MODULES = ['handler', 'cr_response', 'lambda_invoker']
+
+
+@pytest.fixture
+def cloudformation(monkeypatch):
+    import stack_manage
+    stub = CloudFormationStub()
+    monkeypatch.setattr(stack_manage.boto3, 'client', lambda service, region_name=None, **kwargs: stub)
+    return stub
+
+
+@pytest.fixture
+def regional_cloudformation(cloudformation, monkeypatch):
+    """
+    CloudFormation stand-in of every region, by region. Stand-ins are created on first use, or can be
+    added by test beforehand. Templates put to stand-in of default region are known to all of them
+    """
+    import stack_manage
+    stubs = {}
+
+    def client(service, region_name=None, **kwargs):
+        if service != 'cloudformation':
+            return cloudformation
+        if region_name not in stubs:
+            stubs[region_name] = CloudFormationStub()
+            stubs[region_name].templates = cloudformation.templates
+        return stubs[region_name]
+
+    monkeypatch.setattr(stack_manage.boto3, 'client', client)
+    return stubs
+
+
+class LambdaContext:
+    def get_remaining_time_in_millis(self):
+        return 900 * 1000
+
+
+@pytest.fixture
+def lambda_modules(monkeypatch):
+    """Lambda modules are imported from regional-cfn-stack, rather than from function imported by earlier tests"""
+    for name in LAMBDA_MODULES:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    monkeypatch.syspath_prepend(STACK_DIR)
+
+
+@pytest.fixture
+def run_handler(cloudformation, monkeypatch, lambda_modules):
+    """
+    Runs handler for CloudFormation request event, and then for every event handler invoked lambda with, until
+    there are none left. Returns responses sent to CloudFormation
+    """
+    import cr_response
+    import handler
+    import lambda_invoker
+    import region_fan_out
+    import stack_manage
+
+    invoked = []
+    responses = []
+    monkeypatch.setattr(lambda_invoker.LambdaInvoker, 'invoke', lambda self, payload: invoked.append(payload))
+    monkeypatch.setattr(cr_response.CustomResourceResponse, 'respond',
+                        lambda self: responses.append(dict(self.response)))
+    # stand-in stacks complete at once, there is nothing to wait for
+    monkeypatch.setattr(stack_manage.time, 'sleep', lambda seconds: None)
+    monkeypatch.setattr(region_fan_out.time, 'sleep', lambda seconds: None)
+
+    def run(event):
+        invoked.append(event)
+        while len(invoked) > 0:
+            # payload is serialized as lambda would, so state is never shared between invocations
+            handler.lambda_handler(json.loads(json.dumps(invoked.pop(0))), LambdaContext())
+        return responses
+
+    return run
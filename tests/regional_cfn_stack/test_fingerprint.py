@@ -0,0 +1,82 @@
+import stack_manage
+
+STACK = 'regional'
+
+
+def stack_event(cloudformation, request_type, url, old_url=None, **parameters):
+    event = {
+        'RequestType': request_type,
+        'RequestId': 'request-id',
+        'StackId': 'arn:aws:cloudformation:us-east-1:123456789012:stack/parent/id',
+        'LogicalResourceId': 'RegionalStack',
+        'ResponseURL': 'https://cloudformation-custom-resource-response.example.com/',
+        'ResourceProperties': dict({'StackName': STACK, 'Region': 'us-east-1', 'TemplateUrl': url},
+                                   **{f"StackParam_{k}": v for k, v in parameters.items()})
+    }
+    if request_type != 'Create':
+        event['PhysicalResourceId'] = cloudformation.stack_id(STACK)
+        event['OldResourceProperties'] = dict(event['ResourceProperties'], TemplateUrl=old_url or url)
+    return event
+
+
+def fingerprint_tag(cloudformation):
+    tags = cloudformation.details[cloudformation.stack_id(STACK)]['Tags']
+    return [x['Value'] for x in tags if x['Key'] == stack_manage.FINGERPRINT_TAG]
+
+
+def test_unchanged_stack_is_not_updated_again(cloudformation, run_handler):
+    url = cloudformation.put_template('templates', 'stack.yaml', '"v1"')
+    run_handler(stack_event(cloudformation, 'Create', url, Env='prod'))
+
+    responses = run_handler(stack_event(cloudformation, 'Update', url, Env='prod'))
+
+    assert [x['Status'] for x in responses] == ['SUCCESS', 'SUCCESS']
+    assert [x[0] for x in cloudformation.requests] == ['create']
+    assert len(fingerprint_tag(cloudformation)) == 1
+
+
+def test_changed_parameters_update_stack_and_its_fingerprint(cloudformation, run_handler):
+    url = cloudformation.put_template('templates', 'stack.yaml', '"v1"')
+    run_handler(stack_event(cloudformation, 'Create', url, Env='prod'))
+    created_fingerprint = fingerprint_tag(cloudformation)
+
+    run_handler(stack_event(cloudformation, 'Update', url, Env='test'))
+
+    assert [x[0] for x in cloudformation.requests] == ['create', 'update']
+    assert fingerprint_tag(cloudformation) != created_fingerprint
+
+
+def test_unchanged_stack_without_fingerprint_keeps_its_tags(cloudformation, run_handler):
+    url = cloudformation.put_template('templates', 'stack.yaml', '"v1"')
+    cloudformation.add_deployed_stack(STACK, url, {'Env': 'prod'}, [{'Key': 'Team', 'Value': 'platform'}])
+
+    responses = run_handler(stack_event(cloudformation, 'Update', url, Env='prod'))
+
+    assert [x['Status'] for x in responses] == ['SUCCESS']
+    # update_stack without fingerprint tag had nothing to change
+    assert cloudformation.requests == []
+    assert fingerprint_tag(cloudformation) == []
+
+
+def test_stack_without_fingerprint_is_tagged_by_update_changing_parameters(cloudformation, run_handler):
+    url = cloudformation.put_template('templates', 'stack.yaml', '"v1"')
+    cloudformation.add_deployed_stack(STACK, url, {'Env': 'prod'}, [{'Key': 'Team', 'Value': 'platform'}])
+
+    run_handler(stack_event(cloudformation, 'Update', url, Env='test'))
+    responses = run_handler(stack_event(cloudformation, 'Update', url, Env='test'))
+
+    assert [x['Status'] for x in responses] == ['SUCCESS', 'SUCCESS']
+    assert [x[0] for x in cloudformation.requests] == ['update']
+    assert {'Key': 'Team', 'Value': 'platform'} in cloudformation.requests[0][2]
+    assert len(fingerprint_tag(cloudformation)) == 1
+
+
+def test_stack_without_fingerprint_is_tagged_by_update_changing_template(cloudformation, run_handler):
+    old_url = cloudformation.put_template('templates', 'stack-v1.yaml', '"v1"')
+    url = cloudformation.put_template('templates', 'stack-v2.yaml', '"v2"')
+    cloudformation.add_deployed_stack(STACK, old_url, {'Env': 'prod'})
+
+    run_handler(stack_event(cloudformation, 'Update', url, old_url, Env='prod'))
+
+    assert [x[0] for x in cloudformation.requests] == ['update']
+    assert len(fingerprint_tag(cloudformation)) == 1
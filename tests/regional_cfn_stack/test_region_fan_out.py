@@ -0,0 +1,101 @@
+from botocore.exceptions import ClientError
+
+import region_fan_out
+import stack_manage
+from cloudformation_stub import CloudFormationStub
+
+STACK = 'regional'
+REGIONS = ['us-east-1', 'eu-west-1', 'ap-southeast-2']
+
+
+class LambdaContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def fan_out_event(cloudformation, request_type, url, regions, old_regions=None, **properties):
+    event = {
+        'RequestType': request_type,
+        'RequestId': 'request-id',
+        'StackId': 'arn:aws:cloudformation:us-east-1:123456789012:stack/parent/id',
+        'LogicalResourceId': 'RegionalStack',
+        'ResponseURL': 'https://cloudformation-custom-resource-response.example.com/',
+        'ResourceProperties': dict({'StackName': STACK, 'Regions': ','.join(regions), 'TemplateUrl': url,
+                                    'StackParam_Env': 'prod'}, **properties)
+    }
+    if request_type != 'Create':
+        event['PhysicalResourceId'] = f"MultiRegion{STACK}"
+        event['OldResourceProperties'] = dict(event['ResourceProperties'],
+                                              Regions=','.join(old_regions or regions))
+    return event
+
+
+def failing_create(region):
+    def create_stack(**kwargs):
+        raise ClientError({'Error': {'Code': 'LimitExceededException', 'Message': f"Stack limit reached in {region}"}},
+                          'CreateStack')
+    return create_stack
+
+
+def test_stack_is_created_in_every_region(cloudformation, regional_cloudformation, run_handler):
+    url = cloudformation.put_template('templates', 'stack.yaml', '"v1"')
+
+    responses = run_handler(fan_out_event(cloudformation, 'Create', url, REGIONS))
+
+    assert [x['Status'] for x in responses] == ['SUCCESS']
+    assert sorted(regional_cloudformation) == sorted(REGIONS)
+    assert all([x[0] for x in stub.requests] == ['create'] for stub in regional_cloudformation.values())
+    assert responses[0]['Data']['Status.eu-west-1'] == region_fan_out.STATUS_SUCCESS
+    assert responses[0]['Data']['StackId.eu-west-1'] == cloudformation.stack_id(STACK)
+
+
+def test_regions_are_skipped_once_failures_exceed_tolerance(cloudformation, regional_cloudformation, run_handler):
+    url = cloudformation.put_template('templates', 'stack.yaml', '"v1"')
+    for region in REGIONS[:2]:
+        regional_cloudformation[region] = CloudFormationStub()
+        regional_cloudformation[region].create_stack = failing_create(region)
+
+    responses = run_handler(fan_out_event(cloudformation, 'Create', url, REGIONS, MaxConcurrentRegions='1',
+                                          FailureToleranceCount='1'))
+
+    assert [x['Status'] for x in responses] == ['FAILED']
+    assert responses[0]['Reason'] == ('us-east-1: An error occurred (LimitExceededException) when calling the '
+                                      'CreateStack operation: Stack limit reached in us-east-1; eu-west-1: An error '
+                                      'occurred (LimitExceededException) when calling the CreateStack operation: '
+                                      'Stack limit reached in eu-west-1')
+    assert responses[0]['Data']['Status.ap-southeast-2'] == region_fan_out.STATUS_SKIPPED
+    assert 'ap-southeast-2' not in regional_cloudformation
+
+
+def test_update_deletes_stack_of_removed_region(cloudformation, regional_cloudformation, run_handler):
+    url = cloudformation.put_template('templates', 'stack.yaml', '"v1"')
+    run_handler(fan_out_event(cloudformation, 'Create', url, REGIONS))
+
+    responses = run_handler(fan_out_event(cloudformation, 'Update', url, REGIONS[:2], REGIONS))
+
+    assert [x['Status'] for x in responses] == ['SUCCESS', 'SUCCESS']
+    assert [x[0] for x in regional_cloudformation['ap-southeast-2'].requests] == ['create', 'delete']
+    # unchanged stacks of remaining regions are skipped by their fingerprint
+    assert [x[0] for x in regional_cloudformation['eu-west-1'].requests] == ['create']
+
+
+def test_pending_regions_are_left_to_reinvoked_lambda_once_time_runs_out(cloudformation, regional_cloudformation,
+                                                                         lambda_modules):
+    import handler
+    url = cloudformation.put_template('templates', 'stack.yaml', '"v1"')
+    region_states = region_fan_out.plan(REGIONS, region_fan_out.OPERATION_DEPLOY)
+
+    def fan_out():
+        return region_fan_out.RegionFanOut(STACK, url, {'Env': 'prod'}, ['CAPABILITY_IAM'], 'DELETE',
+                                           handler.fan_out_operation_states, 1, 0, region_states)
+
+    # regions complete at once, but no time is left to start next one
+    assert not fan_out().run(LambdaContext(stack_manage.REINVOKE_MARGIN_MS - 1))
+
+    assert [x['Status'] for x in region_states] == [region_fan_out.STATUS_SUCCESS, region_fan_out.STATUS_PENDING,
+                                                    region_fan_out.STATUS_PENDING]
+    assert fan_out().run(LambdaContext(900 * 1000))
+    assert all(x['Status'] == region_fan_out.STATUS_SUCCESS for x in region_states)
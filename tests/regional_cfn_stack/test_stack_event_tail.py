@@ -0,0 +1,140 @@
+import stack_manage
+
+STACK = 'regional'
+NESTED_STACK = 'regional-nested'
+
+
+def tail_until(cloudformation, *statuses, state=None):
+    """Polls tail of stack until it reaches one of statuses, returns tail"""
+    tail = stack_manage.StackEventTail('us-east-1', cloudformation.stack_id(STACK), state)
+    for _ in range(10):
+        tail.poll()
+        if tail.stack_status in statuses:
+            return tail
+    raise AssertionError(f"Stack status {tail.stack_status} never reached {statuses}")
+
+
+def add_failed_update(cloudformation):
+    cloudformation.add_stack(STACK, 'UPDATE_IN_PROGRESS', 'User Initiated')
+    cloudformation.add(STACK, 'Queue', 'UPDATE_FAILED', 'Resource update cancelled')
+    cloudformation.add(STACK, 'Bucket', 'UPDATE_FAILED', 'bucket-name already exists')
+    cloudformation.add_stack(STACK, 'UPDATE_ROLLBACK_IN_PROGRESS',
+                             'The following resource(s) failed to update: [Bucket, Queue].')
+    cloudformation.add_stack(STACK, 'UPDATE_ROLLBACK_COMPLETE')
+
+
+def add_nested_failed_create(cloudformation, stack_status='CREATE_FAILED'):
+    cloudformation.add_stack(STACK, 'CREATE_IN_PROGRESS', 'User Initiated')
+    cloudformation.add_nested_stack(STACK, 'Nested', NESTED_STACK, 'CREATE_IN_PROGRESS')
+    cloudformation.add_stack(NESTED_STACK, 'CREATE_IN_PROGRESS', 'User Initiated')
+    cloudformation.add(NESTED_STACK, 'Bucket', 'CREATE_FAILED', 'bucket-name already exists')
+    cloudformation.add_stack(NESTED_STACK, 'ROLLBACK_IN_PROGRESS',
+                             'The following resource(s) failed to create: [Bucket].')
+    cloudformation.add_nested_stack(STACK, 'Nested', NESTED_STACK, 'CREATE_FAILED',
+                                    'Embedded stack was not successfully created')
+    cloudformation.add_stack(STACK, stack_status, 'The following resource(s) failed to create: [Nested].')
+
+
+def test_resource_failures_are_reported_before_consequential_ones(cloudformation):
+    add_failed_update(cloudformation)
+
+    tail = tail_until(cloudformation, 'UPDATE_ROLLBACK_COMPLETE')
+
+    assert tail.failure_reason() == 'Bucket: bucket-name already exists'
+
+
+def test_failures_of_earlier_operations_are_ignored(cloudformation):
+    add_failed_update(cloudformation)
+    cloudformation.add_stack(STACK, 'UPDATE_IN_PROGRESS', 'User Initiated')
+    cloudformation.add(STACK, 'Topic', 'UPDATE_FAILED', 'Topic policy is invalid')
+    cloudformation.add_stack(STACK, 'UPDATE_ROLLBACK_IN_PROGRESS',
+                             'The following resource(s) failed to update: [Topic].')
+    cloudformation.add_stack(STACK, 'UPDATE_ROLLBACK_COMPLETE')
+
+    tail = tail_until(cloudformation, 'UPDATE_ROLLBACK_COMPLETE')
+
+    assert tail.failure_reason() == 'Topic: Topic policy is invalid'
+
+
+def test_failed_nested_stack_is_replaced_with_its_own_failures(cloudformation):
+    add_nested_failed_create(cloudformation)
+    cloudformation.add_stack(STACK, 'ROLLBACK_IN_PROGRESS')
+    cloudformation.add_stack(STACK, 'ROLLBACK_COMPLETE')
+
+    tail = tail_until(cloudformation, 'ROLLBACK_COMPLETE')
+
+    assert tail.failure_reason() == 'Nested/Bucket: bucket-name already exists'
+
+
+def test_deletion_of_failed_create_belongs_to_create_operation(cloudformation):
+    # stack created with OnFailure=DELETE is deleted right after it fails
+    add_nested_failed_create(cloudformation, 'ROLLBACK_IN_PROGRESS')
+    cloudformation.add_stack(STACK, 'DELETE_IN_PROGRESS')
+    cloudformation.add_nested_stack(STACK, 'Nested', NESTED_STACK, 'DELETE_COMPLETE')
+    cloudformation.add_stack(STACK, 'DELETE_COMPLETE')
+
+    tail = tail_until(cloudformation, 'DELETE_COMPLETE')
+
+    assert tail.operation_start == cloudformation.events[cloudformation.stack_id(STACK)][0]['Timestamp'].timestamp()
+    assert tail.failure_reason() == 'Nested/Bucket: bucket-name already exists'
+
+
+def test_deletion_of_failed_create_is_found_across_event_pages(cloudformation):
+    cloudformation.page_size = 2
+    add_nested_failed_create(cloudformation, 'ROLLBACK_IN_PROGRESS')
+    cloudformation.add_stack(STACK, 'DELETE_IN_PROGRESS')
+    cloudformation.add_stack(STACK, 'DELETE_COMPLETE')
+
+    tail = tail_until(cloudformation, 'DELETE_COMPLETE')
+
+    assert tail.failure_reason() == 'Nested/Bucket: bucket-name already exists'
+
+
+def test_resumed_tail_keeps_start_of_create_when_failed_stack_is_deleted(cloudformation):
+    add_nested_failed_create(cloudformation, 'ROLLBACK_IN_PROGRESS')
+    tail = tail_until(cloudformation, 'ROLLBACK_IN_PROGRESS')
+    operation_start = tail.operation_start
+    cloudformation.add_stack(STACK, 'DELETE_IN_PROGRESS')
+    cloudformation.add_stack(STACK, 'DELETE_COMPLETE')
+
+    # tail state is carried over to re-invoked lambda
+    tail = tail_until(cloudformation, 'DELETE_COMPLETE', state=tail.state())
+
+    assert tail.operation_start == operation_start
+    assert tail.failure_reason() == 'Nested/Bucket: bucket-name already exists'
+
+
+def test_user_deletion_of_rolled_back_stack_is_operation_of_its_own(cloudformation):
+    add_nested_failed_create(cloudformation, 'ROLLBACK_IN_PROGRESS')
+    cloudformation.add_stack(STACK, 'ROLLBACK_COMPLETE')
+    cloudformation.add_stack(STACK, 'DELETE_IN_PROGRESS', 'User Initiated')
+    cloudformation.add(STACK, 'Logs', 'DELETE_FAILED', 'Log group is in use', 'AWS::Logs::LogGroup')
+    cloudformation.add_stack(STACK, 'DELETE_FAILED', 'The following resource(s) failed to delete: [Logs].')
+
+    tail = tail_until(cloudformation, 'DELETE_FAILED')
+
+    assert tail.operation_start == cloudformation.events[cloudformation.stack_id(STACK)][-3]['Timestamp'].timestamp()
+    assert tail.failure_reason() == 'Logs: Log group is in use'
+
+
+def test_user_deletion_of_failed_stack_is_operation_of_its_own(cloudformation):
+    # stack created with OnFailure=DO_NOTHING stays failed until user deletes it
+    add_nested_failed_create(cloudformation)
+    cloudformation.add_stack(STACK, 'DELETE_IN_PROGRESS', 'User Initiated')
+    cloudformation.add(STACK, 'Logs', 'DELETE_FAILED', 'Log group is in use', 'AWS::Logs::LogGroup')
+    cloudformation.add_stack(STACK, 'DELETE_FAILED', 'The following resource(s) failed to delete: [Logs].')
+
+    tail = tail_until(cloudformation, 'DELETE_FAILED')
+
+    assert tail.failure_reason() == 'Logs: Log group is in use'
+
+
+def test_deletion_of_completed_stack_is_operation_of_its_own(cloudformation):
+    add_failed_update(cloudformation)
+    cloudformation.add_stack(STACK, 'DELETE_IN_PROGRESS', 'User Initiated')
+    cloudformation.add(STACK, 'Bucket', 'DELETE_FAILED', 'Bucket is not empty')
+    cloudformation.add_stack(STACK, 'DELETE_FAILED', 'The following resource(s) failed to delete: [Bucket].')
+
+    tail = tail_until(cloudformation, 'DELETE_FAILED')
+
+    assert tail.failure_reason() == 'Bucket: Bucket is not empty'
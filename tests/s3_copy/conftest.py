@@ -0,0 +1,116 @@
+"""
+Fixtures of s3-copy tests, run against in-process S3 emulator (moto).
+
+Requirements (not packaged with lambda): see tests/requirements.txt
+
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from copy_support import SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext
+
+S3_COPY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))), 's3-copy')
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('LAMBDA_TASK_ROOT', S3_COPY_DIR)
+os.environ.setdefault('AWS_LAMBDA_FUNCTION_NAME', 's3-copy-test')
+sys.path.append(S3_COPY_DIR)
+
+# modules of lambda functions sharing names, tests of all functions run in single session
+LAMBDA_MODULES = ['handler', 'cr_response', 'lambda_invoker']
+
+
+@pytest.fixture
+def s3():
+    with mock_aws():
+        # copy logic creates its clients from default session, fresh one drops event handlers of other tests
+        boto3.setup_default_session()
+        client = boto3.client('s3')
+        for bucket in [SOURCE_BUCKET, DESTINATION_BUCKET]:
+            client.create_bucket(Bucket=bucket)
+        yield client
+
+
+@pytest.fixture
+def small_pages(s3):
+    """Lists 5 objects per page, so copies span many listing pages"""
+    def max_keys(params, **kwargs):
+        params.setdefault('MaxKeys', 5)
+
+    boto3.DEFAULT_SESSION.events.register('provide-client-params.s3.ListObjectsV2', max_keys)
+
+
+@pytest.fixture
+def copy_resumed():
+    """
+    Runs copy created by given factory from checkpoint, invocation after invocation, until it completes.
+    Every invocation runs out of time after given number of transfers. Returns transferred keys of every
+    invocation, and checkpoints returned
+    """
+    def run(create_copy, transfers_per_invocation):
+        transferred = []
+        checkpoints = []
+        checkpoint = None
+        while True:
+            context = LambdaContext()
+            copy = create_copy(context, checkpoint)
+            invocation_keys = []
+            transfer_key = copy.transfer_key
+
+            def counted_transfer(object, transfer_key=transfer_key, invocation_keys=invocation_keys):
+                transfer_key(object)
+                invocation_keys.append(object['Key'])
+                if len(invocation_keys) >= transfers_per_invocation:
+                    context.remaining_ms = 0
+
+            copy.transfer_key = counted_transfer
+            checkpoint = copy.copy()
+            transferred.append(invocation_keys)
+            if checkpoint is None:
+                return transferred, checkpoints
+            checkpoints.append(checkpoint)
+            assert len(checkpoints) < 100, 'copy is not making progress'
+
+    return run
+
+
+@pytest.fixture
+def lambda_modules(monkeypatch):
+    """Lambda modules are imported from s3-copy, rather than from function imported by earlier tests"""
+    for name in LAMBDA_MODULES:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    monkeypatch.syspath_prepend(S3_COPY_DIR)
+
+
+@pytest.fixture
+def run_handler(s3, monkeypatch, lambda_modules):
+    """
+    Runs handler for CloudFormation request event, and then for every event handler invoked lambda with, until
+    there are none left. Returns responses sent to CloudFormation
+    """
+    import cr_response
+    import handler
+    import lambda_invoker
+
+    invoked = []
+    responses = []
+    monkeypatch.setattr(lambda_invoker.LambdaInvoker, 'invoke', lambda self, payload: invoked.append(payload))
+    monkeypatch.setattr(cr_response.CustomResourceResponse, 'respond',
+                        lambda self: responses.append(dict(self.response)))
+
+    def run(event):
+        invoked.append(event)
+        while len(invoked) > 0:
+            # payload is serialized as lambda would, so state is never shared between invocations
+            handler.lambda_handler(json.loads(json.dumps(invoked.pop(0))), LambdaContext())
+        return responses
+
+    return run
@@ -0,0 +1,78 @@
+"""Lambda context and CloudFormation request stand-ins, and helpers reading and writing objects of emulated buckets"""
+import io
+import tarfile
+import zipfile
+
+SOURCE_BUCKET = 'test-source'
+DESTINATION_BUCKET = 'test-destination'
+
+
+def request_event(request_type='Create', **properties):
+    """CloudFormation custom resource request with given resource properties"""
+    return {
+        'RequestType': request_type,
+        'RequestId': 'request-id',
+        'StackId': 'arn:aws:cloudformation:us-east-1:123456789012:stack/test-stack/id',
+        'LogicalResourceId': 'Copy',
+        'ResponseURL': 'https://cloudformation-custom-resource-response.example.com/',
+        'ResourceProperties': properties
+    }
+
+
+class LambdaContext:
+    """Lambda context stand-in, with remaining time set by test"""
+
+    def __init__(self):
+        self.aws_request_id = 'test-request'
+        self.memory_limit_in_mb = 1024
+        self.remaining_ms = 900 * 1000
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def put_objects(client, bucket, objects):
+    for key, body in objects.items():
+        client.put_object(Bucket=bucket, Key=key, Body=body)
+
+
+def list_keys(client, bucket, prefix=''):
+    keys = []
+    for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        keys += [x['Key'] for x in page.get('Contents', [])]
+    return sorted(keys)
+
+
+def read_object(client, bucket, key):
+    return client.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+
+def record_transfers(copy):
+    """Source keys transferred by copy, in order transfers complete"""
+    transferred = []
+    transfer_key = copy.transfer_key
+
+    def recorded_transfer(object):
+        transfer_key(object)
+        transferred.append(object['Key'])
+
+    copy.transfer_key = recorded_transfer
+    return transferred
+
+
+def zip_archive(members, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression) as archive:
+        for name, body in members.items():
+            archive.writestr(name, body)
+    return buffer.getvalue()
+
+
+def archive_members(key, body):
+    """Files of zip or tar archive stored under key, by name"""
+    if key.endswith('.zip'):
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            assert archive.testzip() is None
+            return {name: archive.read(name) for name in archive.namelist() if not name.endswith('/')}
+    with tarfile.open(fileobj=io.BytesIO(body)) as archive:
+        return {member.name: archive.extractfile(member).read() for member in archive if member.isfile()}
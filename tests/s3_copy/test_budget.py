@@ -0,0 +1,121 @@
+import os
+import time
+
+import pytest
+
+import budget
+import logic
+from copy_support import (SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, list_keys, read_object,
+                          zip_archive)
+
+MB = 1024 * 1024
+LARGE = os.urandom(6 * MB)
+MEMBERS = {f"site/page{i}.html": os.urandom(100 * 1024) for i in range(5)}
+
+
+def limited_budget(memory_budget, disk_budget, workers=1):
+    execution_budget = budget.ExecutionBudget(LambdaContext(), workers)
+    execution_budget.memory_budget = memory_budget
+    execution_budget.disk_budget = disk_budget
+    return execution_budget
+
+
+def auto_copy(type, src, memory_budget, disk_budget, concurrency=1):
+    copy = logic.S3CopyLogic(LambdaContext(), type=type, src=dict(src, Bucket=SOURCE_BUCKET),
+                             dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None,
+                             copy_mode=logic.COPY_MODE_AUTO, concurrency=concurrency, multipart_threshold_mb=5,
+                             multipart_chunk_size_mb=5)
+    copy.budget = limited_budget(memory_budget, disk_budget, concurrency)
+    return copy
+
+
+def record_calls(copy, *names):
+    """Names of given copy methods, in order they are called"""
+    calls = []
+    for name in names:
+        def recorded(*args, name=name, method=getattr(copy, name)):
+            calls.append(name)
+            return method(*args)
+        setattr(copy, name, recorded)
+    return calls
+
+
+def test_budget_is_share_of_configured_memory():
+    execution_budget = budget.ExecutionBudget(LambdaContext(), 4)
+
+    assert execution_budget.memory_budget == int(1024 * MB * budget.MEMORY_BUDGET_FRACTION)
+    assert 0 < execution_budget.disk_budget <= execution_budget.free_disk_bytes
+
+
+@pytest.mark.parametrize('size, disk_size, strategy', [
+    (10 * MB, None, budget.STRATEGY_MEMORY),
+    (50 * MB, None, budget.STRATEGY_DISK),
+    (50 * MB, 500 * MB, budget.STRATEGY_STREAM),
+    (500 * MB, None, budget.STRATEGY_STREAM),
+])
+def test_strategy_fits_object_into_memory_then_disk(size, disk_size, strategy):
+    assert limited_budget(20 * MB, 200 * MB).strategy(size, disk_size) == strategy
+
+
+def test_workers_get_equal_share_of_budget():
+    execution_budget = limited_budget(20 * MB, 200 * MB, workers=4)
+
+    assert execution_budget.worker_strategy(5 * MB) == budget.STRATEGY_MEMORY
+    assert execution_budget.worker_strategy(10 * MB) == budget.STRATEGY_DISK
+    assert execution_budget.worker_strategy(60 * MB) == budget.STRATEGY_STREAM
+
+
+@pytest.mark.parametrize('memory_budget, disk_budget, method', [
+    (10 * MB, 10 * MB, 'transfer_in_memory'),
+    (1 * MB, 10 * MB, 'download_object_upload'),
+    (1 * MB, 1 * MB, 'pipe_object'),
+])
+def test_object_is_copied_with_strategy_fitting_budget(s3, memory_budget, disk_budget, method):
+    put_objects(s3, SOURCE_BUCKET, {'data/large.bin': LARGE})
+    copy = auto_copy('object', {'Key': 'data/large.bin'}, memory_budget, disk_budget)
+    calls = record_calls(copy, 'transfer_in_memory', 'download_object_upload', 'pipe_object')
+
+    copy.copy()
+
+    assert calls[0] == method
+    assert read_object(s3, DESTINATION_BUCKET, 'out/large.bin') == LARGE
+
+
+def test_sync_picks_strategy_per_object(s3):
+    put_objects(s3, SOURCE_BUCKET, {'data/large.bin': LARGE, 'data/small.txt': b'small'})
+    copy = auto_copy('sync', {'Prefix': 'data/'}, 2 * MB, 2 * MB, concurrency=2)
+    calls = record_calls(copy, 'transfer_in_memory', 'download_key', 'pipe_key')
+
+    copy.copy()
+
+    assert sorted(calls) == ['pipe_key', 'transfer_in_memory']
+    assert read_object(s3, DESTINATION_BUCKET, 'out/large.bin') == LARGE
+
+
+def test_zip_archive_is_streamed_when_it_does_not_fit_disk_with_its_contents(s3):
+    archive = zip_archive(MEMBERS)
+    put_objects(s3, SOURCE_BUCKET, {'upload/site.zip': archive})
+    copy = auto_copy('object-zip', {'Key': 'upload/site.zip'}, len(archive) - 1, len(archive) + 1)
+    calls = record_calls(copy, 'memory_zip_upload', 'download_object_unpack_zip_upload', 'stream_zip_upload')
+
+    copy.copy()
+
+    assert calls == ['stream_zip_upload']
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + x for x in MEMBERS)
+
+
+def test_resource_usage_is_sampled_during_copy(s3):
+    put_objects(s3, SOURCE_BUCKET, {'data/large.bin': LARGE})
+    copy = auto_copy('object', {'Key': 'data/large.bin'}, 1 * MB, 100 * MB)
+    upload_file = copy.upload_file
+
+    def sampled_upload(*args):
+        # downloaded object is kept in /tmp until it is sampled
+        time.sleep(budget.SAMPLE_INTERVAL_SECONDS * 2)
+        upload_file(*args)
+
+    copy.upload_file = sampled_upload
+    copy.copy()
+
+    assert copy.resource_usage['PeakMemoryMB'] > 0
+    assert copy.resource_usage['PeakDiskMB'] >= 5
@@ -0,0 +1,156 @@
+import json
+
+import boto3
+
+import logic
+from copy_support import SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, list_keys, read_object
+
+OBJECTS = {f"data/d{i % 3}/f{i:02d}.txt": f"object {i}".encode('utf-8') * (i + 1) for i in range(23)}
+STALE_KEY = 'out/removed.txt'
+MANIFEST_KEY = 'out/.s3-copy-manifest.json'
+
+
+def sync_copy(context, checkpoint, **opts):
+    return logic.S3CopyLogic(context, type='sync', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                             dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None, concurrency=2,
+                             checkpoint=checkpoint, **opts)
+
+
+def delta_copy(context, checkpoint, **opts):
+    return sync_copy(context, checkpoint, sync_mode=logic.SYNC_MODE_DELTA, **opts)
+
+
+def delete_removed_copy(context, checkpoint):
+    return delta_copy(context, checkpoint, delete_removed=True, use_manifest=True)
+
+
+def manifest_objects(s3):
+    return json.loads(read_object(s3, DESTINATION_BUCKET, MANIFEST_KEY))['Objects']
+
+
+def relative_keys():
+    return sorted(key[len('data/'):] for key in OBJECTS)
+
+
+def test_sync_resumes_from_checkpoint_until_whole_prefix_is_copied(s3, small_pages, copy_resumed):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+
+    transferred, checkpoints = copy_resumed(sync_copy, 4)
+
+    assert len(checkpoints) > 1
+    assert all(len(keys) > 0 for keys in transferred)
+    # every object is transferred exactly once over all invocations
+    assert sorted(key for keys in transferred for key in keys) == sorted(OBJECTS)
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + key[len('data/'):] for key in OBJECTS)
+    for key, body in OBJECTS.items():
+        assert read_object(s3, DESTINATION_BUCKET, 'out/' + key[len('data/'):]) == body
+
+
+def test_checkpoint_records_completed_keys_of_current_page(s3, small_pages, copy_resumed):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+
+    transferred, checkpoints = copy_resumed(sync_copy, 3)
+
+    # pages of 5 objects copied 3 at a time, so checkpoints fall within pages
+    assert any(len(checkpoint['CompletedKeys']) > 0 for checkpoint in checkpoints)
+    for invocation_keys, checkpoint in zip(transferred[1:], checkpoints):
+        assert not set(invocation_keys) & set(checkpoint['CompletedKeys'])
+
+
+def test_listing_is_resumed_after_key_of_checkpoint(s3, small_pages, copy_resumed):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    listed = []
+    boto3.DEFAULT_SESSION.events.register('provide-client-params.s3.ListObjectsV2',
+                                          lambda params, **kwargs: listed.append(dict(params)))
+
+    transferred, checkpoints = copy_resumed(sync_copy, 4)
+
+    positions = [checkpoint['Position'] for checkpoint in checkpoints]
+    assert all(position is None or position in OBJECTS for position in positions)
+    resumed_listings = [params for params in listed if 'ContinuationToken' not in params and 'StartAfter' in params]
+    assert sorted(params['StartAfter'] for params in resumed_listings) == sorted(x for x in positions if x is not None)
+
+
+def test_resumed_delta_sync_replays_shifted_pages_without_copying_again(s3, small_pages, copy_resumed):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    first_key = sorted(OBJECTS)[0]
+
+    def create_copy(context, checkpoint):
+        if checkpoint is not None and first_key in list_keys(s3, SOURCE_BUCKET):
+            # removing key listed before checkpoint shifts boundaries of replayed pages
+            s3.delete_object(Bucket=SOURCE_BUCKET, Key=first_key)
+        return delete_removed_copy(context, checkpoint)
+
+    transferred, checkpoints = copy_resumed(create_copy, 4)
+
+    assert len(checkpoints) > 1
+    all_transferred = [key for keys in transferred for key in keys]
+    assert sorted(all_transferred) == sorted(OBJECTS)
+    assert 'out/' + first_key[len('data/'):] not in list_keys(s3, DESTINATION_BUCKET)
+
+
+def test_copy_without_progress_fails(s3):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    checkpoint = {'Position': None, 'CompletedKeys': []}
+    copy = sync_copy(LambdaContext(), checkpoint)
+    # checkpoint taken without any completed key is same as the one copy was resumed from
+    copy.page_checkpoint = lambda position, completed_keys: logic.S3CopyLogic.page_checkpoint(copy, position, set())
+    copy.deadline_reached = lambda: True
+
+    try:
+        copy.copy()
+        assert False, 'copy without progress did not fail'
+    except Exception as e:
+        assert 'made no progress' in str(e)
+
+
+def test_resumed_delta_sync_deletes_removed_objects_once_whole_source_is_compared(s3, small_pages, copy_resumed):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    put_objects(s3, DESTINATION_BUCKET, {STALE_KEY: b'removed from source'})
+
+    def create_copy(context, checkpoint):
+        if checkpoint is not None:
+            # removed objects are kept while copy is in progress
+            assert STALE_KEY in list_keys(s3, DESTINATION_BUCKET)
+        return delete_removed_copy(context, checkpoint)
+
+    transferred, checkpoints = copy_resumed(create_copy, 4)
+
+    assert len(checkpoints) > 1
+    assert sorted(key for keys in transferred for key in keys) == sorted(OBJECTS)
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted(['out/' + key for key in relative_keys()] + [MANIFEST_KEY])
+    # manifest saved by last invocation covers objects copied by earlier ones
+    assert sorted(manifest_objects(s3)) == relative_keys()
+
+
+def test_delta_sync_after_resumed_copy_transfers_only_changed_objects(s3, small_pages, copy_resumed):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    copy_resumed(delete_removed_copy, 4)
+    put_objects(s3, SOURCE_BUCKET, {'data/d0/f03.txt': b'changed', 'data/d2/f17.txt': b'changed too'})
+    s3.delete_object(Bucket=SOURCE_BUCKET, Key='data/d1/f22.txt')
+
+    transferred, checkpoints = copy_resumed(delete_removed_copy, 1)
+
+    assert sorted(key for keys in transferred for key in keys) == ['data/d0/f03.txt', 'data/d2/f17.txt']
+    assert read_object(s3, DESTINATION_BUCKET, 'out/d2/f17.txt') == b'changed too'
+    assert 'out/d1/f22.txt' not in list_keys(s3, DESTINATION_BUCKET)
+    assert 'd1/f22.txt' not in manifest_objects(s3)
+
+
+def test_checksum_manifest_saved_with_checkpoint_lists_only_copied_objects(s3, small_pages, copy_resumed):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+
+    def create_copy(context, checkpoint):
+        copy = delta_copy(context, checkpoint, checksum_algorithm='SHA256', checksum_manifest=True)
+        if checkpoint is not None:
+            copied = set(x[len('out/'):] for x in list_keys(s3, DESTINATION_BUCKET, 'out/d'))
+            assert set(manifest_objects(s3)) <= copied
+        return copy
+
+    transferred, checkpoints = copy_resumed(create_copy, 7)
+
+    assert len(checkpoints) > 0
+    assert sorted(key for keys in transferred for key in keys) == sorted(OBJECTS)
+    entries = manifest_objects(s3)
+    assert sorted(entries) == relative_keys()
+    assert all('ChecksumSHA256' in entry for entry in entries.values())
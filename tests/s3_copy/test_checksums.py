@@ -0,0 +1,103 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import zlib
+
+import pytest
+
+import checksum
+import logic
+from copy_support import SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, read_object
+
+MB = 1024 * 1024
+OBJECTS = {f"data/f{i}.txt": f"object {i}".encode('utf-8') * 100 for i in range(5)}
+MANIFEST_KEY = 'out/.s3-copy-manifest.json'
+
+
+def checksum_copy(copy_mode=logic.COPY_MODE_DOWNLOAD, algorithm=checksum.ALGORITHM_SHA256):
+    return logic.S3CopyLogic(LambdaContext(), type='sync', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                             dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None,
+                             copy_mode=copy_mode, checksum_algorithm=algorithm, checksum_manifest=True)
+
+
+def manifest_objects(s3):
+    return json.loads(read_object(s3, DESTINATION_BUCKET, MANIFEST_KEY))['Objects']
+
+
+def test_reader_computes_checksum_and_size_of_content_read():
+    body = os.urandom(100 * 1024)
+    readers = [checksum.ChecksumReader(io.BytesIO(body), x) for x in [checksum.ALGORITHM_CRC32,
+                                                                      checksum.ALGORITHM_SHA256]]
+    for reader in readers:
+        while reader.read(7919):
+            pass
+
+    assert [x.size for x in readers] == [len(body), len(body)]
+    assert readers[0].checksum.digest() == base64.b64encode(zlib.crc32(body).to_bytes(4, 'big')).decode('ascii')
+    assert readers[1].checksum.digest() == base64.b64encode(hashlib.sha256(body).digest()).decode('ascii')
+
+
+def test_unknown_algorithm_is_rejected():
+    with pytest.raises(Exception, match='ChecksumAlgorithm must be one of'):
+        checksum_copy(algorithm='MD5')
+
+
+@pytest.mark.parametrize('copy_mode', [logic.COPY_MODE_DOWNLOAD, logic.COPY_MODE_STREAM, logic.COPY_MODE_SERVER_SIDE])
+def test_manifest_records_checksums_of_copied_objects(s3, copy_mode):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+
+    checksum_copy(copy_mode).copy()
+
+    entries = manifest_objects(s3)
+    assert sorted(entries) == sorted(key[len('data/'):] for key in OBJECTS)
+    for key, body in OBJECTS.items():
+        relative_key = key[len('data/'):]
+        head = s3.head_object(Bucket=DESTINATION_BUCKET, Key='out/' + relative_key, ChecksumMode='ENABLED')
+        expected = base64.b64encode(hashlib.sha256(body).digest()).decode('ascii')
+        assert entries[relative_key]['ChecksumSHA256'] == head['ChecksumSHA256'] == expected
+
+
+def test_copy_differing_from_source_checksum_fails(s3):
+    s3.put_object(Bucket=SOURCE_BUCKET, Key='data/a.txt', Body=b'object', ChecksumAlgorithm='SHA256')
+    copy = checksum_copy()
+    # source is read as if it changed after its checksum was computed
+    download_key = copy.download_key
+
+    def changed_download(key):
+        local_path = download_key(key)
+        with open(local_path, 'ab') as f:
+            f.write(b' changed')
+        return local_path
+
+    copy.download_key = changed_download
+
+    with pytest.raises(Exception, match='Checksum mismatch for s3://test-destination/out/a.txt'):
+        copy.copy()
+
+
+def test_crc32c_is_rejected_before_copy_without_awscrt(monkeypatch):
+    monkeypatch.setattr(checksum, 'crt_checksums', None)
+
+    with pytest.raises(Exception, match='awscrt package must be installed'):
+        logic.S3CopyLogic(LambdaContext(), type='sync', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                          dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out/'}, canned_acl=None,
+                          checksum_algorithm=checksum.ALGORITHM_CRC32C)
+
+
+def test_piped_multipart_copy_is_compared_with_source_checksum(s3):
+    body = os.urandom(6 * MB)
+    s3.put_object(Bucket=SOURCE_BUCKET, Key='data/large.bin', Body=body, ChecksumAlgorithm='SHA256')
+    head = s3.head_object(Bucket=SOURCE_BUCKET, Key='data/large.bin', ChecksumMode='ENABLED')
+    copy = logic.S3CopyLogic(LambdaContext(), type='sync', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                             dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None,
+                             copy_mode=logic.COPY_MODE_STREAM, multipart_threshold_mb=5, multipart_chunk_size_mb=5,
+                             checksum_algorithm=checksum.ALGORITHM_SHA256)
+    recorded = []
+    copy.record_checksum = lambda key, value, size, source_checksum=None: recorded.append((key, size, source_checksum))
+
+    copy.copy()
+
+    assert recorded == [('out/large.bin', len(body), head['ChecksumSHA256'])]
+    assert read_object(s3, DESTINATION_BUCKET, 'out/large.bin') == body
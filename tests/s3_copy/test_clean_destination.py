@@ -0,0 +1,96 @@
+import pytest
+
+import logic
+from copy_support import DESTINATION_BUCKET, LambdaContext, request_event, put_objects, list_keys
+
+OBJECTS = {f"out/d{i % 3}/f{i:04d}.txt": b'object' for i in range(1200)}
+
+
+def clean_copy(dst, **opts):
+    return logic.S3CopyLogic(LambdaContext(), type='clean', src=None, dst=dict(dst, Bucket=DESTINATION_BUCKET),
+                             canned_acl=None, concurrency=4, **opts)
+
+
+def object_versions(s3, prefix=''):
+    resp = s3.list_object_versions(Bucket=DESTINATION_BUCKET, Prefix=prefix)
+    return resp.get('Versions', []) + resp.get('DeleteMarkers', [])
+
+
+def enable_versioning(s3):
+    s3.put_bucket_versioning(Bucket=DESTINATION_BUCKET, VersioningConfiguration={'Status': 'Enabled'})
+
+
+def test_prefix_is_deleted_in_batches_of_at_most_1000_keys(s3):
+    put_objects(s3, DESTINATION_BUCKET, dict(OBJECTS, **{'kept/f.txt': b'outside of prefix'}))
+    copy = clean_copy({'Prefix': 'out/'})
+    batch_sizes = []
+    delete_batches = copy.delete_batches
+
+    def recorded(batches):
+        for batch in batches:
+            batch_sizes.append(len(batch))
+            yield batch
+
+    copy.delete_batches = lambda batches: delete_batches(recorded(batches))
+
+    copy.clean_destination()
+
+    assert list_keys(s3, DESTINATION_BUCKET) == ['kept/f.txt']
+    assert sum(batch_sizes) == len(OBJECTS)
+    assert len(batch_sizes) > 1 and max(batch_sizes) <= logic.MAX_DELETE_KEYS
+
+
+def test_purge_versions_removes_old_versions_and_delete_markers(s3):
+    enable_versioning(s3)
+    put_objects(s3, DESTINATION_BUCKET, {'out/a.txt': b'v1', 'out/b.txt': b'v1', 'kept/c.txt': b'v1'})
+    put_objects(s3, DESTINATION_BUCKET, {'out/a.txt': b'v2'})
+    s3.delete_object(Bucket=DESTINATION_BUCKET, Key='out/b.txt')
+
+    clean_copy({'Prefix': 'out/'}, purge_versions=True).clean_destination()
+
+    assert object_versions(s3, 'out/') == []
+    assert [x['Key'] for x in object_versions(s3)] == ['kept/c.txt']
+
+
+def test_versions_are_kept_without_purge_versions(s3):
+    enable_versioning(s3)
+    put_objects(s3, DESTINATION_BUCKET, {'out/a.txt': b'v1'})
+
+    clean_copy({'Prefix': 'out/'}).clean_destination()
+
+    assert list_keys(s3, DESTINATION_BUCKET) == []
+    # current version is hidden behind delete marker
+    assert len(object_versions(s3, 'out/')) == 2
+
+
+def test_purge_of_archive_destination_removes_only_its_own_versions(s3):
+    enable_versioning(s3)
+    put_objects(s3, DESTINATION_BUCKET, {'out/site.zip': b'v1', 'out/site.zip.bak': b'v1'})
+    put_objects(s3, DESTINATION_BUCKET, {'out/site.zip': b'v2'})
+
+    clean_copy({'Key': 'out/site.zip'}, purge_versions=True).clean_destination()
+
+    assert [x['Key'] for x in object_versions(s3)] == ['out/site.zip.bak']
+
+
+def test_failed_deletes_fail_clean(s3):
+    put_objects(s3, DESTINATION_BUCKET, {'out/a.txt': b'object'})
+    copy = clean_copy({'Prefix': 'out/'})
+    client = copy.dst_client()
+    client.delete_objects = lambda **kwargs: {'Errors': [{'Key': 'out/a.txt', 'Code': 'AccessDenied',
+                                                          'Message': 'Access Denied'}]}
+
+    with pytest.raises(Exception, match='Failed to delete 1 objects .*out/a.txt: AccessDenied'):
+        copy.clean_destination()
+
+
+def test_delete_request_purges_versions_of_destination(run_handler, s3):
+    enable_versioning(s3)
+    put_objects(s3, DESTINATION_BUCKET, {'out/a.txt': b'v1'})
+    put_objects(s3, DESTINATION_BUCKET, {'out/a.txt': b'v2'})
+
+    responses = run_handler(request_event('Delete', Source='s3://test-source/data/',
+                                          Destination=f"s3://{DESTINATION_BUCKET}/out/", PurgeVersions='true'))
+
+    assert [x['Status'] for x in responses] == ['SUCCESS']
+    assert object_versions(s3) == []
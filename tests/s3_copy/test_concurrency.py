@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+
+import pytest
+
+import logic
+from copy_support import (SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, request_event, put_objects, list_keys,
+                          record_transfers)
+
+OBJECTS = {f"data/f{i:02d}.txt": b'x' * (i * 100 + 1) for i in range(20)}
+MB = 1024 * 1024
+
+
+def sync_copy(**opts):
+    return logic.S3CopyLogic(LambdaContext(), type='sync', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                             dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None, **opts)
+
+
+def test_transfers_run_in_parallel_up_to_concurrency(s3):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    copy = sync_copy(concurrency=4)
+    running = {'now': 0, 'peak': 0}
+    lock = threading.Lock()
+    transfer_key = copy.transfer_key
+
+    def counted_transfer(object):
+        with lock:
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+        time.sleep(0.05)
+        transfer_key(object)
+        with lock:
+            running['now'] -= 1
+
+    copy.transfer_key = counted_transfer
+    copy.copy()
+
+    assert running['peak'] == 4
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + key[len('data/'):] for key in OBJECTS)
+
+
+def test_largest_objects_of_page_are_transferred_first(s3):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    copy = sync_copy(concurrency=1)
+    transferred = record_transfers(copy)
+
+    copy.copy()
+
+    assert transferred == sorted(OBJECTS, key=lambda x: len(OBJECTS[x]), reverse=True)
+
+
+def test_items_are_not_read_ahead_of_workers():
+    copy = sync_copy(concurrency=2)
+    release = threading.Event()
+    read = []
+
+    def items():
+        for item in range(100):
+            read.append(item)
+            yield item
+
+    thread = threading.Thread(target=copy.run_concurrently, args=(lambda x: release.wait(), items()))
+    thread.start()
+    time.sleep(0.2)
+    read_while_blocked = len(read)
+    release.set()
+    thread.join()
+
+    assert read_while_blocked <= 2 * logic.QUEUED_ITEMS_PER_WORKER + 1
+    assert len(read) == 100
+
+
+def test_first_failure_is_raised_and_stops_submitting_items():
+    copy = sync_copy(concurrency=2)
+    read = []
+
+    def items():
+        for item in range(100):
+            read.append(item)
+            yield item
+
+    def transfer(item):
+        if item == 0:
+            raise Exception('transfer failed')
+        time.sleep(0.01)
+
+    with pytest.raises(Exception, match='transfer failed'):
+        copy.run_concurrently(transfer, items())
+    assert len(read) < 100
+
+
+def test_multipart_settings_are_taken_from_resource_properties(run_handler, s3):
+    put_objects(s3, SOURCE_BUCKET, {'data/large.bin': os.urandom(12 * MB)})
+
+    responses = run_handler(request_event(Source=f"s3://{SOURCE_BUCKET}/data/",
+                                          Destination=f"s3://{DESTINATION_BUCKET}/out/", Concurrency='3',
+                                          MultipartThresholdMB='5', MultipartChunkSizeMB='5'))
+
+    assert [x['Status'] for x in responses] == ['SUCCESS']
+    # ETag of multipart upload ends with number of its parts
+    assert s3.head_object(Bucket=DESTINATION_BUCKET, Key='out/large.bin')['ETag'].endswith('-3"')
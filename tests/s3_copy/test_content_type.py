@@ -0,0 +1,57 @@
+import io
+
+import pytest
+
+import content_type
+import logic
+from copy_support import SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, zip_archive
+
+PDF_HEADER = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n1 0 obj\n<< /Type /Catalog >>\nendobj\n'
+
+
+def unsniffed_resolver():
+    resolver = content_type.ContentTypeResolver()
+    resolver.sniff = lambda header: pytest.fail('content was sniffed')
+    return resolver
+
+
+def test_web_asset_types_come_from_extension_table_without_sniffing():
+    resolver = unsniffed_resolver()
+
+    assert resolver.from_header('assets/app.MJS', b'') == 'application/javascript'
+    assert resolver.from_header('fonts/icons.woff2', b'') == 'font/woff2'
+    assert resolver.from_header('index.html', b'') == 'text/html'
+    assert resolver.from_stream('site.webmanifest', None) == 'application/manifest+json'
+
+
+def test_types_are_memoized_per_extension(monkeypatch):
+    resolver = unsniffed_resolver()
+    resolver.guess('a/first.svg')
+    monkeypatch.setattr(content_type, 'EXTRA_TYPES', {})
+
+    assert resolver.guess('b/second.svg') == 'image/svg+xml'
+    assert resolver.guess('README') is None
+
+
+def test_unknown_extensions_are_sniffed_from_header_only():
+    resolver = content_type.ContentTypeResolver()
+    stream = io.BufferedReader(io.BytesIO(PDF_HEADER + b'\0' * (4 * content_type.HEADER_SIZE)))
+
+    assert resolver.mime is None
+    assert resolver.from_stream('docs/report', stream) == 'application/pdf'
+    # header is peeked, stream is still read from its start
+    assert stream.read(len(PDF_HEADER)) == PDF_HEADER
+    assert resolver.from_header('docs/report.unknown-extension', PDF_HEADER) == 'application/pdf'
+
+
+def test_unpacked_members_are_uploaded_with_resolved_types(s3):
+    members = {'index.html': b'<html></html>', 'js/app.js': b'console.log(1)', 'docs/report': PDF_HEADER}
+    put_objects(s3, SOURCE_BUCKET, {'upload/site.zip': zip_archive(members)})
+
+    logic.S3CopyLogic(LambdaContext(), type='object-zip', src={'Bucket': SOURCE_BUCKET, 'Key': 'upload/site.zip'},
+                      dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out/'}, canned_acl=None).copy()
+
+    content_types = {key: s3.head_object(Bucket=DESTINATION_BUCKET, Key='out/' + key)['ContentType']
+                     for key in members}
+    assert content_types == {'index.html': 'text/html', 'js/app.js': 'application/javascript',
+                             'docs/report': 'application/pdf'}
@@ -0,0 +1,72 @@
+import json
+import os
+
+import logic
+from copy_support import (SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, list_keys, read_object,
+                          record_transfers)
+
+OBJECTS = {f"data/f{i:02d}.txt": f"object {i}".encode('utf-8') for i in range(23)}
+STALE_KEY = 'out/removed.txt'
+MANIFEST_KEY = 'out/.s3-copy-manifest.json'
+MB = 1024 * 1024
+
+
+def delta_copy(**opts):
+    return logic.S3CopyLogic(LambdaContext(), type='sync', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                             dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None, concurrency=2,
+                             sync_mode=logic.SYNC_MODE_DELTA, **opts)
+
+
+def test_delta_sync_copies_changed_objects_and_deletes_removed(s3):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    put_objects(s3, DESTINATION_BUCKET, {'out/f00.txt': OBJECTS['data/f00.txt'], 'out/f01.txt': b'outdated',
+                                         STALE_KEY: b'removed from source'})
+    copy = delta_copy(delete_removed=True)
+    transferred = record_transfers(copy)
+
+    assert copy.copy() is None
+
+    assert 'data/f00.txt' not in transferred
+    assert 'data/f01.txt' in transferred
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + key[len('data/'):] for key in OBJECTS)
+    assert read_object(s3, DESTINATION_BUCKET, 'out/f01.txt') == OBJECTS['data/f01.txt']
+
+
+def test_removed_objects_are_kept_without_delete_removed(s3):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    put_objects(s3, DESTINATION_BUCKET, {STALE_KEY: b'removed from source'})
+
+    delta_copy().copy()
+
+    assert STALE_KEY in list_keys(s3, DESTINATION_BUCKET)
+    assert len(list_keys(s3, DESTINATION_BUCKET)) == len(OBJECTS) + 1
+
+
+def test_unchanged_sync_transfers_nothing(s3):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    delta_copy().copy()
+    copy = delta_copy()
+    transferred = record_transfers(copy)
+
+    copy.copy()
+
+    assert transferred == []
+
+
+def test_manifest_keeps_multipart_copies_from_being_copied_again(s3):
+    # destination ETag of multipart upload never matches ETag of source uploaded in single part
+    put_objects(s3, SOURCE_BUCKET, {'data/large.bin': os.urandom(6 * MB), 'data/small.txt': b'small'})
+    opts = {'multipart_threshold_mb': 5, 'multipart_chunk_size_mb': 5}
+    delta_copy(use_manifest=True, **opts).copy()
+    without_manifest = delta_copy(**opts)
+    with_manifest = delta_copy(use_manifest=True, **opts)
+    transferred_without_manifest = record_transfers(without_manifest)
+    transferred_with_manifest = record_transfers(with_manifest)
+
+    without_manifest.copy()
+    with_manifest.copy()
+
+    assert transferred_without_manifest == ['data/large.bin']
+    assert transferred_with_manifest == []
+    manifest = json.loads(read_object(s3, DESTINATION_BUCKET, MANIFEST_KEY))['Objects']
+    assert sorted(manifest) == ['large.bin', 'small.txt']
@@ -0,0 +1,98 @@
+import os
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+
+import download_cache
+import logic
+from copy_support import (SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, list_keys, read_object,
+                          zip_archive)
+
+MEMBERS = {f"site/page{i}.html": f"<html>{i}</html>".encode('utf-8') for i in range(5)}
+
+
+def record_operations():
+    """Names of S3 operations called by clients created after this call"""
+    operations = []
+    boto3.DEFAULT_SESSION.events.register('before-call.s3', lambda model, **kwargs: operations.append(model.name))
+    return operations
+
+
+def cache_get(cache, s3, key):
+    return cache.get(s3, SOURCE_BUCKET, key, TransferConfig())
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_cached_object_is_not_downloaded_again(s3, tmp_path):
+    put_objects(s3, SOURCE_BUCKET, {'data/a.bin': b'a' * 100})
+    cache = download_cache.DownloadCache(1000, str(tmp_path))
+    cached_path = cache_get(cache, s3, 'data/a.bin')
+    operations = record_operations()
+
+    assert cache_get(cache, boto3.client('s3'), 'data/a.bin') == cached_path
+    assert operations == ['HeadObject']
+    assert read_file(cached_path) == b'a' * 100
+
+
+def test_changed_object_is_downloaded_again(s3, tmp_path):
+    put_objects(s3, SOURCE_BUCKET, {'data/a.bin': b'a' * 100})
+    cache = download_cache.DownloadCache(1000, str(tmp_path))
+    cached_path = cache_get(cache, s3, 'data/a.bin')
+    put_objects(s3, SOURCE_BUCKET, {'data/a.bin': b'b' * 100})
+
+    changed_path = cache_get(cache, s3, 'data/a.bin')
+
+    assert changed_path != cached_path
+    assert read_file(changed_path) == b'b' * 100
+
+
+def test_least_recently_used_objects_are_evicted(s3, tmp_path):
+    put_objects(s3, SOURCE_BUCKET, {f"data/{name}.bin": name.encode('utf-8') * 100 for name in 'abc'})
+    cache = download_cache.DownloadCache(250, str(tmp_path))
+    a_path = cache_get(cache, s3, 'data/a.bin')
+    b_path = cache_get(cache, s3, 'data/b.bin')
+    os.utime(a_path, (1000, 1000))
+    os.utime(b_path, (2000, 2000))
+    # leftover of interrupted download
+    with open(a_path + '.0123.part', 'wb') as f:
+        f.write(b'partial')
+
+    assert cache_get(cache, s3, 'data/a.bin') == a_path
+    c_path = cache_get(cache, s3, 'data/c.bin')
+
+    assert sorted(os.listdir(str(tmp_path))) == sorted(os.path.basename(x) for x in [a_path, c_path])
+
+
+def test_objects_larger_than_cache_are_not_cached(s3, tmp_path):
+    put_objects(s3, SOURCE_BUCKET, {'data/a.bin': b'a' * 100})
+    cache = download_cache.DownloadCache(99, str(tmp_path / 'cache'))
+
+    assert cache_get(cache, s3, 'data/a.bin') is None
+    assert not os.path.exists(str(tmp_path / 'cache'))
+
+
+def test_zip_archive_is_unpacked_from_cache_by_next_copy(s3, tmp_path):
+    put_objects(s3, SOURCE_BUCKET, {'upload/site.zip': zip_archive(MEMBERS)})
+
+    def zip_copy():
+        copy = logic.S3CopyLogic(LambdaContext(), type='object-zip',
+                                 src={'Bucket': SOURCE_BUCKET, 'Key': 'upload/site.zip'},
+                                 dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out/'}, canned_acl=None,
+                                 cache_size_mb=1)
+        copy.download_cache.root = str(tmp_path)
+        return copy
+
+    zip_copy().copy()
+    s3.delete_objects(Bucket=DESTINATION_BUCKET, Delete={'Objects': [{'Key': 'out/' + x} for x in MEMBERS]})
+    operations = record_operations()
+    zip_copy().copy()
+
+    assert 'GetObject' not in operations
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + x for x in MEMBERS)
+    assert read_object(s3, DESTINATION_BUCKET, 'out/site/page3.html') == MEMBERS['site/page3.html']
+    # cached archive outlives directory of request it was downloaded by
+    assert len(os.listdir(str(tmp_path))) == 1
@@ -0,0 +1,92 @@
+import gzip
+import json
+
+import pytest
+
+import logic
+import metadata_policy
+from copy_support import SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, read_object
+
+RULES = [
+    {'Pattern': '*', 'CacheControl': 'max-age=300'},
+    {'Pattern': 'assets/*', 'CacheControl': 'max-age=31536000, immutable', 'Compress': 'gzip'},
+    {'Pattern': 'private/*', 'Acl': 'private'},
+]
+SCRIPT = b'function main() { return 1; }\n' * 200
+IMAGE = b'\x89PNG\r\n\x1a\n' + b'\0' * 1000
+
+
+def sync_copy(rules, **opts):
+    return logic.S3CopyLogic(LambdaContext(), type='sync', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                             dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl='public-read',
+                             metadata_rules=rules, **opts)
+
+
+def test_later_rules_override_earlier_ones_and_canned_acl():
+    policy = metadata_policy.MetadataPolicy(json.dumps(RULES), 'public-read')
+
+    assert policy.extra_args('index.html', 'text/html') == (
+        {'ContentType': 'text/html', 'ACL': 'public-read', 'CacheControl': 'max-age=300'}, None)
+    assert policy.extra_args('private/data.json', 'application/json') == (
+        {'ContentType': 'application/json', 'ACL': 'private', 'CacheControl': 'max-age=300'}, None)
+    assert policy.extra_args('assets/app.js', 'application/javascript')[0]['CacheControl'] == \
+        'max-age=31536000, immutable'
+
+
+def test_only_compressible_types_are_compressed():
+    policy = metadata_policy.MetadataPolicy(RULES, None)
+
+    assert policy.extra_args('assets/app.js', 'application/javascript')[1] == 'gzip'
+    assert policy.extra_args('assets/style.css', 'text/css; charset=utf-8')[0]['ContentEncoding'] == 'gzip'
+    assert policy.extra_args('assets/logo.png', 'image/png') == (
+        {'ContentType': 'image/png', 'CacheControl': 'max-age=31536000, immutable'}, None)
+    # content type of server side copies is unknown
+    assert policy.extra_args('assets/app.js')[1] is None
+
+
+@pytest.mark.parametrize('rule, message', [
+    ({'CacheControl': 'no-cache'}, 'is missing Pattern'),
+    ({'Pattern': '*', 'Expires': 'never'}, "unknown keys \\['Expires'\\]"),
+    ({'Pattern': '*', 'Compress': 'lzma'}, 'Compress must be one of'),
+])
+def test_invalid_rules_are_rejected(rule, message):
+    with pytest.raises(Exception, match=message):
+        metadata_policy.MetadataPolicy([rule], None)
+
+
+def test_brotli_compression_is_rejected_before_copy_without_brotli(monkeypatch):
+    monkeypatch.setattr(metadata_policy, 'brotli', None)
+
+    with pytest.raises(Exception, match='brotli package must be installed'):
+        logic.S3CopyLogic(LambdaContext(), type='sync', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                          dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out/'}, canned_acl=None,
+                          metadata_rules=[{'Pattern': '*.js', 'Compress': 'br'}])
+
+
+@pytest.mark.parametrize('copy_mode', [logic.COPY_MODE_DOWNLOAD, logic.COPY_MODE_STREAM])
+def test_matching_objects_are_uploaded_compressed_with_their_metadata(s3, copy_mode):
+    put_objects(s3, SOURCE_BUCKET, {'data/assets/app.js': SCRIPT, 'data/assets/logo.png': IMAGE,
+                                    'data/index.html': b'<html></html>'})
+
+    sync_copy(RULES, copy_mode=copy_mode).copy()
+
+    script = s3.get_object(Bucket=DESTINATION_BUCKET, Key='out/assets/app.js')
+    assert (script['ContentEncoding'], script['CacheControl']) == ('gzip', 'max-age=31536000, immutable')
+    assert gzip.decompress(script['Body'].read()) == SCRIPT
+    image = s3.get_object(Bucket=DESTINATION_BUCKET, Key='out/assets/logo.png')
+    assert 'ContentEncoding' not in image and image['Body'].read() == IMAGE
+    assert s3.head_object(Bucket=DESTINATION_BUCKET, Key='out/index.html')['CacheControl'] == 'max-age=300'
+
+
+def test_server_side_copy_replaces_metadata_of_matching_objects(s3):
+    s3.put_object(Bucket=SOURCE_BUCKET, Key='data/assets/app.js', Body=SCRIPT, ContentType='application/javascript',
+                  Metadata={'revision': '42'})
+
+    sync_copy(RULES, copy_mode=logic.COPY_MODE_SERVER_SIDE).copy()
+
+    head = s3.head_object(Bucket=DESTINATION_BUCKET, Key='out/assets/app.js')
+    assert (head['CacheControl'], head['ContentType'], head['Metadata']) == (
+        'max-age=31536000, immutable', 'application/javascript', {'revision': '42'})
+    # server side copies are never compressed
+    assert 'ContentEncoding' not in head
+    assert read_object(s3, DESTINATION_BUCKET, 'out/assets/app.js') == SCRIPT
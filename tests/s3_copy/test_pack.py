@@ -0,0 +1,63 @@
+import pytest
+
+import logic
+from copy_support import (SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, list_keys, read_object,
+                          archive_members, request_event)
+
+OBJECTS = {f"data/d{i % 3}/f{i:02d}.txt": f"object {i}".encode('utf-8') * (i + 1) for i in range(12)}
+
+
+def relative_objects():
+    return {key[len('data/'):]: body for key, body in OBJECTS.items()}
+
+
+def pack(key, **opts):
+    return logic.S3CopyLogic(LambdaContext(), type='pack', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                             dst={'Bucket': DESTINATION_BUCKET, 'Key': key}, canned_acl=None, **opts)
+
+
+@pytest.mark.parametrize('key', ['bundle.zip', 'bundle.tar', 'bundle.tar.gz'])
+def test_prefix_is_packed_into_archive(s3, key):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+
+    pack(key).copy()
+
+    assert list_keys(s3, DESTINATION_BUCKET) == [key]
+    assert archive_members(key, read_object(s3, DESTINATION_BUCKET, key)) == relative_objects()
+
+
+def test_empty_prefix_is_packed_into_empty_archive(s3):
+    pack('bundle.zip').copy()
+
+    assert archive_members('bundle.zip', read_object(s3, DESTINATION_BUCKET, 'bundle.zip')) == {}
+
+
+def test_only_archive_is_deleted_with_resource(s3):
+    put_objects(s3, DESTINATION_BUCKET, {'bundle.zip': b'archive', 'other.txt': b'kept'})
+
+    pack('bundle.zip').clean_destination()
+
+    assert list_keys(s3, DESTINATION_BUCKET) == ['other.txt']
+
+
+def test_prefix_is_packed_only_when_pack_is_set(s3, run_handler):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    source = f"s3://{SOURCE_BUCKET}/data/"
+
+    run_handler(request_event(Source=source, Destination=f"s3://{DESTINATION_BUCKET}/bundle.zip", Pack='true'))
+    responses = run_handler(request_event(Source=source, Destination=f"s3://{DESTINATION_BUCKET}/site.zip"))
+
+    assert [x['Status'] for x in responses] == ['SUCCESS', 'SUCCESS']
+    assert archive_members('bundle.zip', read_object(s3, DESTINATION_BUCKET, 'bundle.zip')) == relative_objects()
+    assert list_keys(s3, DESTINATION_BUCKET, 'site.zip/') == sorted('site.zip/' + key for key in relative_objects())
+
+
+def test_pack_into_key_without_archive_extension_fails(s3, run_handler):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+
+    responses = run_handler(request_event(Source=f"s3://{SOURCE_BUCKET}/data/",
+                                          Destination=f"s3://{DESTINATION_BUCKET}/bundle", Pack='true'))
+
+    assert [x['Status'] for x in responses] == ['FAILED']
+    assert 'Pack requires' in responses[0]['Reason']
+    assert list_keys(s3, DESTINATION_BUCKET) == []
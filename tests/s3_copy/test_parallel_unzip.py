@@ -0,0 +1,57 @@
+import os
+import zipfile
+
+import logic
+import parallel_unzip
+from copy_support import (SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, list_keys, read_object,
+                          zip_archive)
+
+MEMBERS = {f"d{i % 4}/sub{i % 3}/f{i:02d}.txt": f"member {i}".encode('utf-8') * (i + 100) for i in range(30)}
+
+
+def tree(root):
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+
+def test_parallel_extraction_matches_extractall(tmp_path):
+    zip_path = str(tmp_path / 'archive.zip')
+    with open(zip_path, 'wb') as f:
+        f.write(zip_archive(MEMBERS))
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        zip_ref.extractall(str(tmp_path / 'serial'))
+
+    parallel_unzip.extract(zip_path, str(tmp_path / 'parallel'), 3)
+
+    assert tree(str(tmp_path / 'parallel')) == tree(str(tmp_path / 'serial')) == MEMBERS
+    # staging directories of workers are removed
+    assert sorted(os.listdir(str(tmp_path))) == ['archive.zip', 'parallel', 'serial']
+
+
+def test_last_of_duplicate_members_is_extracted(tmp_path):
+    zip_path = str(tmp_path / 'archive.zip')
+    with zipfile.ZipFile(zip_path, 'w') as zip_ref:
+        zip_ref.writestr('d/f.txt', b'first')
+        zip_ref.writestr('d/other.txt', b'other')
+        zip_ref.writestr('d/f.txt', b'last')
+
+    parallel_unzip.extract(zip_path, str(tmp_path / 'parallel'), 2)
+
+    assert tree(str(tmp_path / 'parallel')) == {'d/f.txt': b'last', 'd/other.txt': b'other'}
+
+
+def test_zip_copy_with_parallel_unzip_uploads_every_member(s3, monkeypatch):
+    monkeypatch.setattr(parallel_unzip, 'available_cpus', lambda: 2)
+    put_objects(s3, SOURCE_BUCKET, {'upload/site.zip': zip_archive(MEMBERS)})
+
+    logic.S3CopyLogic(LambdaContext(), type='object-zip', src={'Bucket': SOURCE_BUCKET, 'Key': 'upload/site.zip'},
+                      dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out/'}, canned_acl=None,
+                      parallel_unzip=True).copy()
+
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + name for name in MEMBERS)
+    assert read_object(s3, DESTINATION_BUCKET, 'out/d1/sub1/f01.txt') == MEMBERS['d1/sub1/f01.txt']
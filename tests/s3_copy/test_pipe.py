@@ -0,0 +1,82 @@
+import os
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+
+import logic
+from copy_support import SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, read_object
+
+MB = 1024 * 1024
+LARGE = os.urandom(12 * MB)
+
+
+def pipe_copy(key):
+    copy = logic.S3CopyLogic(LambdaContext(), type='object', src={'Bucket': SOURCE_BUCKET, 'Key': key},
+                             dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None,
+                             copy_mode=logic.COPY_MODE_STREAM, multipart_threshold_mb=5, multipart_chunk_size_mb=5)
+    copy.download_object = lambda: pytest.fail('object was downloaded to /tmp')
+    return copy
+
+
+def record_requests():
+    """(operation, Range and IfMatch parameters) of S3 requests of clients created after this call"""
+    requests = []
+    boto3.DEFAULT_SESSION.events.register(
+        'provide-client-params.s3',
+        lambda params, model, **kwargs: requests.append((model.name, params.get('Range'), params.get('IfMatch'))))
+    return requests
+
+
+def test_large_object_is_piped_from_ranged_gets_into_multipart_upload(s3):
+    put_objects(s3, SOURCE_BUCKET, {'data/large.html': LARGE})
+    etag = s3.head_object(Bucket=SOURCE_BUCKET, Key='data/large.html')['ETag']
+    requests = record_requests()
+
+    pipe_copy('data/large.html').copy()
+
+    gets = sorted(x for x in requests if x[0] == 'GetObject')
+    assert gets == [('GetObject', 'bytes=0-5242879', None), ('GetObject', 'bytes=10485760-12582911', etag),
+                    ('GetObject', 'bytes=5242880-10485759', etag)]
+    assert [x[0] for x in requests].count('UploadPart') == 3
+    assert read_object(s3, DESTINATION_BUCKET, 'out/large.html') == LARGE
+    assert s3.head_object(Bucket=DESTINATION_BUCKET, Key='out/large.html')['ContentType'] == 'text/html'
+
+
+def test_part_size_grows_to_fit_part_count_limit(s3, monkeypatch):
+    monkeypatch.setattr(logic, 'MAX_PARTS', 2)
+    put_objects(s3, SOURCE_BUCKET, {'data/large.bin': LARGE})
+    requests = record_requests()
+
+    pipe_copy('data/large.bin').copy()
+
+    assert [x[0] for x in requests].count('UploadPart') == 2
+    assert read_object(s3, DESTINATION_BUCKET, 'out/large.bin') == LARGE
+
+
+def test_object_under_multipart_threshold_is_copied_through_memory(s3):
+    put_objects(s3, SOURCE_BUCKET, {'data/small.bin': b'small object'})
+    requests = record_requests()
+
+    pipe_copy('data/small.bin').copy()
+
+    assert 'CreateMultipartUpload' not in [x[0] for x in requests]
+    assert read_object(s3, DESTINATION_BUCKET, 'out/small.bin') == b'small object'
+
+
+def test_object_changed_during_copy_fails_it_and_aborts_upload(s3):
+    put_objects(s3, SOURCE_BUCKET, {'data/large.bin': LARGE})
+    copy = pipe_copy('data/large.bin')
+    create_multipart_upload = copy.dst_client().create_multipart_upload
+
+    def changing_source(**kwargs):
+        # source is replaced after its first range is read
+        s3.put_object(Bucket=SOURCE_BUCKET, Key='data/large.bin', Body=b'replaced')
+        return create_multipart_upload(**kwargs)
+
+    copy.dst_client().create_multipart_upload = changing_source
+
+    with pytest.raises(ClientError, match='PreconditionFailed'):
+        copy.copy()
+    assert s3.list_multipart_uploads(Bucket=DESTINATION_BUCKET).get('Uploads', []) == []
+    assert s3.list_objects_v2(Bucket=DESTINATION_BUCKET)['KeyCount'] == 0
@@ -0,0 +1,93 @@
+import os
+import time
+
+import boto3
+import pytest
+
+import logic
+import pipeline
+from copy_support import SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, list_keys
+
+OBJECTS = {f"data/f{i:02d}.txt": b'object' for i in range(15)}
+
+
+def counted(items, produced):
+    for item in items:
+        produced.append(item)
+        yield item
+
+
+def test_prefetched_items_are_yielded_in_order():
+    assert list(pipeline.prefetch(iter(range(50)), 3)) == list(range(50))
+
+
+def test_producer_stays_at_most_size_items_ahead_of_consumer():
+    produced = []
+    items = pipeline.prefetch(counted(range(50), produced), 3)
+
+    assert next(items) == 0
+    time.sleep(0.2)
+
+    # item taken by consumer, items queued, and item waiting for free queue slot
+    assert len(produced) <= 1 + 3 + 1
+    assert list(items) == list(range(1, 50))
+
+
+def test_producer_failure_is_raised_after_items_produced_before_it():
+    def failing():
+        yield 1
+        yield 2
+        raise Exception('listing failed')
+
+    consumed = []
+    with pytest.raises(Exception, match='listing failed'):
+        for item in pipeline.prefetch(failing(), 5):
+            consumed.append(item)
+    assert consumed == [1, 2]
+
+
+def test_producer_stops_once_consumer_goes_away():
+    produced = []
+    items = pipeline.prefetch(counted(range(1000), produced), 2)
+    next(items)
+    items.close()
+
+    time.sleep(pipeline.PUT_TIMEOUT_SECONDS * 2)
+    stopped_at = len(produced)
+    time.sleep(pipeline.PUT_TIMEOUT_SECONDS * 2)
+    assert len(produced) == stopped_at < 10
+
+
+def test_files_are_walked_largest_first_within_directory(tmp_path):
+    for name, size in [('a/small.txt', 1), ('a/large.txt', 300), ('a/medium.txt', 20), ('b/only.txt', 5)]:
+        os.makedirs(os.path.dirname(str(tmp_path / name)), exist_ok=True)
+        with open(str(tmp_path / name), 'wb') as f:
+            f.write(b'x' * size)
+
+    walked = [os.path.relpath(x, str(tmp_path)) for x in pipeline.walk_files(str(tmp_path))]
+
+    assert walked == ['a/large.txt', 'a/medium.txt', 'a/small.txt', 'b/only.txt']
+
+
+def test_next_pages_are_listed_while_current_one_is_transferred(s3, small_pages):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    events = []
+    boto3.DEFAULT_SESSION.events.register('before-call.s3.ListObjectsV2',
+                                          lambda **kwargs: events.append('list'))
+    copy = logic.S3CopyLogic(LambdaContext(), type='sync', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                             dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None, concurrency=1)
+    transfer_key = copy.transfer_key
+
+    def slow_transfer(object):
+        time.sleep(0.05)
+        transfer_key(object)
+        events.append('transfer')
+
+    copy.transfer_key = slow_transfer
+    copy.copy()
+
+    # pages after first one are listed before its transfers complete
+    first_page_done = [i for i, x in enumerate(events) if x == 'transfer'][4]
+    assert events[:first_page_done].count('list') == 1 + logic.PREFETCH_PAGES
+    assert events.count('list') == 3
+    assert len(list_keys(s3, DESTINATION_BUCKET)) == len(OBJECTS)
@@ -0,0 +1,77 @@
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+
+import logic
+import regions
+from copy_support import LambdaContext, put_objects, list_keys, read_object
+
+OBJECTS = {f"data/f{i}.txt": f"object {i}".encode('utf-8') for i in range(5)}
+
+
+@pytest.fixture
+def region_lookups(s3, monkeypatch):
+    """Bucket regions are looked up by test itself, S3 operations called during test are returned"""
+    monkeypatch.setattr(regions, '_regions', {})
+    monkeypatch.setattr(regions, '_lookup_client', None)
+    requests = []
+    boto3.DEFAULT_SESSION.events.register('before-call.s3', lambda model, **kwargs: requests.append(model.name))
+    return requests
+
+
+def create_bucket(name, region):
+    client = boto3.client('s3', region_name=region)
+    if region == 'us-east-1':
+        client.create_bucket(Bucket=name)
+    else:
+        client.create_bucket(Bucket=name, CreateBucketConfiguration={'LocationConstraint': region})
+    return client
+
+
+def test_region_is_looked_up_once_per_bucket(region_lookups):
+    create_bucket('regions-eu', 'eu-west-1')
+    create_bucket('regions-us', 'us-east-1')
+
+    looked_up = [regions.bucket_region(x) for x in ['regions-eu', 'regions-us', 'regions-eu']]
+
+    assert looked_up == ['eu-west-1', 'us-east-1', 'eu-west-1']
+    assert region_lookups.count('GetBucketLocation') == 2
+
+
+def test_region_header_is_used_when_bucket_location_is_denied(s3):
+    create_bucket('regions-denied', 'ap-southeast-2')
+    client = boto3.client('s3')
+
+    def denied(**kwargs):
+        raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Access Denied'}}, 'GetBucketLocation')
+
+    client.get_bucket_location = denied
+
+    assert regions.lookup_region(client, 'regions-denied') == 'ap-southeast-2'
+
+
+def test_legacy_eu_location_is_eu_west_1(s3):
+    client = boto3.client('s3')
+    client.get_bucket_location = lambda **kwargs: {'LocationConstraint': 'EU'}
+
+    assert regions.lookup_region(client, 'regions-legacy') == 'eu-west-1'
+
+
+@pytest.mark.parametrize('copy_mode', [logic.COPY_MODE_DOWNLOAD, logic.COPY_MODE_SERVER_SIDE])
+def test_buckets_are_accessed_through_clients_of_their_regions(region_lookups, copy_mode):
+    source = create_bucket(f"regions-source-{copy_mode}", 'eu-west-1')
+    destination = create_bucket(f"regions-destination-{copy_mode}", 'ap-southeast-2')
+    put_objects(source, f"regions-source-{copy_mode}", OBJECTS)
+    copy = logic.S3CopyLogic(LambdaContext(), type='sync',
+                             src={'Bucket': f"regions-source-{copy_mode}", 'Prefix': 'data/'},
+                             dst={'Bucket': f"regions-destination-{copy_mode}", 'Prefix': 'out'}, canned_acl=None,
+                             copy_mode=copy_mode)
+
+    copy.copy()
+
+    assert sorted(copy._s3_clients) == ['ap-southeast-2', 'eu-west-1']
+    assert copy.src_client().meta.region_name == 'eu-west-1'
+    assert copy.dst_client().meta.region_name == 'ap-southeast-2'
+    assert list_keys(destination, f"regions-destination-{copy_mode}") == sorted('out/' + x[len('data/'):]
+                                                                                 for x in OBJECTS)
+    assert read_object(destination, f"regions-destination-{copy_mode}", 'out/f3.txt') == OBJECTS['data/f3.txt']
@@ -0,0 +1,69 @@
+import os
+
+import boto3
+import pytest
+
+import logic
+from copy_support import SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, list_keys, read_object
+
+OBJECTS = {f"data/d{i % 2}/f{i:02d}.txt": f"object {i}".encode('utf-8') for i in range(12)}
+MB = 1024 * 1024
+
+
+def record_operations():
+    """Names of S3 operations called through default session"""
+    operations = []
+    boto3.DEFAULT_SESSION.events.register('before-call.s3', lambda model, **kwargs: operations.append(model.name))
+    return operations
+
+
+def server_side_copy(type, src, copy_mode=logic.COPY_MODE_SERVER_SIDE):
+    return logic.S3CopyLogic(LambdaContext(), type=type, src=dict(src, Bucket=SOURCE_BUCKET),
+                             dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None, copy_mode=copy_mode)
+
+
+def test_sync_copies_objects_within_s3(s3):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    operations = record_operations()
+    copy = server_side_copy('sync', {'Prefix': 'data/'})
+    copy.download_key = lambda key: pytest.fail(f"{key} was downloaded")
+
+    copy.copy()
+
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + key[len('data/'):] for key in OBJECTS)
+    assert read_object(s3, DESTINATION_BUCKET, 'out/d1/f03.txt') == OBJECTS['data/d1/f03.txt']
+    assert operations.count('CopyObject') == len(OBJECTS)
+    assert 'GetObject' not in operations and 'PutObject' not in operations
+
+
+def test_object_is_copied_under_destination_prefix_with_its_metadata(s3):
+    s3.put_object(Bucket=SOURCE_BUCKET, Key='site/index.html', Body=b'<html></html>', ContentType='text/html',
+                  CacheControl='max-age=60', Metadata={'revision': '42'})
+
+    server_side_copy('object', {'Key': 'site/index.html'}).copy()
+
+    head = s3.head_object(Bucket=DESTINATION_BUCKET, Key='out/index.html')
+    assert (head['ContentType'], head['CacheControl'], head['Metadata']) == ('text/html', 'max-age=60',
+                                                                            {'revision': '42'})
+
+
+def test_object_over_copy_object_limit_is_copied_in_parts_with_its_metadata(s3, monkeypatch):
+    monkeypatch.setattr(logic, 'MAX_COPY_OBJECT_SIZE', 5 * MB)
+    monkeypatch.setattr(logic, 'COPY_PART_SIZE', 5 * MB)
+    body = os.urandom(12 * MB)
+    s3.put_object(Bucket=SOURCE_BUCKET, Key='data/large.bin', Body=body, ContentType='application/x-test',
+                  Metadata={'revision': '42'})
+    operations = record_operations()
+
+    server_side_copy('sync', {'Prefix': 'data/'}).copy()
+
+    assert operations.count('UploadPartCopy') == 3
+    assert 'CopyObject' not in operations
+    assert read_object(s3, DESTINATION_BUCKET, 'out/large.bin') == body
+    head = s3.head_object(Bucket=DESTINATION_BUCKET, Key='out/large.bin')
+    assert (head['ContentType'], head['Metadata']) == ('application/x-test', {'revision': '42'})
+
+
+def test_unknown_copy_mode_is_rejected():
+    with pytest.raises(Exception, match='CopyMode must be one of'):
+        server_side_copy('sync', {'Prefix': 'data/'}, copy_mode='teleport')
@@ -0,0 +1,67 @@
+import boto3
+
+import logic
+import shards
+from copy_support import SOURCE_BUCKET, DESTINATION_BUCKET, put_objects, list_keys, request_event
+
+OBJECTS = dict({f"data/{prefix}/f{i}.txt": f"{prefix} {i}".encode('utf-8') for prefix in 'abcde' for i in range(3)},
+               **{'data/top.txt': b'top level'})
+STATE_PREFIX = '.s3-copy-state/'
+
+
+def sharded_copy_event(shard_count=2):
+    return request_event(Source=f"s3://{SOURCE_BUCKET}/data/", Destination=f"s3://{DESTINATION_BUCKET}/out/",
+                         Shards=str(shard_count))
+
+
+def test_sharded_copy_copies_whole_prefix_and_responds_once(s3, run_handler):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+
+    responses = run_handler(sharded_copy_event())
+
+    assert [x['Status'] for x in responses] == ['SUCCESS']
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + key[len('data/'):] for key in OBJECTS)
+    # state of completed copy is removed
+    assert list_keys(s3, DESTINATION_BUCKET, STATE_PREFIX) == []
+
+
+def test_failed_shard_responds_and_stops_shards_not_started_yet(s3, run_handler, monkeypatch):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    transfer_key = logic.S3CopyLogic.transfer_key
+
+    def failing_transfer(self, object):
+        if object['Key'].startswith('data/a/'):
+            raise Exception('Access Denied')
+        transfer_key(self, object)
+
+    monkeypatch.setattr(logic.S3CopyLogic, 'transfer_key', failing_transfer)
+
+    responses = run_handler(sharded_copy_event())
+
+    assert [(x['Status'], x.get('Reason')) for x in responses] == [('FAILED', 'Access Denied')]
+    # second shard found response marker, which is all that is left of state
+    assert list_keys(s3, DESTINATION_BUCKET, 'out/') == []
+    assert [key.split('/')[-1] for key in list_keys(s3, DESTINATION_BUCKET, STATE_PREFIX)] == [shards.RESPONSE_NAME]
+
+
+def test_response_is_claimed_only_once(s3):
+    state = shards.ShardState(DESTINATION_BUCKET, 'state/')
+
+    assert state.claim_response('SUCCESS')
+    assert not state.claim_response('FAILED', 'too late')
+    assert state.is_responded()
+
+
+def test_source_is_listed_in_its_own_region(s3):
+    s3.create_bucket(Bucket='test-source-eu', CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+    boto3.client('s3', region_name='eu-west-1').put_object(Bucket='test-source-eu', Key='data/a/f.txt', Body=b'a')
+    listing_regions = []
+    boto3.DEFAULT_SESSION.events.register(
+        'provide-client-params.s3.ListObjectsV2',
+        lambda params, context, **kwargs: listing_regions.append((params['Bucket'], context['client_region'])))
+
+    shard_definitions = shards.ShardState(DESTINATION_BUCKET, 'state/').split(
+        {'Bucket': 'test-source-eu', 'Prefix': 'data/'}, 2)
+
+    assert shard_definitions == [{'Prefixes': ['data/a/']}]
+    assert listing_regions == [('test-source-eu', 'eu-west-1')]
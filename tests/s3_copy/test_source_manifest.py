@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+import logic
+import source_manifest
+from copy_support import (SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, list_keys, read_object,
+                          archive_members)
+
+OBJECTS = {f"data/d{i % 3}/f{i:02d}.txt": f"object {i}".encode('utf-8') * (i + 1) for i in range(12)}
+MANIFEST = {'Bucket': SOURCE_BUCKET, 'Key': 'keys.txt'}
+
+
+def relative_objects():
+    return {key[len('data/'):]: body for key, body in OBJECTS.items()}
+
+
+def put_sources(s3, listed_keys):
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    put_objects(s3, SOURCE_BUCKET, {'data/unlisted.txt': b'not in manifest',
+                                    'keys.txt': '\n'.join(listed_keys).encode('utf-8')})
+
+
+def test_only_objects_listed_in_manifest_are_copied(s3):
+    put_sources(s3, OBJECTS)
+
+    logic.S3CopyLogic(LambdaContext(), type='sync', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                      dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None,
+                      source_manifest=MANIFEST).copy()
+
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + key for key in relative_objects())
+
+
+def test_objects_listed_but_missing_in_source_are_skipped(s3):
+    put_sources(s3, list(OBJECTS) + ['data/deleted.txt'])
+
+    logic.S3CopyLogic(LambdaContext(), type='sync', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                      dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None,
+                      source_manifest=MANIFEST).copy()
+
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + key for key in relative_objects())
+
+
+@pytest.mark.parametrize('key', ['bundle.zip', 'bundle.tar.gz'])
+def test_objects_listed_in_manifest_are_packed_into_archive(s3, key):
+    put_sources(s3, OBJECTS)
+
+    logic.S3CopyLogic(LambdaContext(), type='pack', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                      dst={'Bucket': DESTINATION_BUCKET, 'Key': key}, canned_acl=None,
+                      source_manifest=MANIFEST).copy()
+
+    assert archive_members(key, read_object(s3, DESTINATION_BUCKET, key)) == relative_objects()
+
+
+def test_parquet_manifest_is_rejected_before_copy_without_pyarrow(monkeypatch):
+    monkeypatch.setattr(source_manifest, 'parquet', None)
+
+    with pytest.raises(Exception, match='pyarrow package must be installed'):
+        logic.S3CopyLogic(LambdaContext(), type='sync', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                          dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None,
+                          source_manifest={'Bucket': SOURCE_BUCKET, 'Key': 'inventory/data.parquet'})
+
+
+def test_parquet_inventory_is_rejected_before_copy_without_pyarrow(s3, monkeypatch):
+    monkeypatch.setattr(source_manifest, 'parquet', None)
+    put_objects(s3, SOURCE_BUCKET, OBJECTS)
+    inventory = {'sourceBucket': SOURCE_BUCKET, 'fileFormat': 'Parquet', 'fileSchema': 'Bucket, Key, Size',
+                 'files': [{'key': 'inventory/data/1.parquet'}, {'key': 'inventory/data/2.parquet'}]}
+    put_objects(s3, SOURCE_BUCKET, {'inventory/manifest.json': json.dumps(inventory).encode('utf-8')})
+
+    with pytest.raises(Exception, match='pyarrow package must be installed'):
+        logic.S3CopyLogic(LambdaContext(), type='sync', src={'Bucket': SOURCE_BUCKET, 'Prefix': 'data/'},
+                          dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None,
+                          source_manifest={'Bucket': SOURCE_BUCKET, 'Key': 'inventory/manifest.json'}).copy()
+    assert list_keys(s3, DESTINATION_BUCKET) == []
@@ -0,0 +1,82 @@
+import io
+import tarfile
+
+import pytest
+
+import logic
+import tar_stream
+from copy_support import SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, list_keys, read_object
+
+FILES = {f"d{i % 3}/f{i:02d}.txt": f"file {i}".encode('utf-8') * (i + 1) for i in range(12)}
+
+
+def tar_archive(mode, files=FILES):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        directory = tarfile.TarInfo('d')
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+        link = tarfile.TarInfo('link')
+        link.type = tarfile.SYMTYPE
+        link.linkname = 'd0/f00.txt'
+        archive.addfile(link)
+        for name, body in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(body)
+            archive.addfile(info, io.BytesIO(body))
+    return buffer.getvalue()
+
+
+def untar(key, copy_type='object-tar', **opts):
+    logic.S3CopyLogic(LambdaContext(), type=copy_type, src={'Bucket': SOURCE_BUCKET, 'Key': key},
+                      dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None, **opts).copy()
+
+
+@pytest.mark.parametrize('mode,key', [('w', 'site.tar'), ('w:gz', 'site.tar.gz'), ('w:gz', 'site.tgz')])
+def test_tar_archive_is_unpacked(s3, mode, key):
+    put_objects(s3, SOURCE_BUCKET, {key: tar_archive(mode)})
+
+    untar(key)
+
+    # directories and links are skipped
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + name for name in FILES)
+    for name, body in FILES.items():
+        assert read_object(s3, DESTINATION_BUCKET, 'out/' + name) == body
+
+
+def test_archive_type_is_detected_from_content(s3):
+    put_objects(s3, SOURCE_BUCKET, {'upload/blob': tar_archive('w:gz')})
+
+    untar('upload/blob', copy_type='object', archive_type='auto')
+
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + name for name in FILES)
+
+
+def test_members_outside_archive_root_are_skipped(s3):
+    put_objects(s3, SOURCE_BUCKET, {'site.tar': tar_archive('w', dict(FILES, **{'../escaped.txt': b'outside'}))})
+
+    untar('site.tar')
+
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + name for name in FILES)
+    assert list_keys(s3, SOURCE_BUCKET) == ['site.tar']
+
+
+def test_tar_zst_is_rejected_before_copy_without_zstandard(s3, monkeypatch):
+    monkeypatch.setattr(tar_stream, 'zstandard', None)
+
+    with pytest.raises(Exception, match='zstandard package must be installed'):
+        logic.S3CopyLogic(LambdaContext(), type='object-tar',
+                          src={'Bucket': SOURCE_BUCKET, 'Key': 'upload/data.tar.zst'},
+                          dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out/'}, canned_acl=None)
+
+
+def test_sniffed_zstd_object_is_not_copied_as_is_without_zstandard(s3, monkeypatch):
+    monkeypatch.setattr(tar_stream, 'zstandard', None)
+    put_objects(s3, SOURCE_BUCKET, {'upload/blob': tar_stream.ZSTD_MAGIC + bytes(1024)})
+    copy = logic.S3CopyLogic(LambdaContext(), type='object', src={'Bucket': SOURCE_BUCKET, 'Key': 'upload/blob'},
+                             dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out/'}, canned_acl=None,
+                             archive_type=tar_stream.ARCHIVE_AUTO)
+
+    with pytest.raises(Exception, match='zstandard package must be installed'):
+        copy.copy()
+    assert list_keys(s3, DESTINATION_BUCKET) == []
@@ -0,0 +1,52 @@
+import zipfile
+
+import pytest
+
+import logic
+from copy_support import (SOURCE_BUCKET, DESTINATION_BUCKET, LambdaContext, put_objects, list_keys, read_object,
+                          zip_archive)
+
+MEMBERS = {f"d{i % 3}/f{i:02d}.txt": f"member {i}".encode('utf-8') * (i + 1) for i in range(12)}
+
+
+def unzip(copy_mode, key='site.zip'):
+    logic.S3CopyLogic(LambdaContext(), type='object-zip', src={'Bucket': SOURCE_BUCKET, 'Key': key},
+                      dst={'Bucket': DESTINATION_BUCKET, 'Prefix': 'out'}, canned_acl=None,
+                      copy_mode=copy_mode).copy()
+
+
+@pytest.mark.parametrize('copy_mode', ['download', 'stream', 'auto'])
+def test_zip_archive_is_unpacked(s3, copy_mode):
+    put_objects(s3, SOURCE_BUCKET, {'site.zip': zip_archive(dict(MEMBERS, **{'d/': b''}))})
+
+    unzip(copy_mode)
+
+    assert list_keys(s3, DESTINATION_BUCKET) == sorted('out/' + name for name in MEMBERS)
+    for name, body in MEMBERS.items():
+        assert read_object(s3, DESTINATION_BUCKET, 'out/' + name) == body
+
+
+def test_stored_members_are_streamed(s3):
+    put_objects(s3, SOURCE_BUCKET, {'site.zip': zip_archive(MEMBERS, zipfile.ZIP_STORED)})
+
+    unzip('stream')
+
+    for name, body in MEMBERS.items():
+        assert read_object(s3, DESTINATION_BUCKET, 'out/' + name) == body
+
+
+def test_streaming_does_not_use_tmp(s3, monkeypatch):
+    put_objects(s3, SOURCE_BUCKET, {'site.zip': zip_archive(MEMBERS)})
+    monkeypatch.setattr(logic.S3CopyLogic, 'download_object',
+                        lambda self: pytest.fail('archive was downloaded to /tmp'))
+
+    unzip('stream')
+
+    assert len(list_keys(s3, DESTINATION_BUCKET)) == len(MEMBERS)
+
+
+def test_unsupported_compression_fails_streaming(s3):
+    put_objects(s3, SOURCE_BUCKET, {'site.zip': zip_archive(MEMBERS, zipfile.ZIP_BZIP2)})
+
+    with pytest.raises(Exception, match='not supported in streaming mode'):
+        unzip('stream')